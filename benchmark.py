@@ -0,0 +1,235 @@
+#
+# Benchmarks
+#
+# Seeded, repeatable timings of the utilsmath kernels, the boat physics, localization, planning and full headless
+# races. Results can be saved as a JSON baseline and later runs compared against it; a case that got slower than
+# the baseline by more than the threshold is flagged as a regression (and the exit status is 1):
+#
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json --threshold 0.2
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import sys
+import json
+import time
+import random
+import timeit
+import platform
+import argparse
+
+import numpy as np
+import sim_config
+import utilsmath
+import environment
+import course_geometry
+import sailboat_control
+import headless
+
+
+class case:
+
+    # --------
+    # init:
+    #   a benchmark case
+    #       name: name of the case in the results
+    #       setup: function(rng) returning the state passed to run
+    #       run: function(state) timed
+    #       number: calls of run per timing
+    #       repeat: timings; the fastest one is reported
+    #       operations: operations per call of run (results are reported per operation)
+    #
+    def __init__(self, name, setup, run, number=1, repeat=3, operations=1):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.number = number
+        self.repeat = repeat
+        self.operations = operations
+
+    # ------
+    # time:
+    #   return seconds per operation
+    #
+    def time(self, seed):
+        state = self.setup(random.Random(seed))
+        best = min(timeit.repeat(lambda: self.run(state), number=self.number, repeat=self.repeat))
+        return best / (self.number * self.operations)
+
+
+nr_of_samples = 10000
+
+
+def random_angles(rng):
+    return [rng.uniform(-10*pi, 10*pi) for i in range(nr_of_samples)]
+
+
+def run_normalize_angle(angles):
+    for angle in angles:
+        utilsmath.normalize_angle(angle)
+
+
+def random_vector_pairs(rng):
+    return [((rng.uniform(0, 100), utilsmath.random_angle(rng)), (rng.uniform(0, 100), utilsmath.random_angle(rng)))
+            for i in range(nr_of_samples)]
+
+
+def run_add_vectors_polar(pairs):
+    for v1, v2 in pairs:
+        utilsmath.add_vectors_polar(v1, v2)
+
+
+def random_segments(rng):
+    return [tuple((rng.uniform(0, 100), utilsmath.random_angle(rng)) for j in range(4)) for i in range(nr_of_samples)]
+
+
+def run_intersect(segments):
+    for l1, v1, l2, v2 in segments:
+        utilsmath.intersect(l1, v1, l2, v2)
+
+
+# an environment with one boat agent that has localized and planned once
+def race_start(rng):
+    env = environment.environment(rng)
+    boat_agent = sailboat_control.sailboat_control(env)
+    env.update([boat_agent.boat_action()])
+    boat_agent.localize()
+    return env, boat_agent
+
+
+def run_sailboat_update(state):
+    env, boat_agent = state
+    boat = env.boats[boat_agent.boat_id]
+    for i in range(1000):
+        boat.update(env)
+
+
+def run_kalman(state):
+    env, boat_agent = state
+    for i in range(1000):
+        boat_agent.kalman()
+
+
+# a full plan: without legs of a previous plan to reuse
+def run_plan(state):
+    env, boat_agent = state
+    boat_agent.legs, boat_agent.corners = [], []
+    boat_agent.plan()
+
+
+# the plan made at the start and the agent that has moved on from it since
+def replan_start(rng):
+    env, boat_agent = race_start(rng)
+    return boat_agent, boat_agent.legs, boat_agent.corners
+
+
+# an incremental replan after the boat moved (see sailboat_control.plan)
+def run_replan(state):
+    boat_agent, legs, corners = state
+    boat_agent.legs, boat_agent.corners = legs, corners
+    boat_agent.plan()
+
+
+def run_random_course(rng):
+    course_geometry.random_course(rng, 10000)
+
+
+def race(nr_of_boats):
+    return case('race_{0}'.format(nr_of_boats), lambda rng: rng.randint(0, 2**31),
+                lambda seed: headless.run(300, nr_of_boats, seed), repeat=3 if nr_of_boats < 1000 else 1)
+
+
+cases = [case('normalize_angle', random_angles, run_normalize_angle, number=10, operations=nr_of_samples),
+         case('add_vectors_polar', random_vector_pairs, run_add_vectors_polar, number=10, operations=nr_of_samples),
+         case('intersect', random_segments, run_intersect, number=10, operations=nr_of_samples),
+         case('true_sailboat.update', race_start, run_sailboat_update, number=10, operations=1000),
+         case('sailboat_control.kalman', race_start, run_kalman, number=10, operations=1000),
+         case('sailboat_control.plan', race_start, run_plan, number=20),
+         case('sailboat_control.replan', replan_start, run_replan, number=20),
+         case('random_course_10000', lambda rng: rng, run_random_course, number=10),
+         race(1),
+         race(100),
+         race(1000)]
+
+
+# run:
+#   time the cases with the given names (all if None) and return the results as a dictionary
+#
+def run(names=None, seed=1):
+    results = {'seed': seed,
+               'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'machine': platform.platform(),
+               'cases': {}}
+    for benchmark in cases:
+        if names is None or benchmark.name in names:
+            results['cases'][benchmark.name] = {'seconds': benchmark.time(seed)}
+    return results
+
+
+# compare:
+#   compare results with a baseline
+#   return a list of (name, baseline seconds, seconds, relative change, regressed) for the cases in both
+#       threshold: relative slowdown beyond which a case counts as regressed (0.2 is 20% slower)
+#
+def compare(results, baseline, threshold):
+    comparison = []
+    for name in [benchmark.name for benchmark in cases]:
+        if name in results['cases'] and name in baseline['cases']:
+            before = baseline['cases'][name]['seconds']
+            after = results['cases'][name]['seconds']
+            change = after / before - 1.0
+            comparison.append((name, before, after, change, change > threshold))
+    return comparison
+
+
+def format_seconds(seconds):
+    for unit, scale in [('s', 1.0), ('ms', 1e-3), ('us', 1e-6)]:
+        if seconds >= scale:
+            return '{0:8.3f} {1}'.format(seconds / scale, unit)
+    return '{0:8.3f} ns'.format(seconds / 1e-9)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmarks')
+    parser.add_argument('cases', nargs='*', help='Names of the cases to run (default: all)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed of the cases')
+    parser.add_argument('--quick', action='store_true', help='Skip the 1000 boat race')
+    parser.add_argument('--save', help='Save the results as a baseline to this JSON file')
+    parser.add_argument('--compare', help='Compare the results with the baseline in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression (default 0.2, i.e. 20%%)')
+    args = parser.parse_args()
+
+    sim_config.print_boat_data = False
+    names = args.cases or [benchmark.name for benchmark in cases]
+    if args.quick:
+        names = [name for name in names if name != 'race_1000']
+    for name in names:
+        if name not in [benchmark.name for benchmark in cases]:
+            parser.error('unknown case: {0}'.format(name))
+
+    results = run(names, args.seed)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if not args.compare:
+        for name in names:
+            print '  {0:<26} {1} per op'.format(name, format_seconds(results['cases'][name]['seconds']))
+        sys.exit(0)
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for name, before, after, change, regressed in compare(results, baseline, args.threshold):
+        print '  {0:<26} {1} -> {2} per op  {3:+7.1%}{4}'.format(name, format_seconds(before), format_seconds(after),
+                                                                  change, '  REGRESSION' if regressed else '')
+        regressions += regressed
+    print
+    print '{0} regression(s) beyond {1:.0%}'.format(regressions, args.threshold)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,154 @@
+#
+# Checkpoints
+#
+# A checkpoint is a snapshot of the complete state of a race (see headless.race): the environment with its wind,
+# course and fleet, every true_sailboat, every sailboat_control with its Kalman filter, tack plan and indices, the
+# replanning scheduler, the results so far and the state of every random number generator, including the global
+# one. Restoring a checkpoint returns a new race that continues bit-identically to the race it was taken from, and
+# a checkpoint can be restored any number of times, so many branches can be forked from one simulated prefix:
+#
+#   prefix = headless.race(nr_of_boats=10, seed=123)
+#   for i in range(250):
+#       prefix.step()
+#   fork = checkpoint.checkpoint(prefix)
+#   branch = fork.restore()      # change a controller on branch, then
+#   headless.run(resume=branch)
+#
+# Parts of the state that don't change during a race (the course, the gate index and the wind field grid) are
+# shared between the race and its checkpoints rather than copied. Checkpoints can be saved to disk and loaded
+# in another process. sim_config isn't part of a checkpoint: continue with the settings the race ran with.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import copy
+import random
+import cPickle as pickle
+
+
+# shared:
+#   a deepcopy memo that maps the parts of the state that never change during a race to themselves
+#   (and the global random module, which can't be copied, to itself; its state is saved separately)
+def shared(state):
+    env = state.env
+    memo = {id(random): random, id(env.course): env.course}
+    if env.gates is not None:
+        memo[id(env.gates)] = env.gates
+    if env.wind_field is not None:
+        memo[id(env.wind_field.grid)] = env.wind_field.grid
+    return memo
+
+
+class checkpoint:
+
+    # --------
+    # init:
+    #   snapshot state
+    #       state: a race (see headless.race), or any object graph that keeps its environment in state.env
+    #
+    def __init__(self, state):
+        self.random_state = random.getstate()
+        self.state = copy.deepcopy(state, shared(state))
+
+    # --------
+    # restore:
+    #   restore the global random number generator and return a new copy of the state, ready to continue
+    #
+    def restore(self):
+        random.setstate(self.random_state)
+        return copy.deepcopy(self.state, shared(self.state))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = persistent_id
+            pickler.dump(self)
+
+
+# the global random module is saved by name; its state is part of the checkpoint
+def persistent_id(obj):
+    if obj is random:
+        return 'random'
+    return None
+
+
+def persistent_load(pid):
+    if pid == 'random':
+        return random
+    raise pickle.UnpicklingError('unknown persistent id: {0}'.format(pid))
+
+
+# load:
+#   load a checkpoint saved with checkpoint.save
+#
+def load(path):
+    with open(path, 'rb') as f:
+        unpickler = pickle.Unpickler(f)
+        unpickler.persistent_load = persistent_load
+        return unpickler.load()
+
+
+# if checkpoint.py is run as a script, check that races restored from checkpoints continue bit-identically
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import timeit
+    import sim_config
+    import headless
+
+    def fingerprint(current):
+        env = current.env
+        return (current.as_dict(), env.current_wind, env.goal_wind, env.rng.getstate(), random.getstate(),
+                env.fleet.point[:env.fleet.size].tolist(), env.fleet.heading[:env.fleet.size].tolist(),
+                [(boat_agent.believed_point, boat_agent.believed_heading, boat_agent.tacking,
+                  boat_agent.kalman_filter.x, boat_agent.kalman_filter.P, boat_agent.igor_target_tack)
+                 for boat_agent in current.boat_agents])
+
+    sim_config.print_boat_data = False
+    steps = 300
+    fork_step = 120
+    passed = True
+    print "Testing races continued from checkpoints at step {0} of {1}".format(fork_step, steps)
+    for seed, replan_budget, batch_localization in [(1, 0, False), (2, 2, False), (3, 0, True), (None, 2, True)]:
+        sim_config.replan_budget = replan_budget
+        sim_config.batch_localization = batch_localization
+        random.seed(10)
+        expected = headless.race(5, seed)
+        while expected.i < steps:
+            expected.step()
+        expected = fingerprint(expected)
+
+        random.seed(10)
+        prefix = headless.race(5, seed)
+        while prefix.i < fork_step:
+            prefix.step()
+        fork = checkpoint(prefix)
+        path = tempfile.mktemp()
+        fork.save(path)
+        branches = [prefix, fork.restore(), fork.restore(), load(path).restore()]
+        identical = 0
+        for branch in branches:
+            fork.restore()  # every branch starts from the checkpoint's global random state
+            while branch.i < steps:
+                branch.step()
+            identical += fingerprint(branch) == expected
+        print "  seed {0}, replan budget {1}, batch localization {2}: {3} of {4} branches identical, {5:.0f} kB".format(
+            seed, replan_budget, batch_localization, identical, len(branches), os.path.getsize(path) / 1024.0)
+        os.remove(path)
+        passed = passed and identical == len(branches)
+    sim_config.replan_budget = 0
+    sim_config.batch_localization = False
+    print
+
+    print "Benchmark (100 boats at step {0})".format(fork_step)
+    prefix = headless.race(100, 1)
+    while prefix.i < fork_step:
+        prefix.step()
+    fork = checkpoint(prefix)
+    for name, run in [('checkpoint', lambda: checkpoint(prefix)), ('restore', fork.restore)]:
+        seconds = min(timeit.repeat(run, number=10, repeat=3)) / 10
+        print "  {0:<11} {1:.3f} ms".format(name, seconds * 1000)
+    print "  simulating the prefix: {0:.3f} ms".format(
+        min(timeit.repeat(lambda: headless.run(fork_step, 100, 1), number=1, repeat=3)) * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"
@@ -0,0 +1,137 @@
+#
+# Coordinate Frames
+#
+# The internal representation of points (boat locations, marks, way points, tack points) and vectors.
+# polar_frame keeps everything as (radius, angle), like the rest of the project always did.
+# cartesian_frame keeps (x, y), so the hot paths skip the polar -> cartesian -> polar round trips.
+# Both frames offer the same operations; code that works on points goes through the active frame and
+# converts to polar (location) only at the edges: plotting, reporting, sensors.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+import utilsmath
+
+
+class polar_frame:
+
+    cartesian = False
+
+    # conversions between polar locations, internal points and cartesian coordinates
+    def point(self, location):
+        return location
+
+    def location(self, point):
+        return point
+
+    def to_cartesian(self, point):
+        return utilsmath.polar_to_cartesian(point)
+
+    def from_cartesian(self, c):
+        return utilsmath.cartesian_to_polar(c)
+
+    # array versions for (n,2) arrays of points
+    def points_to_cartesian(self, points):
+        points = np.asarray(points, dtype=float)
+        return np.column_stack((points[:, 0]*np.cos(points[:, 1]), points[:, 0]*np.sin(points[:, 1])))
+
+    def points_from_cartesian(self, c):
+        c = np.asarray(c, dtype=float)
+        return np.column_stack((np.hypot(c[:, 0], c[:, 1]), np.arctan2(c[:, 1], c[:, 0])))
+
+    # vectors
+    def vector(self, length, angle):
+        return length, angle
+
+    def length(self, v):
+        return v[0]
+
+    def angle(self, v):
+        return v[1]
+
+    def add(self, point, v):
+        return utilsmath.add_vectors_polar(point, v)
+
+    def sub(self, point1, point2):
+        return utilsmath.sub_vectors_polar(point1, point2)
+
+    def distance(self, point1, point2):
+        return utilsmath.distance_polar(point1, point2)
+
+
+class cartesian_frame:
+
+    cartesian = True
+
+    # conversions between polar locations, internal points and cartesian coordinates
+    def point(self, location):
+        return utilsmath.polar_to_cartesian(location)
+
+    def location(self, point):
+        return utilsmath.cartesian_to_polar(point)
+
+    def to_cartesian(self, point):
+        return point
+
+    def from_cartesian(self, c):
+        return c[0], c[1]
+
+    # array versions for (n,2) arrays of points
+    def points_to_cartesian(self, points):
+        return points
+
+    def points_from_cartesian(self, c):
+        return c
+
+    # vectors
+    def vector(self, length, angle):
+        return length*cos(angle), length*sin(angle)
+
+    def length(self, v):
+        return hypot(v[0], v[1])
+
+    def angle(self, v):
+        return atan2(v[1], v[0])
+
+    def add(self, point, v):
+        return point[0] + v[0], point[1] + v[1]
+
+    def sub(self, point1, point2):
+        return point1[0] - point2[0], point1[1] - point2[1]
+
+    def distance(self, point1, point2):
+        return hypot(point1[0] - point2[0], point1[1] - point2[1])
+
+
+# frame:
+#   the frame selected by sim_config.cartesian_state
+def frame():
+    if sim_config.cartesian_state:
+        return cartesian_frame()
+    return polar_frame()
+
+
+# if coordinates.py is run as a script, time the full headless simulation loop in both frames
+if __name__ == '__main__':
+    import time
+    import headless
+
+    sim_config.print_boat_data = False
+    steps = 300
+    print "Benchmark: {0} step headless run per frame (best of 3)".format(steps)
+    for nr_of_boats in [1, 10, 50]:
+        times = {}
+        for cartesian in [False, True]:
+            sim_config.cartesian_state = cartesian
+            best = None
+            for repeat in range(3):
+                start = time.time()
+                results = headless.run(steps, nr_of_boats, seed=1)
+                per_step = (time.time() - start) / results['steps']
+                best = per_step if best is None else min(best, per_step)
+            times[cartesian] = best
+        print "  {0:3d} boats: polar {1:.3f} ms/step, cartesian {2:.3f} ms/step ({3:.0%} saved)".format(
+            nr_of_boats, times[False] * 1000, times[True] * 1000, 1 - times[True] / times[False])
@@ -0,0 +1,240 @@
+#
+# Course Geometry
+#
+# Provides course_geometry: the marks of a course and their crossings in compact arrays (one entry per mark and
+# one per crossing) instead of one object per mark, and random_course, which builds a semi random course with any
+# number of marks. The random draws, the cartesian geometry and the crossing bisectors of all marks are computed
+# in batches; only the placement of the intermediate marks, where each mark depends on the one before, is a
+# scalar loop. A 10,000 mark course is built in about 10 ms.
+# Code that looks at a single mark indexes the course like a list: course[i] is a course_mark view of mark i,
+# created on first use.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+import utilsmath
+
+
+class course_mark:
+    def __init__(self, radius, angle, to_port):
+        self.radius = radius
+        self.angle = angle
+        self.to_port = to_port
+        self.crossings = []  # polar vectors from the mark, 0 length means an infinite ray
+
+        # cached geometry, see course_geometry.cache
+        self.point = None  # location in the environment's coordinate frame
+        self.position = None  # cartesian location
+        self.crossing_vectors = []  # cartesian crossing vectors (unit length for rays)
+
+
+class course_geometry:
+
+    # --------
+    # init:
+    #   creates the course
+    #       radius, angle: polar location of every mark
+    #       to_port: True for the marks left to port
+    #       crossing_mark: mark index of every crossing, in the order the crossings are passed
+    #       crossing_length, crossing_angle: polar vector of every crossing from its mark, 0 length means an
+    #                                        infinite ray
+    #
+    def __init__(self, radius, angle, to_port, crossing_mark, crossing_length, crossing_angle):
+        self.radius = np.asarray(radius, dtype=float)
+        self.angle = np.asarray(angle, dtype=float)
+        self.to_port = np.asarray(to_port, dtype=bool)
+        self.crossing_mark = np.asarray(crossing_mark, dtype=int)
+        self.crossing_length = np.asarray(crossing_length, dtype=float)
+        self.crossing_angle = np.asarray(crossing_angle, dtype=float)
+        # the crossings of mark i are crossing_offset[i]:crossing_offset[i+1]
+        self.crossing_offset = np.searchsorted(self.crossing_mark, np.arange(len(self.radius) + 1))
+
+        self.position = utilsmath.polar_to_cartesian_array(np.column_stack((self.radius, self.angle)))
+        self.crossing_vector = utilsmath.polar_to_cartesian_array(np.column_stack(
+            (np.where(self.crossing_length != 0, self.crossing_length, 1.0), self.crossing_angle)))
+        self.frame = None
+        self.marks = [None] * len(self.radius)
+
+    # ------
+    # cache:
+    #   keep the mark points in frame (the environment's coordinate frame)
+    #
+    def cache(self, frame):
+        self.frame = frame
+        self.marks = [None] * len(self.radius)
+
+    def __len__(self):
+        return len(self.radius)
+
+    def __iter__(self):
+        for i in range(len(self.radius)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        mark = self.marks[i]
+        if mark is None:
+            mark = course_mark(float(self.radius[i]), float(self.angle[i]), bool(self.to_port[i]))
+            crossings = slice(self.crossing_offset[i], self.crossing_offset[i + 1])
+            mark.crossings = zip(self.crossing_length[crossings].tolist(), self.crossing_angle[crossings].tolist())
+            if self.frame is not None:
+                mark.point = self.frame.point((mark.radius, mark.angle))
+            mark.position = tuple(self.position[i].tolist())
+            mark.crossing_vectors = [tuple(vector) for vector in self.crossing_vector[crossings].tolist()]
+            self.marks[i] = mark
+        return mark
+
+    # nr_of_crossings:
+    #   number of crossings of mark i (0 for the start marks and the last finish mark)
+    def nr_of_crossings(self, i):
+        return int(self.crossing_offset[i + 1] - self.crossing_offset[i])
+
+
+# --------------
+# random_course:
+#   a semi random course: a start gate ~10 units wide at course_range from the center, nr_of_marks intermediate
+#   marks alternately left to starboard and port, and a finish gate on the opposite side
+#       rng: random number generator (e.g. environment.rng)
+#
+def random_course(rng, nr_of_marks=sim_config.num_course_marks, course_range=sim_config.course_range):
+    # start and finish gates
+    start_angle = utilsmath.random_angle(rng)
+    start2_angle = utilsmath.normalize_angle(start_angle + atan2(10.0, course_range))
+    end_angle = utilsmath.normalize_angle(start_angle + pi)
+    end2_angle = utilsmath.normalize_angle(end_angle + atan2(10.0, course_range))
+    gate_radius = 0.98 * course_range
+
+    # the draws for all intermediate marks, in the order they were drawn one mark at a time:
+    # distance factor (uniform 0.8 - 1.5) and angle factor of each mark
+    draws = np.array([rng.random() for i in range(2 * nr_of_marks)])
+    distance_factors = (0.8 + (1.5 - 0.8) * draws[0::2]).tolist()
+    flips = np.where(np.arange(nr_of_marks) % 2 == 0, 1, -1)
+    angle_offsets = (draws[1::2] * flips * utilsmath.rad(45)).tolist()
+
+    # intermediate course marks: each one heads for the finish gate from the one before, spreading the remaining
+    # distance over the remaining marks. This is sub_vectors_polar and add_vectors_polar written out.
+    end_x = gate_radius * cos(end2_angle)
+    end_y = gate_radius * sin(end2_angle)
+    normalize_angle = utilsmath.normalize_angle
+    radius = [gate_radius, gate_radius]
+    angle = [start_angle, start2_angle]
+    prev_radius, prev_angle = gate_radius, start_angle
+    for count in range(nr_of_marks):
+        remaining_marks = nr_of_marks - count + 1
+        prev_x = prev_radius * cos(prev_angle)
+        prev_y = prev_radius * sin(prev_angle)
+        dist_to_end = hypot(end_x - prev_x, end_y - prev_y)
+        angle_to_end = atan2(end_y - prev_y, end_x - prev_x)
+        dist_btwn = distance_factors[count] * dist_to_end / remaining_marks
+        angle_btwn = normalize_angle(angle_offsets[count] + angle_to_end)
+        x = prev_x + dist_btwn * cos(angle_btwn)
+        y = prev_y + dist_btwn * sin(angle_btwn)
+        prev_radius = hypot(x, y)
+        prev_angle = atan2(y, x)
+        radius.append(prev_radius)
+        angle.append(prev_angle)
+
+    # end with correct port/starboard
+    radius.extend([gate_radius, gate_radius])
+    to_port = np.zeros(nr_of_marks + 4, dtype=bool)
+    to_port[0] = True
+    to_port[3:-2:2] = True
+    if nr_of_marks % 2 == 1:
+        angle.extend([end2_angle, end_angle])
+        to_port[-2] = True
+    else:
+        angle.extend([end_angle, end2_angle])
+        to_port[-1] = True
+
+    # crossings of marks 2 .. n-2 (the finish gate is the second crossing of mark n-2):
+    # cross through the bisector of this_prev and this_next going ccw/cw if the mark is port/starboard (an infinite
+    # ray), then through this_next (within the length from this to next)
+    marks = np.column_stack((radius, angle))
+    this = np.arange(2, len(marks) - 1)
+    this_prev = utilsmath.sub_vectors_polar_array(marks[this - 1], marks[this])
+    this_next = utilsmath.sub_vectors_polar_array(marks[this + 1], marks[this])
+    turn = this_next[:, 1] - this_prev[:, 1]
+    turn = np.where(to_port[this], utilsmath.cw_array(turn), utilsmath.ccw_array(turn))
+    bisector = utilsmath.normalize_angle_array(turn / 2.0 + this_prev[:, 1])
+
+    crossing_mark = np.repeat(this, 2)
+    crossing_length = np.column_stack((np.zeros(len(this)), this_next[:, 0])).ravel()
+    crossing_angle = np.column_stack((bisector, this_next[:, 1])).ravel()
+    return course_geometry(radius, angle, to_port, crossing_mark, crossing_length, crossing_angle)
+
+
+# if course_geometry.py is run as a script, compare random_course with building the course one mark at a time
+# and time large courses
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    # the course as environment built it, one course_mark at a time
+    def scalar_course(rng, nr_of_marks, course_range):
+        start_angle = utilsmath.random_angle(rng)
+        start2_angle = utilsmath.normalize_angle(start_angle + atan2(10.0, course_range))
+        course = [course_mark(0.98 * course_range, start_angle, True),
+                  course_mark(0.98 * course_range, start2_angle, False)]
+        end_angle = utilsmath.normalize_angle(start_angle + pi)
+        end2_angle = utilsmath.normalize_angle(end_angle + atan2(10.0, course_range))
+        end_starboard_mark = course_mark(0.98 * course_range, end_angle, False)
+        end_port_mark = course_mark(0.98 * course_range, end2_angle, True)
+        end_port_loc = [end_port_mark.radius, end_port_mark.angle]
+        prev_mark_loc = [course[0].radius, course[0].angle]
+        angle_flip = 1
+        for count in range(nr_of_marks):
+            remaining_marks = nr_of_marks - count + 1
+            dist_to_end, angle_to_end = utilsmath.sub_vectors_polar(end_port_loc, prev_mark_loc)
+            dist_btwn = rng.uniform(0.8, 1.5) * dist_to_end / remaining_marks
+            angle_btwn = utilsmath.normalize_angle(rng.random() * angle_flip * utilsmath.rad(45) + angle_to_end)
+            mark_loc = utilsmath.add_vectors_polar(prev_mark_loc, [dist_btwn, angle_btwn])
+            course.append(course_mark(mark_loc[0], mark_loc[1], angle_flip == -1))
+            prev_mark_loc = mark_loc
+            angle_flip *= -1
+        course.extend([end_port_mark, end_starboard_mark] if angle_flip == -1 else [end_starboard_mark, end_port_mark])
+
+        for i in range(2, len(course) - 1):
+            prev_mark, this_mark, next_mark = course[i-1], course[i], course[i+1]
+            this_prev = utilsmath.sub_vectors_polar([prev_mark.radius, prev_mark.angle],
+                                                    [this_mark.radius, this_mark.angle])
+            this_next = utilsmath.sub_vectors_polar([next_mark.radius, next_mark.angle],
+                                                    [this_mark.radius, this_mark.angle])
+            if this_mark.to_port:
+                angle = utilsmath.cw(this_next[1] - this_prev[1])
+            else:
+                angle = utilsmath.ccw(this_next[1] - this_prev[1])
+            this_mark.crossings = [(0, utilsmath.normalize_angle(angle/2.0 + this_prev[1])), this_next]
+        return course
+
+    print "Testing random_course against the one mark at a time course"
+    passed = True
+    for nr_of_marks in [0, 1, 2, 5, 6, 100]:
+        identical = 0
+        for seed in range(20):
+            rng = random.Random(seed)
+            course = random_course(rng, nr_of_marks)
+            after = rng.random()
+            rng = random.Random(seed)
+            expected = scalar_course(rng, nr_of_marks, sim_config.course_range)
+            same = len(course) == len(expected) and after == rng.random()
+            for mark, expected_mark in zip(course, expected):
+                same = same and (mark.radius, mark.angle, mark.to_port, mark.crossings) == \
+                    (expected_mark.radius, expected_mark.angle, expected_mark.to_port,
+                     [tuple(crossing) for crossing in expected_mark.crossings])
+            identical += same
+        print "  {0:3} marks: {1} of 20 courses bit-identical".format(nr_of_marks, identical)
+        passed = passed and identical == 20
+    print
+
+    print "Benchmark (building a course)"
+    for nr_of_marks in [5, 1000, 10000]:
+        rng = random.Random(1)
+        seconds = min(timeit.repeat(lambda: random_course(rng, nr_of_marks), number=10, repeat=3)) / 10
+        reference = min(timeit.repeat(lambda: scalar_course(rng, nr_of_marks, sim_config.course_range),
+                                      number=1, repeat=3))
+        print "  {0:6} marks: {1:8.3f} ms (one mark at a time {2:8.3f} ms)".format(nr_of_marks, seconds * 1000,
+                                                                                   reference * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"
@@ -0,0 +1,242 @@
+#
+# Gate Crossings
+#
+# Provides a gate_index: a uniform grid over all gates of a course (the crossing rays and segments of every mark)
+# that finds every gate a boat's step crosses, in either direction, by testing only the gates in the grid cells
+# the step passes through. Each crossing is reported as a crossing_event with the interpolated time of the crossing.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+import utilsmath
+
+
+class crossing_event:
+    def __init__(self, mark_index, crossing_index, direction, t):
+        self.mark_index = mark_index
+        self.crossing_index = crossing_index
+        self.direction = direction  # 1 when crossed in the direction of the course, -1 when crossed backwards
+        self.t = t  # fraction of the step at which the gate was crossed, in [0, 1]
+
+    def __repr__(self):
+        return 'crossing_event({0}, {1}, {2}, {3:.3f})'.format(self.mark_index, self.crossing_index, self.direction,
+                                                               self.t)
+
+
+inf = float('inf')
+
+
+# segment_cells:
+#   the grid cells (ix, iy) the segment from (x0, y0) to (x1, y1) passes through, in order
+#   (a grid traversal; at exact cell corners both neighbouring cells are included)
+def segment_cells(x0, y0, x1, y1, cell_size):
+    ix, iy = int(floor(x0 / cell_size)), int(floor(y0 / cell_size))
+    end_ix, end_iy = int(floor(x1 / cell_size)), int(floor(y1 / cell_size))
+    cells = [(ix, iy)]
+    if (ix, iy) == (end_ix, end_iy):
+        return cells
+
+    dx = x1 - x0
+    dy = y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    t_max_x = ((ix + (step_x > 0)) * cell_size - x0) / dx if dx != 0 else inf
+    t_max_y = ((iy + (step_y > 0)) * cell_size - y0) / dy if dy != 0 else inf
+    t_delta_x = cell_size / abs(dx) if dx != 0 else inf
+    t_delta_y = cell_size / abs(dy) if dy != 0 else inf
+
+    while (ix, iy) != (end_ix, end_iy) and min(t_max_x, t_max_y) <= 1.0:
+        if t_max_x == t_max_y:
+            cells.append((ix + step_x, iy))
+            cells.append((ix, iy + step_y))
+            ix += step_x
+            iy += step_y
+            t_max_x += t_delta_x
+            t_max_y += t_delta_y
+        elif t_max_x < t_max_y:
+            ix += step_x
+            t_max_x += t_delta_x
+        else:
+            iy += step_y
+            t_max_y += t_delta_y
+        cells.append((ix, iy))
+    return cells
+
+
+class gate_index:
+
+    # --------
+    # init:
+    #   index every crossing of every course mark
+    #       course: course_geometry.course_geometry
+    #       cell_size: size of the grid cells
+    #       ray_length: crossing rays (infinite in principle) are cut off at this length
+    #
+    def __init__(self, course, cell_size=sim_config.gate_cell_size,
+                 ray_length=sim_config.gate_ray_length_ratio * sim_config.course_range):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+
+        rays = course.crossing_length == 0
+        self.mark_indices = course.crossing_mark.tolist()
+        self.crossing_indices = (np.arange(len(course.crossing_mark)) -
+                                 course.crossing_offset[course.crossing_mark]).tolist()
+        self.starts = course.position[course.crossing_mark].reshape(-1, 2)
+        self.vectors = np.where(rays[:, np.newaxis], course.crossing_vector * ray_length,
+                                course.crossing_vector).reshape(-1, 2)
+        self.forward = self.__forward_directions(course, rays)
+
+        for gate, (start, vector) in enumerate(zip(self.starts.tolist(), self.vectors.tolist())):
+            for cell in segment_cells(start[0], start[1], start[0] + vector[0], start[1] + vector[1], self.cell_size):
+                self.cells.setdefault(cell, []).append(gate)
+
+    # the side of each gate the course continues to: follow the gates in order through the points the planner
+    # aims for (mark_buffer_distance along a ray, the middle of a segment) and note the side of the next point
+    def __forward_directions(self, course, rays):
+        if len(self.starts) == 0:
+            return np.ones(0)
+        directions = self.vectors / np.hypot(self.vectors[:, 0], self.vectors[:, 1])[:, np.newaxis]
+        offsets = np.where(rays, sim_config.mark_buffer_distance, course.crossing_length / 2.0)
+        aims = self.starts + directions * offsets[:, np.newaxis]
+
+        # before the first and after the last gate, extend the path through the aims by one more step
+        if len(aims) > 1:
+            before = np.vstack((aims[:1] - (aims[1:2] - aims[:1]), aims[:-1]))
+            after = np.vstack((aims[1:], aims[-1:] + (aims[-1:] - aims[-2:-1])))
+        else:
+            before = after = aims
+        travel = after - before
+        return np.where(self.vectors[:, 0] * travel[:, 1] - self.vectors[:, 1] * travel[:, 0] >= 0, 1.0, -1.0)
+
+    # ------
+    # query:
+    #   all gates crossed by the step from p0 to p1 (cartesian), as crossing_events ordered by time
+    #
+    def query(self, p0, p1):
+        return self.query_fleet([p0], [p1])[0]
+
+    # ------------
+    # query_fleet:
+    #   query for many steps at once; prev and cur are (n,2) cartesian arrays or lists of points
+    #   return one list of crossing_events per step
+    #
+    def query_fleet(self, prev, cur):
+        prev = np.asarray(prev, dtype=float).reshape(-1, 2)
+        cur = np.asarray(cur, dtype=float).reshape(-1, 2)
+
+        # candidate (step, gate) pairs from the cells every step passes through
+        pair_steps = []
+        pair_gates = []
+        for step, (p0, p1) in enumerate(zip(prev, cur)):
+            candidates = set()
+            for cell in segment_cells(p0[0], p0[1], p1[0], p1[1], self.cell_size):
+                candidates.update(self.cells.get(cell, ()))
+            pair_steps.extend([step] * len(candidates))
+            pair_gates.extend(candidates)
+
+        events = [[] for step in range(len(prev))]
+        if not pair_steps:
+            return events
+
+        # exact segment intersection tests for all candidate pairs at once
+        pair_steps = np.array(pair_steps)
+        pair_gates = np.array(pair_gates)
+        p = prev[pair_steps]
+        r = cur[pair_steps] - p
+        q = self.starts[pair_gates]
+        s = self.vectors[pair_gates]
+        denom = r[:, 0]*s[:, 1] - r[:, 1]*s[:, 0]
+        qp = q - p
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (qp[:, 0]*s[:, 1] - qp[:, 1]*s[:, 0]) / denom
+            u = (qp[:, 0]*r[:, 1] - qp[:, 1]*r[:, 0]) / denom
+        hits = np.nonzero((denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1))[0]
+
+        for hit in hits[np.argsort(t[hits], kind='mergesort')]:
+            gate = pair_gates[hit]
+            # crossing the gate towards the forward side has the opposite sign of s x r
+            direction = 1 if -np.sign(denom[hit]) == self.forward[gate] else -1
+            events[pair_steps[hit]].append(crossing_event(self.mark_indices[gate], self.crossing_indices[gate],
+                                                          direction, float(t[hit])))
+        return events
+
+
+# advance_mark_state:
+#   apply crossing events (in time order) to mark_state
+#   crossing the next crossing forward advances the mark state, crossing the last passed crossing backwards
+#   undoes it (the boat has to cross it again); other events are ignored
+#   return the t of the last event that changed mark_state, or None
+#       course: course_geometry.course_geometry
+#
+def advance_mark_state(mark_state, events, course):
+    changed = None
+    for event in events:
+        current = (mark_state.index, mark_state.crossing_index)
+        if event.direction == 1 and (event.mark_index, event.crossing_index) == current:
+            mark_state.crossing_index += 1
+            if mark_state.crossing_index >= course.nr_of_crossings(mark_state.index):
+                mark_state.index += 1
+                mark_state.crossing_index = 0
+            changed = event.t
+        elif event.direction == -1 and (event.mark_index, event.crossing_index) == previous_crossing(mark_state,
+                                                                                                        course):
+            mark_state.index, mark_state.crossing_index = event.mark_index, event.crossing_index
+            changed = event.t
+    return changed
+
+
+# the (mark index, crossing index) crossed last before reaching mark_state, or None at the start
+def previous_crossing(mark_state, course):
+    if mark_state.crossing_index > 0:
+        return mark_state.index, mark_state.crossing_index - 1
+    index = mark_state.index - 1
+    while index >= 0 and course.nr_of_crossings(index) == 0:
+        index -= 1
+    if index < 0:
+        return None
+    return index, course.nr_of_crossings(index) - 1
+
+
+# if crossings.py is run as a script, compare gate_index against environment.update_mark_state on random races
+if __name__ == '__main__':
+    import random
+    import environment
+    import sailboat_control
+
+    sim_config.print_boat_data = False
+    nr_of_races = 40
+    agree = 0
+    reverse_steps = 0
+    for seed in range(nr_of_races):
+        env = environment.environment(random.Random(seed))
+        agent = sailboat_control.sailboat_control(env)
+        boat = env.boats[0]
+        expected = environment.mark_state(boat.mark_state.index, boat.mark_state.crossing_index)
+        actual = environment.mark_state(boat.mark_state.index, boat.mark_state.crossing_index)
+        for i in range(sim_config.max_nr_of_steps):
+            if env.course_complete(expected) or env.course_complete(actual):
+                break
+            controls = agent.boat_action()
+            prev_point = boat.point
+            env.update([controls])
+            env.change_wind(i)
+            while env.update_mark_state(prev_point, boat.point, expected):
+                if env.course_complete(expected):
+                    break
+            events = env.crossing_events([prev_point], [boat.point])[0]
+            if any(event.direction == -1 for event in events):
+                reverse_steps += 1
+            advance_mark_state(actual, events, env.course)
+        if (expected.index, expected.crossing_index) == (actual.index, actual.crossing_index):
+            agree += 1
+        else:
+            print "  seed {0}: update_mark_state {1}, gate_index {2}".format(
+                seed, (expected.index, expected.crossing_index), (actual.index, actual.crossing_index))
+
+    print "Testing gate_index against update_mark_state"
+    print "  {0} of {1} races agree ({2} steps with reverse crossings)".format(agree, nr_of_races, reverse_steps)
+    print
+    print "PASSED!" if agree == nr_of_races else "FAILED!"
@@ -0,0 +1,144 @@
+#
+# Decision Phase
+#
+# The agents' part of a step: every agent localizes, plans if it has to and chooses its controls (boat_action),
+# before the environment moves the boats. With sim_config.decision_workers > 1 the agents decide concurrently on a
+# pool of worker threads, in two phases with a barrier before the physics:
+#   sense:  every agent takes its measurements, one after the other in boat order. The measurement noise is drawn
+#           from the environment's random number generator, in the same sequence as in a serial step (decide
+#           draws nothing).
+#   decide: the agents localize on their measurements, plan and choose their controls on the worker threads. The
+#           environment doesn't change until env.update, so they all see the same snapshot of it, and the shared
+#           tack solver is frozen (see tack_solver.freeze). The controls are returned in boat order once every
+#           agent is done, so a step doesn't depend on the order the agents finish in.
+# Agent state is only touched by the agent's own thread. The threads share the interpreter, so pure Python
+# planning doesn't run in parallel, but NumPy heavy work (e.g. the particle localizer, see localizer.py) does.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import multiprocessing.pool
+import sim_config
+import tack_solver
+import timing
+
+
+class decision_phase:
+
+    # --------
+    # init:
+    #   creates the decision phase
+    #       workers: number of worker threads; 1 runs boat_action of one agent after the other on this thread
+    #
+    def __init__(self, workers=sim_config.decision_workers):
+        self.workers = workers
+        self.pool = None  # started on first use
+
+    # the worker threads aren't part of the state (see checkpoint.py); a restored phase starts its own
+    def __getstate__(self):
+        return {'workers': self.workers}
+
+    def __setstate__(self, state):
+        self.__init__(state['workers'])
+
+    # ----
+    # run:
+    #   return the controls of boat_agents, in their order
+    #       localize: False if the agents have already been localized this step (see sailboat_control.localize_fleet)
+    #
+    def run(self, boat_agents, localize=True):
+        if self.workers <= 1:
+            return [act(boat_agent, localize) for boat_agent in boat_agents]
+
+        t = timing.start()
+        for boat_agent in boat_agents:
+            boat_agent.sense(localize)
+        timing.stop('sense', t)
+
+        if self.pool is None:
+            self.pool = multiprocessing.pool.ThreadPool(self.workers)
+        solver = tack_solver.default_solver()
+        solver.freeze()
+        try:
+            return self.pool.map(decide if localize else act, boat_agents)
+        finally:
+            solver.thaw()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+# the work of one agent in the decision phase: boat_action, or decide after sense
+def act(boat_agent, localize=False):
+    t = timing.start()
+    controls = boat_agent.boat_action(localize)
+    timing.stop('boat_action', t, boat_agent.boat_id)
+    return controls
+
+
+def decide(boat_agent):
+    t = timing.start()
+    controls = boat_agent.decide()
+    timing.stop('boat_action', t, boat_agent.boat_id)
+    return controls
+
+
+# if decisions.py is run as a script, check that concurrent decisions give the serial results and time them
+if __name__ == '__main__':
+    import timeit
+    import headless
+
+    sim_config.print_boat_data = False
+    passed = True
+    # runs the agents in reverse order, like workers that finish in the opposite order
+    class reversed_pool:
+        def map(self, func, items):
+            return list(reversed([func(item) for item in reversed(items)]))
+
+        def close(self):
+            pass
+
+        def join(self):
+            pass
+
+    print "Testing races with concurrent decisions against serial ones"
+    cases = [('kalman', False, 5, None), ('kalman', True, 5, None), ('particle', False, 5, None),
+             ('kalman', False, 30, 'puffs')]
+    for localizer, batch_localization, marks, wind_field in cases:
+        sim_config.localizer = localizer
+        sim_config.batch_localization = batch_localization
+        sim_config.num_course_marks = marks
+        sim_config.wind_field = wind_field
+        results = []
+        for workers, pool in [(1, None), (4, None), (8, None), (2, reversed_pool())]:
+            sim_config.decision_workers = workers
+            tack_solver.solver = None  # every run starts with an empty tack solver
+            race = headless.race(8, 3)
+            race.decisions.pool = pool
+            results.append(headless.run(300, resume=race)['boats'])
+        same = results[1] == results[2] == results[3]
+        print "  {0:<8} batch {1:<5} {2:2} marks, wind field {3:<5}: repeatable {4}, same as serial {5}".format(
+            localizer, str(batch_localization), marks, str(wind_field), same, results[0] == results[1])
+        passed = passed and same and results[0] == results[1]
+    sim_config.localizer = 'kalman'
+    sim_config.batch_localization = False
+    sim_config.num_course_marks = 5
+    sim_config.wind_field = None
+    print
+
+    print "Benchmark (one step of 200 boats with the particle localizer)"
+    sim_config.localizer = 'particle'
+    for workers in [1, 2, 4]:
+        sim_config.decision_workers = workers
+        race = headless.race(200, 1)
+        race.step()
+        seconds = min(timeit.repeat(race.step, number=5, repeat=3)) / 5
+        race.decisions.close()
+        print "  {0} workers: {1:.3f} ms".format(workers, seconds * 1000)
+    sim_config.localizer = 'kalman'
+    sim_config.decision_workers = 1
+    print
+    print "PASSED!" if passed else "FAILED!"
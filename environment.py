@@ -2,7 +2,8 @@
 # Sailboat Environment
 # 
 # Provides a world environment to simulate sailing.
-# Uses polar coordinates
+# Uses polar coordinates at its interface; points are kept internally in the frame selected in sim_config
+# (see coordinates.py)
 # Angle is standardized in radians in the range [-pi, pi]
 #
 # Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
@@ -11,11 +12,17 @@
 # standard libs
 from math import *
 import random
+import numpy as np
 
 # project libs
 import utilsmath
 import true_sailboat
-import plot
+import fleet
+import coordinates
+import crossings
+import course_geometry
+import windfield
+import interactions
 import sim_config
 import argparse
 
@@ -25,28 +32,36 @@ class mark_state:
         self.crossing_index = crossing_index
 
 
-class course_mark:
-    def __init__(self, radius, angle, to_port):
-        self.radius = radius
-        self.angle = angle
-        self.to_port = to_port
-        self.crossings = []
-
-
 class environment:
 
     # --------
     # init: 
     #   creates the environment
+    #       rng: random number generator (e.g. random.Random(seed)) used for the course, wind and measurement
+    #            noise of this environment and its boats. Defaults to the global random module.
+    #       scenario: a scenario.scenario that provides the prevailing wind, the course and the wind field instead of
+    #                 generating them (see scenario.py)
     #
-    def __init__(self):
+    def __init__(self, rng=None, scenario=None):
+        self.rng = rng if rng is not None else random
+        self.frame = coordinates.frame()
 
         self.start_heading = 0.0
-        self.course = []
+        self.course = None  # course_geometry.course_geometry
+
+        # wind and course settings: the scenario's, else sim_config's (see scenario.settings)
+        config = scenario.config if scenario is not None else {}
+        self.wind_speed_sigma = config.get('wind_speed_sigma', sim_config.wind_speed_sigma)
+        self.wind_direction_sigma = config.get('wind_direction_sigma', sim_config.wind_direction_sigma)
+        self.wind_change_rate = config.get('wind_change_rate', sim_config.wind_change_rate)
+        self.course_range = config.get('course_range', sim_config.course_range)
 
         # Set wind variables
-        if sim_config.wind_prevailing is None:
-            self.wind_prevailing = (random.uniform(sim_config.wind_min, sim_config.wind_max), utilsmath.random_angle())
+        if scenario is not None:
+            self.wind_prevailing = scenario.wind_prevailing
+        elif sim_config.wind_prevailing is None:
+            self.wind_prevailing = (self.rng.uniform(sim_config.wind_min, sim_config.wind_max),
+                                    utilsmath.random_angle(self.rng))
         else:
             self.wind_prevailing = sim_config.wind_prevailing
         self.current_wind = self.wind_prevailing  # (speed, direction)
@@ -55,86 +70,59 @@ class environment:
         self.goal_wind = (0, 0)  # new wind, used only for reporting and troubleshooting
 
         # create a semi random course
-        self.__create_random_course()
-        self.__calculate_mark_crossings()
-
-        self.boats = []  # True boats
-
-
-    def __create_random_course(self):
-        # create start gate ~10 units wide
-
-        start_angle = utilsmath.random_angle()
-
-        start2_angle = utilsmath.normalize_angle(start_angle + atan2(10.0, sim_config.course_range))
-        self.start_heading = utilsmath.normalize_angle(start_angle + pi)
-        self.course = []
-        self.course.append(course_mark(0.98 * sim_config.course_range, start_angle, True))
-        self.course.append(course_mark(0.98 * sim_config.course_range, start2_angle, False))
-
-        end_angle = utilsmath.normalize_angle(start_angle + pi)
-        end2_angle = utilsmath.normalize_angle(end_angle + atan2(10.0, sim_config.course_range))
-        end_starboard_mark = course_mark(0.98 * sim_config.course_range, end_angle, False)
-        end_port_mark = course_mark(0.98 * sim_config.course_range, end2_angle, True)
-        end_port_loc = [end_port_mark.radius, end_port_mark.angle]
-
-        # intermediate course markers
-        prev_mark_loc = [self.course[0].radius, self.course[0].angle]
-        angle_flip = 1
-        for count in range(sim_config.num_course_marks):
-
-            # calculate control variables based on how many marks we have left
-            remaining_marks = sim_config.num_course_marks - count + 1
-            dist_to_end, angle_to_end = utilsmath.sub_vectors_polar(end_port_loc, prev_mark_loc)
-            dist_btwn = random.uniform(0.8, 1.5) * dist_to_end / remaining_marks
-            angle_btwn = utilsmath.normalize_angle(random.random() * angle_flip * utilsmath.rad(45) + angle_to_end)
-
-            mark_loc = utilsmath.add_vectors_polar(prev_mark_loc, [dist_btwn, angle_btwn])
-            self.course.append(course_mark(mark_loc[0], mark_loc[1], angle_flip==-1))
-
-            prev_mark_loc = mark_loc
-            angle_flip *= -1
-
-        # end with correct port/starboard
-        if angle_flip==-1:
-            self.course.append(end_port_mark)
-            self.course.append(end_starboard_mark)
+        if scenario is not None:
+            self.course = scenario.course_geometry()
+            self.start_heading = scenario.start_heading
         else:
-            self.course.append(end_starboard_mark)
-            self.course.append(end_port_mark)
-
-    def __calculate_mark_crossings(self):
-        for i in range(2, len(self.course)-1):
-            prev_mark = self.course[i-1]
-            this_mark = self.course[i]
-            next_mark = self.course[i+1]
-
-            # cross through bisector of this_prev and this_next going ccw/cw if this_mark is port/starboard
-            this_prev = utilsmath.sub_vectors_polar([prev_mark.radius, prev_mark.angle],
-                                                            [this_mark.radius, this_mark.angle])
-            this_next = utilsmath.sub_vectors_polar([next_mark.radius, next_mark.angle],
-                                                            [this_mark.radius, this_mark.angle])
-            if this_mark.to_port:
-                angle = utilsmath.cw(this_next[1] - this_prev[1])
-            else:
-                angle = utilsmath.ccw(this_next[1] - this_prev[1])
-
-            # 0 length for first crossing means any distance acceptable
-            # cross through this_next (within the length from this to next)
-            this_mark.crossings = [(0, utilsmath.normalize_angle(angle/2.0 + this_prev[1])), this_next]
-
+            self.course = course_geometry.random_course(self.rng, sim_config.num_course_marks, self.course_range)
+            self.start_heading = utilsmath.normalize_angle(self.course[0].angle + pi)
+        self.cache_course_geometry()
+        self.gates = None  # crossings.gate_index, built on first use
+
+        # local wind (see windfield.py); None means current_wind blows everywhere
+        self.wind_field = None
+        if scenario is not None:
+            self.wind_field = scenario.new_wind_field()
+        elif sim_config.wind_field == 'puffs':
+            # the field's settings as they are now, not when windfield was imported
+            self.wind_field = windfield.wind_field.puffs(
+                self.rng, 2 * self.course_range, sim_config.wind_field_cell_size, sim_config.wind_puffs,
+                sim_config.wind_puff_sigma, sim_config.wind_puff_radius)
+        elif sim_config.wind_field is not None:
+            self.wind_field = windfield.wind_field.load(sim_config.wind_field)
+        if self.wind_field is not None:
+            self.wind_field.update(0, self.current_wind)
+
+        self.boats = []  # True boats, views into self.fleet
+        self.fleet = fleet.fleet(rng=self.rng, frame=self.frame)
+
+        # wind shadow and collisions between boats (see interactions.py); None means the boats are independent
+        self.interactions = interactions.boat_interactions() if sim_config.boat_interactions else None
+
+    # ---------------------
+    # cache_course_geometry:
+    #   keep the marks' locations in the environment's frame (their cartesian locations and crossing vectors are
+    #   part of the course_geometry), so crossing tests don't convert them every step. Call again after changing
+    #   the course.
+    #
+    def cache_course_geometry(self):
+        self.course.cache(self.frame)
+        self.gates = None
 
     # ------------
     # create_boat:
     #   create a true world representation of boat at the start
-    #   give enough space if this is an additional boat
+    #   with boat interactions, every boat gets its own place on the start grid
     #   return id (index) of boat
     #
     def create_boat(self):
-        mid_start_angle = utilsmath.normalize_angle((self.course[0].angle + self.course[1].angle) / 2)
-        start_dist = self.course[0].radius
+        if self.interactions is not None:
+            location = interactions.start_grid_location(self.course, self.start_heading, len(self.boats))
+        else:
+            mid_start_angle = utilsmath.normalize_angle((self.course[0].angle + self.course[1].angle) / 2)
+            location = (self.course[0].radius, mid_start_angle)
         initial_mark_state = mark_state(2, 0)
-        boat = true_sailboat.true_sailboat((start_dist, mid_start_angle), initial_mark_state, self.start_heading)
+        boat = true_sailboat.true_sailboat(location, initial_mark_state, self.start_heading, fleet=self.fleet)
         self.boats.append(boat)
         if sim_config.print_boat_data:
             print 'initializing boat', len(self.boats)-1, boat.location, 'heading', boat.heading
@@ -146,62 +134,89 @@ class environment:
     def wind(self):
         return self.current_wind
 
+    # wind_at:
+    #   return wind speed and direction at point (in the environment's frame)
+    def wind_at(self, point):
+        if self.wind_field is None:
+            return self.current_wind
+        return self.wind_field.sample_one(self.frame.to_cartesian(point))
+
+    # winds:
+    #   return wind speeds and directions at points (an (n,2) array in the environment's frame) as two arrays
+    def winds(self, points):
+        if self.wind_field is None:
+            n = len(points)
+            return np.repeat(float(self.current_wind[0]), n), np.repeat(float(self.current_wind[1]), n)
+        return self.wind_field.sample(self.frame.points_to_cartesian(points))
+
     # change_wind
     #   change wind speed and direction
     def change_wind(self, i):
-        # Set new wind speed and direction every sim_config.wind_change_rate number of steps
-        if i % sim_config.wind_change_rate == 0:
-            new_wind_speed = self.wind_prevailing[0] + random.gauss(0, sim_config.wind_speed_sigma)
-            new_wind_direction = self.wind_prevailing[1] + random.gauss(0, sim_config.wind_direction_sigma)
+        # Set new wind speed and direction every wind_change_rate number of steps
+        if i % self.wind_change_rate == 0:
+            new_wind_speed = self.wind_prevailing[0] + self.rng.gauss(0, self.wind_speed_sigma)
+            new_wind_direction = self.wind_prevailing[1] + self.rng.gauss(0, self.wind_direction_sigma)
             self.goal_wind = (new_wind_speed, new_wind_direction)
-            self.wind_speed_change = (new_wind_speed - self.current_wind[0]) / sim_config.wind_change_rate
-            self.wind_direction_change = (new_wind_direction - self.current_wind[1]) / sim_config.wind_change_rate
+            self.wind_speed_change = (new_wind_speed - self.current_wind[0]) / self.wind_change_rate
+            self.wind_direction_change = (new_wind_direction - self.current_wind[1]) / self.wind_change_rate
 
         # Change the wind for the current step little bit towards the new wind speed and direction
         new_wind = (self.current_wind[0] + self.wind_speed_change,
                     utilsmath.normalize_angle(self.current_wind[1] + self.wind_direction_change))
 
         self.current_wind = new_wind
-        pass
+        if self.wind_field is not None:
+            self.wind_field.update(i, self.current_wind)
 
     # update:
     #   update the environment
+    #   all boats are advanced in one batched fleet step (see true_sailboat.update for the per boat version)
+    #   with boat interactions, the boats sail in the wind left by their wind shadows and collisions are resolved
+    #   after the move
     def update(self, controls):
-
-        for boat_id, control, boat in zip(range(len(controls)), controls, self.boats):
-            #self.plotter.true_boat(boat.location)
-            boat.updateControls(control)
-            boat.update(self)
+        self.fleet.update_controls(controls[:len(self.boats)])
+        if self.interactions is not None:
+            points = self.fleet.point[:self.fleet.size]
+            self.fleet.update(self.interactions.shadow(self.frame.points_to_cartesian(points), self.winds(points)))
+            self.interactions.collide(self.fleet)
+        elif self.wind_field is None:
+            self.fleet.update(self.current_wind)
+        else:
+            self.fleet.update(self.winds(self.fleet.point[:self.fleet.size]))
 
     # measure_boom:
     #   return the angle of the boom for specified sailboat_index
     #       sailboat_index: index of sail boat to measure
     def measure_boom(self, sailboat_index):
-        measured_boom = self.boats[sailboat_index].boom + random.gauss(0, sim_config.boom_measure_error)
+        measured_boom = self.boats[sailboat_index].boom + self.rng.gauss(0, sim_config.boom_measure_error)
         return utilsmath.normalize_angle(measured_boom)
     
     # measure_rudder:
     #   return the angle of the rudder for specified sailboat_index
     #       sailboat_index: index of sail boat to measure
     def measure_rudder(self, sailboat_index):
-        measured_rudder = self.boats[sailboat_index].rudder + random.gauss(0, sim_config.rudder_measure_error)
+        measured_rudder = self.boats[sailboat_index].rudder + self.rng.gauss(0, sim_config.rudder_measure_error)
         return utilsmath.normalize_angle(measured_rudder)
 
     # update_mark:
-    #   return the index of the updated mark
+    #   update mark_state if the step from prev_point to cur_point crossed its next crossing
+    #   return True if it did
+    #       prev_point, cur_point: points in the environment's frame
     #
-    def update_mark_state(self, prev_loc, cur_loc, mark_state):
-        if prev_loc == cur_loc:
+    def update_mark_state(self, prev_point, cur_point, mark_state):
+        if prev_point == cur_point:
             return False
 
         # test if I crossed the next crossing
         mark = self.course[mark_state.index]
-        next_crossing = mark.crossings[mark_state.crossing_index]
-        mark_loc = [mark.radius, mark.angle]
-        prev_to_cur = utilsmath.sub_vectors_polar(cur_loc, prev_loc)
+        is_ray = mark.crossings[mark_state.crossing_index][0] == 0
+        crossing_vector = mark.crossing_vectors[mark_state.crossing_index]
+        prev_loc = self.frame.to_cartesian(prev_point)
+        cur_loc = self.frame.to_cartesian(cur_point)
+        prev_to_cur = (cur_loc[0] - prev_loc[0], cur_loc[1] - prev_loc[1])
 
         # test intersection
-        if utilsmath.intersect(prev_loc, prev_to_cur,  mark_loc, next_crossing):
+        if utilsmath.intersect_cartesian(prev_loc, prev_to_cur, mark.position, crossing_vector, False, is_ray):
             # update mark_state
             mark_state.crossing_index += 1
             if mark_state.crossing_index >= len(mark.crossings):
@@ -209,21 +224,38 @@ class environment:
                 mark_state.crossing_index = 0
             return True
 
-        # to be strictly correct we should test if I crossed the prev crossing (in reverse -- I will have to recross)
-        # for now just trust that our system will be stable enough not to cross back over in a way that will
-        # miss the gate
+        # reverse crossings are not detected here; crossing_events and crossings.advance_mark_state handle them
 
         return False
 
+    # crossing_events:
+    #   return, for each boat step from prev_points[i] to cur_points[i], the list of crossings.crossing_event
+    #   of all gates crossed, ordered along the step
+    #       prev_points, cur_points: points in the environment's frame
+    #
+    def crossing_events(self, prev_points, cur_points):
+        if self.gates is None:
+            self.gates = crossings.gate_index(self.course,
+                                              ray_length=sim_config.gate_ray_length_ratio * self.course_range)
+        return self.gates.query_fleet(self.frame.points_to_cartesian(prev_points),
+                                      self.frame.points_to_cartesian(cur_points))
+
+    # course_complete:
+    #   return True if mark_state has rounded every mark that has crossings (i.e. crossed the finish line)
+    def course_complete(self, mark_state):
+        return mark_state.index >= len(self.course) or self.course.nr_of_crossings(mark_state.index) == 0
+
 
     def plot(self, plot_crossings):
+        # import here so that headless runs never load matplotlib
+        import plot
         self.plotter = plot.plot()
         self.plotter.start()
 
         # draw arrow for start direction
         mid_start_angle = utilsmath.normalize_angle((self.course[0].angle + self.course[1].angle) / 2)
         far_dist = self.course[0].radius
-        near_dist = self.course[0].radius - sim_config.course_range / 10.
+        near_dist = self.course[0].radius - self.course_range / 10.
         self.plotter.arrow((far_dist, mid_start_angle), (near_dist, mid_start_angle))
 
         count = 0
@@ -0,0 +1,197 @@
+#
+# Fleet
+#
+# Provides a fleet which keeps the true state of all sailboats in NumPy arrays (struct-of-arrays)
+# and advances every boat in one batched step. true_sailboat objects are per-row views into a fleet.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import random
+import numpy as np
+import sim_config
+import polar
+import coordinates
+import utilsmath
+
+
+class fleet:
+
+    # per boat state, one array (or row of an array) per boat
+    fields = ['point', 'heading', 'boom', 'rudder', 'max_speed_ratio', 'relative_wind_angle', 'speed',
+              'previous_speed', 'boom_control_error', 'rudder_control_error']
+
+    # --------
+    # init:
+    #   creates an empty fleet
+    #       capacity: number of boats to allocate room for; arrays grow as boats are added
+    #       rng: random number generator for control noise. Defaults to the global random module.
+    #       frame: coordinate frame of the points (defaults to the one selected in sim_config, see coordinates.py)
+    #
+    def __init__(self, capacity=16, rng=None, frame=None):
+        self.rng = rng if rng is not None else random
+        self.frame = frame if frame is not None else coordinates.frame()
+        self.size = 0
+        self.capacity = 0
+        self.point = np.zeros((0, 2))  # location per boat, (x, y) or (radius, bearing) depending on the frame
+        for field in self.fields[1:]:
+            setattr(self, field, np.zeros(0))
+        self.__grow(max(capacity, 1))
+
+    def __grow(self, capacity):
+        for field in self.fields:
+            old = getattr(self, field)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:self.size] = old[:self.size]
+            setattr(self, field, new)
+        self.capacity = capacity
+
+    # ---------
+    # add_boat:
+    #   add a boat at location (radius, bearing) to the fleet and return its row index
+    #
+    def add_boat(self, location, heading, max_speed_ratio, boom_control_error, rudder_control_error):
+        if self.size == self.capacity:
+            self.__grow(2 * self.capacity)
+
+        index = self.size
+        self.size += 1
+        self.point[index] = self.frame.point(location)
+        self.heading[index] = heading
+        self.boom[index] = 0.0
+        self.rudder[index] = 0.0
+        self.max_speed_ratio[index] = max_speed_ratio
+        self.relative_wind_angle[index] = 0.0
+        self.speed[index] = 0.0
+        self.previous_speed[index] = 0.0
+        self.boom_control_error[index] = boom_control_error
+        self.rudder_control_error[index] = rudder_control_error
+        return index
+
+    # ----------
+    # update_controls:
+    #   apply desired (boom, rudder) deltas for the first len(controls) boats
+    #   noise is drawn boat by boat, boom before rudder, so the random sequence matches true_sailboat.updateControls
+    #
+    def update_controls(self, controls):
+        n = len(controls)
+        if n == 0:
+            return
+        deltas = np.array(controls, dtype=float).reshape(n, 2)
+        boom_move = deltas[:, 0] != 0
+        rudder_move = deltas[:, 1] != 0
+
+        boom_noise = np.zeros(n)
+        rudder_noise = np.zeros(n)
+        for i in range(n):
+            if boom_move[i]:
+                boom_noise[i] = self.rng.gauss(0, self.boom_control_error[i])
+            if rudder_move[i]:
+                rudder_noise[i] = self.rng.gauss(0, self.rudder_control_error[i])
+
+        boom = self.boom[:n]
+        boom[boom_move] = utilsmath.normalize_angle_array((boom + deltas[:, 0] + boom_noise)[boom_move])
+
+        rudder = self.rudder[:n]
+        new_rudder = utilsmath.normalize_angle_array((rudder + deltas[:, 1] + rudder_noise)[rudder_move])
+        rudder[rudder_move] = np.clip(new_rudder, -sim_config.max_rudder, sim_config.max_rudder)
+
+    # ----------
+    # update:
+    #   advance all boats one step
+    #       wind: (speed, direction); each may be a scalar or an array with one entry per boat
+    #
+    def update(self, wind):
+        n = self.size
+        wind_speed, wind_direction = wind
+
+        heading = self.heading[:n]
+        self.relative_wind_angle[:n] = utilsmath.normalize_angle_array(heading - wind_direction)
+        self.speed[:n] = self.calculate_speed(self.relative_wind_angle[:n], wind_speed)
+        speed = self.speed[:n]
+
+        # Stalled boats rotate away from the wind at the rate proportional to wind strength,
+        # the others turn by the rudder angle
+        stalled = speed <= 0.0
+        rotation = np.where(self.relative_wind_angle[:n] < 0.0, 0.01, -0.01) * wind_speed
+        heading[:] = utilsmath.normalize_angle_array(heading + np.where(stalled, rotation, self.rudder[:n]))
+
+        # Add velocity vector to the boat's location vector to create new location
+        if self.frame.cartesian:
+            self.point[:n, 0] += speed*np.cos(heading)
+            self.point[:n, 1] += speed*np.sin(heading)
+        else:
+            radius = self.point[:n, 0]
+            bearing = self.point[:n, 1]
+            x = radius*np.cos(bearing) + speed*np.cos(heading)
+            y = radius*np.sin(bearing) + speed*np.sin(heading)
+            self.point[:n, 0] = np.hypot(x, y)
+            self.point[:n, 1] = np.arctan2(y, x)
+
+    # --------------
+    # calculate_speed:
+    #   batched version of true_sailboat.calculate_speed (polar table lookup plus momentum clamp)
+    def calculate_speed(self, wind_angle, wind_strength):
+        n = self.size
+        speed = self.max_speed_ratio[:n] * polar.default_table().speed(wind_angle, wind_strength, self.boom[:n])
+
+        # Add momentum. Speed can not decrease or increase more than speed_momentum at the time.
+        previous_speed = self.previous_speed[:n]
+        has_momentum = previous_speed > 1.0
+        clamped = np.clip(speed, previous_speed*(1-sim_config.speed_momentum),
+                          previous_speed*(1+sim_config.speed_momentum))
+        speed = np.where(has_momentum, clamped, speed)
+        previous_speed[:] = speed
+
+        return speed
+
+
+# if fleet.py is run as a script, test the batched step against the per boat true_sailboat step
+if __name__ == '__main__':
+    import true_sailboat
+    import windfield
+
+    # an environment with puffs of local wind
+    class wind_env:
+        current_wind = (15, utilsmath.rad(64. - 180.))
+
+        def __init__(self, frame):
+            self.frame = frame
+            self.wind_field = windfield.wind_field.puffs(random.Random(2))
+            self.wind_field.update(0, self.current_wind)
+
+        def wind_at(self, point):
+            return self.wind_field.sample_one(self.frame.to_cartesian(point))
+
+    random.seed(1)
+    batched = fleet()
+    env = wind_env(batched.frame)
+    batched_boats = []
+    single_boats = []
+    for count in range(50):
+        location = (random.uniform(0, 100), utilsmath.random_angle())
+        heading = utilsmath.random_angle()
+        batched_boats.append(true_sailboat.true_sailboat(location, None, heading, fleet=batched))
+        single_boats.append(true_sailboat.true_sailboat(location, None, heading))
+
+    print "Testing fleet.update against true_sailboat.update"
+    passed = True
+    for step in range(100):
+        controls = [(0.0, random.uniform(-0.3, 0.3)) for boat in single_boats]
+        state = random.getstate()
+        for control, boat in zip(controls, single_boats):
+            boat.updateControls(control)
+            boat.update(env)
+        random.setstate(state)
+        batched.update_controls(controls)
+        batched.update(env.wind_field.sample(batched.frame.points_to_cartesian(batched.point[:batched.size])))
+        env.wind_field.update(step + 1, env.current_wind)
+
+        for single, view in zip(single_boats, batched_boats):
+            for v1, v2 in [(single.location[0], view.location[0]), (single.location[1], view.location[1]),
+                           (single.heading, view.heading), (single.speed, view.speed), (single.rudder, view.rudder)]:
+                if not utilsmath.approx_equal(v1, v2):
+                    passed = False
+
+    print "PASSED!" if passed else "FAILED!"
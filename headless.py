@@ -0,0 +1,313 @@
+#
+# Headless Simulation
+#
+# Runs the simulation without any plotting (matplotlib is never imported) and collects per boat results.
+# Meant for render-less servers and batch runs:
+#
+#   python headless.py --steps 300 --boats 10 --seed 123 --output results.json
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import json
+import random
+import time
+import argparse
+
+import sim_config
+import utilsmath
+import environment
+import sailboat_control
+import localizer
+import decisions
+import crossings
+import recorder
+import timing
+import replanner
+import scenario
+import checkpoint
+
+
+class boat_result:
+
+    # --------
+    # init:
+    #   accumulates the results of one boat during a run
+    #
+    def __init__(self, boat_id):
+        self.boat_id = boat_id
+        self.finish_step = None
+        self.finish_time = None  # interpolated time of crossing the finish line, in steps
+        self.marks_rounded = 0
+        self.cross_track_error_sum = 0.0
+        self.max_cross_track_error = 0.0
+        self.nr_of_samples = 0
+        self.location = None
+        self.collisions = None  # steps the boat collided with another boat, with boat interactions
+
+    def add_cross_track_error(self, cte):
+        self.cross_track_error_sum += abs(cte)
+        self.max_cross_track_error = max(self.max_cross_track_error, abs(cte))
+        self.nr_of_samples += 1
+
+    def as_dict(self):
+        mean_cte = self.cross_track_error_sum / self.nr_of_samples if self.nr_of_samples else 0.0
+        result = {'boat_id': self.boat_id,
+                  'finish_step': self.finish_step,
+                  'finish_time': self.finish_time,
+                  'marks_rounded': self.marks_rounded,
+                  'mean_cross_track_error': mean_cte,
+                  'max_cross_track_error': self.max_cross_track_error,
+                  'location': self.location}
+        if self.collisions is not None:
+            result['collisions'] = self.collisions
+        return result
+
+
+class race:
+
+    # --------
+    # init:
+    #   sets up a headless race: the environment, the boat agents and their results
+    #       nr_of_boats: number of boats (defaults to sim_config.nr_of_boats)
+    #       seed: seed of the race's own random number generator (None uses the global random module)
+    #       scenario: a scenario.scenario to race instead of a new random environment; its number of boats is the
+    #                 default and seed is ignored
+    #
+    def __init__(self, nr_of_boats=None, seed=None, scenario=None):
+        if scenario is not None:
+            self.env = scenario.create_environment()
+            seed = scenario.seed
+        else:
+            self.env = environment.environment(random.Random(seed) if seed is not None else None)
+        if nr_of_boats is None:
+            nr_of_boats = scenario.nr_of_boats if scenario is not None else sim_config.nr_of_boats
+        self.nr_of_boats = nr_of_boats
+        self.seed = seed
+
+        self.fleet_filter = localizer.create_fleet(self.env, nr_of_boats) if sim_config.batch_localization else None
+        self.boat_agents = []
+        for i in range(nr_of_boats):
+            self.boat_agents.append(sailboat_control.sailboat_control(self.env, self.fleet_filter))
+        self.results = [boat_result(boat_agent.boat_id) for boat_agent in self.boat_agents]
+        self.scheduler = replanner.replan_scheduler(sim_config.replan_budget) if sim_config.replan_budget > 0 else None
+        self.decisions = decisions.decision_phase(sim_config.decision_workers)
+        self.trajectories = None  # recorder.trajectory_recorder, if recording
+        self.i = 0  # steps taken
+
+    # the recorder writes to files and isn't part of the race's state (see checkpoint.py)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['trajectories'] = None
+        return state
+
+    # ------
+    # step:
+    #   advance the race by one step
+    #
+    def step(self):
+        env = self.env
+        i = self.i
+        racing = [(boat_agent, result) for boat_agent, result in zip(self.boat_agents, self.results)
+                  if result.finish_step is None]
+        if self.fleet_filter is not None:
+            t = timing.start()
+            sailboat_control.localize_fleet([boat_agent for boat_agent, result in racing], self.fleet_filter)
+            timing.stop('localize_fleet', t)
+
+        if self.scheduler is not None:
+            t = timing.start()
+            self.scheduler.schedule([boat_agent for boat_agent, result in racing], i)
+            timing.stop('schedule', t)
+
+        controls = iter(self.decisions.run([boat_agent for boat_agent, result in racing],
+                                           localize=self.fleet_filter is None))
+        all_boats_controls = [next(controls) if result.finish_step is None else (0.0, 0.0)
+                              for result in self.results]
+
+        if self.trajectories is not None:
+            t = timing.start()
+            self.trajectories.record(env, self.boat_agents, i)
+            timing.stop('record', t)
+
+        prev_points = [env.boats[boat_agent.boat_id].point for boat_agent, result in racing]
+
+        # Update Environment and change wind conditions for the next time step
+        t = timing.start()
+        env.update(all_boats_controls)
+        timing.stop('update', t)
+        t = timing.start()
+        env.change_wind(i)
+        timing.stop('change_wind', t)
+        i += 1
+        self.i = i
+
+        # all gates crossed by all racing boats in this step
+        t = timing.start()
+        cur_points = [env.boats[boat_agent.boat_id].point for boat_agent, result in racing]
+        all_events = env.crossing_events(prev_points, cur_points)
+        timing.stop('crossings', t)
+
+        t = timing.start()
+        for (boat_agent, result), events in zip(racing, all_events):
+            boat = env.boats[boat_agent.boat_id]
+            update_progress(env, boat, events, result, i)
+
+            tack = boat_agent.igor_target_tack
+            result.add_cross_track_error(utilsmath.cross_track_error(env.frame.to_cartesian(boat.point),
+                                                                     env.frame.to_cartesian(boat_agent.tacking[tack - 1]),
+                                                                     env.frame.to_cartesian(boat_agent.tacking[tack])))
+        timing.stop('progress', t)
+
+    def finished(self):
+        return all(result.finish_step is not None for result in self.results)
+
+    # ----------
+    # as_dict:
+    #   the results of the race so far as a dictionary
+    #
+    def as_dict(self):
+        interactions = self.env.interactions
+        for boat_agent, result in zip(self.boat_agents, self.results):
+            result.location = self.env.boats[boat_agent.boat_id].location
+            if interactions is not None:
+                collisions = interactions.collisions
+                result.collisions = int(collisions[boat_agent.boat_id]) if boat_agent.boat_id < len(collisions) else 0
+        return {'steps': self.i,
+                'nr_of_boats': self.nr_of_boats,
+                'seed': self.seed,
+                'boats': [result.as_dict() for result in self.results]}
+
+
+# run:
+#   run one headless simulation and return its results as a dictionary
+#       steps: maximum number of steps (defaults to sim_config.max_nr_of_steps)
+#       nr_of_boats: number of boats (defaults to sim_config.nr_of_boats)
+#       seed: seed of the run's own random number generator (None uses the global random module)
+#       record: directory to record the trajectories to (see recorder.py), None records nothing
+#       scenario: a scenario.scenario to run instead of a new random environment; its number of boats and steps
+#                 are the defaults and seed is ignored
+#       resume: a race to continue (e.g. restored from a checkpoint, see checkpoint.py) instead of a new one
+#
+def run(steps=None, nr_of_boats=None, seed=None, record=None, scenario=None, resume=None):
+    start_time = time.time()
+
+    current = resume if resume is not None else race(nr_of_boats, seed, scenario)
+    if steps is None:
+        steps = scenario.steps if scenario is not None else sim_config.max_nr_of_steps
+    if record is not None:
+        current.trajectories = recorder.trajectory_recorder(current.nr_of_boats, path=record)
+
+    while current.i < steps:
+        current.step()
+        if current.finished():
+            break
+
+    if current.trajectories is not None:
+        current.trajectories.close()
+    current.decisions.close()
+
+    results = current.as_dict()
+    results['elapsed'] = time.time() - start_time
+    return results
+
+
+# track the true mark state of a boat from this step's crossing events: count rounded marks (a mark crossed
+# backwards counts as not rounded again) and record the step and interpolated time the boat finished
+def update_progress(env, boat, events, result, step):
+    mark_index = boat.mark_state.index
+    t = crossings.advance_mark_state(boat.mark_state, events, env.course)
+    if t is not None and env.course_complete(boat.mark_state):
+        result.finish_step = step
+        result.finish_time = step - 1 + t
+    result.marks_rounded += boat.mark_state.index - mark_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the sailboat simulation without plotting')
+    parser.add_argument('--steps', type=int, help='Maximum number of steps (default: sim_config or the scenario)')
+    parser.add_argument('--boats', type=int, help='Number of boats (default: sim_config or the scenario)')
+    parser.add_argument('--seed', type=int, default=123, help='Random seed')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--replan-budget', type=int, default=sim_config.replan_budget,
+                        help='Agents that may replan per step (see replanner.py), 0 plans only once')
+    parser.add_argument('--wind-field', default=sim_config.wind_field,
+                        help="Local wind: 'puffs' or the directory of a saved wind field (see windfield.py)")
+    parser.add_argument('--marks', type=int, default=sim_config.num_course_marks,
+                        help='Number of intermediate course marks (thousands for scaling tests)')
+    parser.add_argument('--range', type=float, default=sim_config.course_range,
+                        help='Distance from the center of the course to the start and finish gates')
+    parser.add_argument('--localizer', choices=sorted(localizer.localizers), default=sim_config.localizer,
+                        help='Localizer of the boat agents (see localizer.py)')
+    parser.add_argument('--batch-localization', action='store_true',
+                        help='Localize all boats in one batched filter step')
+    parser.add_argument('--decision-workers', type=int, default=sim_config.decision_workers,
+                        help='Threads the agents decide on each step (see decisions.py)')
+    parser.add_argument('--tack-optimizer', choices=['independent', 'joint'], default=sim_config.tack_optimizer,
+                        help='Best tack angle on each side or best pair of tack angles (see tack_solver.py)')
+    parser.add_argument('--interactions', action='store_true',
+                        help='Wind shadow and collisions between boats, boats start on a grid (see interactions.py)')
+    parser.add_argument('--scenario', help='Run the scenario saved in this directory (see scenario.py)')
+    parser.add_argument('--save-scenario', help='Save the scenario of this run to this directory')
+    parser.add_argument('--checkpoint', help='Save a checkpoint of the race to this file (see checkpoint.py)')
+    parser.add_argument('--checkpoint-step', type=int, default=0,
+                        help='Step at which --checkpoint is saved (the last step if the race finishes before)')
+    parser.add_argument('--resume', help='Continue the race from the checkpoint saved in this file')
+    parser.add_argument('--record', help='Record the trajectories to this directory (see recorder.py)')
+    parser.add_argument('--timing', action='store_true', help='Print the time spent per phase (see timing.py)')
+    parser.add_argument('--timing-output', help='Write the time spent per phase as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Keep the per boat printing from sim_config')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        sim_config.print_boat_data = False
+    if args.boats is not None:
+        sim_config.nr_of_boats = args.boats
+    if args.steps is not None:
+        sim_config.max_nr_of_steps = args.steps
+    sim_config.replan_budget = args.replan_budget
+    sim_config.wind_field = args.wind_field
+    sim_config.num_course_marks = args.marks
+    sim_config.course_range = args.range
+    sim_config.localizer = args.localizer
+    sim_config.decision_workers = args.decision_workers
+    sim_config.tack_optimizer = args.tack_optimizer
+    sim_config.boat_interactions = sim_config.boat_interactions or args.interactions
+    sim_config.batch_localization = sim_config.batch_localization or args.batch_localization
+    if args.timing or args.timing_output:
+        timing.enable()
+
+    saved_scenario = None
+    if args.scenario:
+        saved_scenario = scenario.load(args.scenario)
+    elif args.save_scenario:
+        saved_scenario = scenario.scenario.generate(args.seed)
+    if args.save_scenario:
+        saved_scenario.save(args.save_scenario)
+
+    resume = None
+    if args.resume:
+        resume = checkpoint.load(args.resume).restore()
+    elif args.checkpoint:
+        resume = race(args.boats, args.seed, saved_scenario)
+        while resume.i < args.checkpoint_step and not resume.finished():
+            resume.step()
+        checkpoint.checkpoint(resume).save(args.checkpoint)
+
+    results = run(args.steps, args.boats, args.seed, args.record, saved_scenario, resume)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print 'Finished {0} steps with {1} boats in {2:.3f}s'.format(results['steps'], results['nr_of_boats'],
+                                                               results['elapsed'])
+    for boat in results['boats']:
+        print '  boat {0}: finish step {1}, marks rounded {2}, mean cte {3:.2f}'.format(
+            boat['boat_id'], boat['finish_step'], boat['marks_rounded'], boat['mean_cross_track_error'])
+
+    if args.timing:
+        timing.print_summary()
+    if args.timing_output:
+        timing.export(args.timing_output)
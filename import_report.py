@@ -0,0 +1,117 @@
+#
+# Import Time Report
+#
+# Reports how long importing an entry point takes, module by module (like python 3's -X importtime), and how long
+# a headless race takes from a cold start to the end of its first step:
+#
+#   python import_report.py headless
+#   python import_report.py environment --top 15
+#   python import_report.py headless --startup
+#
+# Heavy dependencies that only some runs need are imported where they are used (matplotlib in
+# plot.load_matplotlib); the simulation itself doesn't need scipy (see tack_solver.solve). The report
+# flags them when they were loaded.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import __builtin__
+import sys
+import timeit
+import argparse
+
+clock = timeit.default_timer
+heavy_modules = ['scipy', 'matplotlib']
+
+
+class import_timer:
+
+    # --------
+    # init:
+    #   times every import that loads new modules while installed
+    #
+    def __init__(self):
+        self.imports = []  # (name, depth, self seconds, cumulative seconds), in the order the imports finished
+        self.stack = []  # [seconds spent in nested imports] of the imports in progress
+        self.original_import = None
+
+    def install(self):
+        self.original_import = __builtin__.__import__
+        __builtin__.__import__ = self.__import
+
+    def uninstall(self):
+        __builtin__.__import__ = self.original_import
+
+    def __import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        nr_of_modules = len(sys.modules)
+        self.stack.append([0.0])
+        start = clock()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            seconds = clock() - start
+            nested = self.stack.pop()[0]
+            # imports of modules that were already loaded cost (next to) nothing and aren't reported
+            if len(sys.modules) > nr_of_modules:
+                if not name:  # from . import module
+                    name = ', '.join(fromlist)
+                self.imports.append((name, len(self.stack), seconds - nested, seconds))
+                if self.stack:
+                    self.stack[-1][0] += seconds
+
+    # heavy:
+    #   the heavy optional dependencies that are loaded
+    def heavy(self):
+        return [module for module in heavy_modules if module in sys.modules]
+
+
+# time_import:
+#   import module_name with an import_timer installed and return the timer
+def time_import(module_name):
+    timer = import_timer()
+    timer.install()
+    try:
+        __import__(module_name)
+    finally:
+        timer.uninstall()
+    return timer
+
+
+def print_imports(timer, top=None):
+    imports = timer.imports
+    if top is not None:
+        imports = sorted(imports, key=lambda entry: -entry[2])[:top]
+    print '{0:>10} {1:>12}  {2}'.format('self [us]', 'cumulative', 'imported package')
+    for name, depth, self_seconds, seconds in imports:
+        print '{0:>10.0f} {1:>12.0f}  {2}{3}'.format(self_seconds * 1e6, seconds * 1e6, '  ' * depth, name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the import time of a module, per imported module')
+    parser.add_argument('module', nargs='?', default='headless', help='Module to import (default: headless)')
+    parser.add_argument('--top', type=int, help='Only list the imports with the longest self time')
+    parser.add_argument('--startup', action='store_true',
+                        help='Also time a headless race of one boat from import to the end of its first step')
+    args = parser.parse_args()
+
+    start = clock()
+    timer = time_import(args.module)
+    imported = clock() - start
+    print_imports(timer, args.top)
+    print
+    print '{0}: imported in {1:.1f} ms'.format(args.module, imported * 1000)
+
+    if args.startup:
+        import sim_config
+        import headless
+        sim_config.print_boat_data = False
+        race_start = clock()
+        race = headless.race(1, seed=1)
+        created = clock()
+        race.step()
+        stepped = clock()
+        print 'headless race: created in {0:.1f} ms, first step in {1:.1f} ms, {2:.1f} ms from the start'.format(
+            (created - race_start) * 1000, (stepped - created) * 1000, (stepped - start) * 1000)
+
+    heavy = timer.heavy()
+    print 'heavy modules loaded: {0}'.format(', '.join(heavy) if heavy else 'none')
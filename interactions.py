@@ -0,0 +1,252 @@
+#
+# Boat Interactions
+#
+# Interactions between the boats of a fleet: wind shadow (a boat takes part of the wind of the boats downwind of
+# it) and collisions (boats that come too close are pushed apart and lose speed), and a start grid that lines the
+# boats up behind the start gate instead of stacking them on one point. Enabled with sim_config.boat_interactions
+# (see environment.update).
+#
+# Boats only interact with boats nearby, so every step the boats are put in a spatial hash: a grid of cells at
+# least as large as the interaction distance, where boats are sorted by cell. The candidate pairs are the boats in
+# the same or a neighboring cell, found with a search in the sorted cells, and the work per step grows with the
+# number of boats times the number of boats per cell instead of with the number of boats squared.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+import utilsmath
+
+
+class spatial_hash:
+
+    # the cell itself and half of its neighbors: every pair of neighboring cells is visited once
+    neighbors = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+    # --------
+    # init:
+    #   sorts points (an (n,2) array of cartesian points) into square cells of cell_size
+    #
+    def __init__(self, points, cell_size):
+        self.points = points
+        cells = np.floor(points / cell_size).astype(np.int64)
+        if len(cells):
+            cells -= cells.min(axis=0) - 1  # keep an empty cell around the boats, so neighbor keys don't wrap
+            self.stride = int(cells[:, 1].max()) + 2
+        else:
+            self.stride = 1
+        keys = cells[:, 0] * self.stride + cells[:, 1]
+        self.order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    # ------
+    # pairs:
+    #   all pairs of points closer than distance (at most the cell size), each pair once
+    #   return the indices of the first and second point of every pair and the vectors from first to second
+    #
+    def pairs(self, distance):
+        n = len(self.keys)
+        position = np.arange(n)
+        firsts = []
+        seconds = []
+        for dx, dy in self.neighbors:
+            target = self.keys + (dx * self.stride + dy)
+            end = np.searchsorted(self.keys, target, 'right')
+            if dx == 0 and dy == 0:
+                start = position + 1  # the points after this one in its own cell
+            else:
+                start = np.searchsorted(self.keys, target, 'left')
+            counts = np.maximum(end - start, 0)
+            # position of the first point of each pair, and the positions start .. end of its partners
+            firsts.append(np.repeat(position, counts))
+            offsets = np.cumsum(counts) - counts
+            seconds.append(np.arange(counts.sum()) + np.repeat(start - offsets, counts))
+        first = self.order[np.concatenate(firsts)]
+        second = self.order[np.concatenate(seconds)]
+
+        vectors = self.points[second] - self.points[first]
+        close = np.hypot(vectors[:, 0], vectors[:, 1]) < distance
+        return first[close], second[close], vectors[close]
+
+
+class boat_interactions:
+
+    # --------
+    # init:
+    #   creates the interactions of a fleet (see sim_config for the settings)
+    #
+    def __init__(self, shadow_length=sim_config.shadow_length, shadow_width=sim_config.shadow_width,
+                 shadow_penalty=sim_config.shadow_penalty, collision_distance=sim_config.collision_distance,
+                 collision_speed_factor=sim_config.collision_speed_factor):
+        self.shadow_length = shadow_length
+        self.shadow_width = shadow_width
+        self.shadow_penalty = shadow_penalty
+        self.collision_distance = collision_distance
+        self.collision_speed_factor = collision_speed_factor
+        self.wind_factor = np.ones(0)  # share of the wind every boat had in the last step
+        self.collisions = np.zeros(0, dtype=int)  # number of steps every boat collided
+
+    # -------
+    # shadow:
+    #   the wind at the boats after their wind shadows: a boat up to shadow_length downwind of another one (and
+    #   within shadow_width across the wind) loses shadow_penalty of its wind right behind it, less further
+    #   downwind; the shadows of several boats add up
+    #       points: cartesian points of the boats (n,2)
+    #       wind: wind speeds and directions at the boats (two (n,) arrays, see environment.winds)
+    #
+    def shadow(self, points, wind):
+        n = len(points)
+        wind_speed, wind_direction = wind
+        # a shadow reaches up to this far from the boat (at its downwind corners)
+        reach = hypot(self.shadow_length, self.shadow_width / 2.0)
+        first, second, vectors = spatial_hash(points, reach).pairs(reach)
+
+        # every pair both ways: does upwind shadow downwind (in the wind at upwind)?
+        upwind = np.concatenate((first, second))
+        downwind = np.concatenate((second, first))
+        vectors = np.concatenate((vectors, -vectors))
+        c = np.cos(wind_direction[upwind])
+        s = np.sin(wind_direction[upwind])
+        along = vectors[:, 0] * c + vectors[:, 1] * s
+        across = np.abs(vectors[:, 1] * c - vectors[:, 0] * s)
+        shadowed = (along > 0.0) & (along < self.shadow_length) & (across < self.shadow_width / 2.0)
+
+        penalty = self.shadow_penalty * (1.0 - along[shadowed] / self.shadow_length)
+        self.wind_factor = np.exp(np.bincount(downwind[shadowed], np.log1p(-penalty), minlength=n))
+        return wind_speed * self.wind_factor, wind_direction
+
+    # --------
+    # collide:
+    #   push every pair of boats of fleet closer than collision_distance apart (both by half of the overlap) and
+    #   slow them down to collision_speed_factor of their speed. One pass per step: in a crowd a push can cause
+    #   new overlaps, which are resolved in the next steps.
+    #
+    def collide(self, fleet):
+        n = fleet.size
+        if len(self.collisions) < n:
+            self.collisions = np.concatenate((self.collisions, np.zeros(n - len(self.collisions), dtype=int)))
+        points = np.array(fleet.frame.points_to_cartesian(fleet.point[:n]), dtype=float)
+        first, second, vectors = spatial_hash(points, self.collision_distance).pairs(self.collision_distance)
+        if len(first) == 0:
+            return
+
+        distance = np.hypot(vectors[:, 0], vectors[:, 1])
+        apart = distance > 0.0
+        # boats on the same point are pushed apart along the x axis
+        ux = np.where(apart, vectors[:, 0] / np.where(apart, distance, 1.0), 1.0)
+        uy = np.where(apart, vectors[:, 1] / np.where(apart, distance, 1.0), 0.0)
+        push = 0.5 * (self.collision_distance - distance)
+        points[:, 0] += np.bincount(second, push * ux, minlength=n) - np.bincount(first, push * ux, minlength=n)
+        points[:, 1] += np.bincount(second, push * uy, minlength=n) - np.bincount(first, push * uy, minlength=n)
+
+        collided = np.unique(np.concatenate((first, second)))
+        fleet.point[collided] = fleet.frame.points_from_cartesian(points[collided])
+        fleet.speed[collided] *= self.collision_speed_factor
+        fleet.previous_speed[collided] *= self.collision_speed_factor
+        self.collisions[:n] += np.bincount(first, minlength=n) + np.bincount(second, minlength=n) > 0
+
+
+# -------------------
+# start_grid_location:
+#   (radius, bearing) of boat k on the start grid: rows of start_grid_row boats start_grid_spacing apart, the first
+#   row centered on the middle of the start gate, the others behind it
+#       course: the course (a course_geometry.course_geometry)
+#       start_heading: heading of the boats at the start
+#
+def start_grid_location(course, start_heading, k, spacing=sim_config.start_grid_spacing,
+                        row=sim_config.start_grid_row):
+    start1 = utilsmath.polar_to_cartesian((course[0].radius, course[0].angle))
+    start2 = utilsmath.polar_to_cartesian((course[1].radius, course[1].angle))
+    if row is None:
+        row = max(1, int(hypot(start2[0] - start1[0], start2[1] - start1[1]) / spacing))
+    mid_start_angle = utilsmath.normalize_angle((course[0].angle + course[1].angle) / 2)
+    mid = utilsmath.polar_to_cartesian((course[0].radius, mid_start_angle))
+
+    across = ((k % row) - (row - 1) / 2.0) * spacing
+    behind = (k // row) * spacing
+    x = mid[0] - sin(start_heading) * across - cos(start_heading) * behind
+    y = mid[1] + cos(start_heading) * across - sin(start_heading) * behind
+    return utilsmath.cartesian_to_polar((x, y))
+
+
+# if interactions.py is run as a script, compare the neighbor search with all pairs and time it for large fleets
+if __name__ == '__main__':
+    import timeit
+    import fleet
+
+    # all pairs closer than distance, the O(n^2) way
+    def all_pairs(points, distance):
+        vectors = points[np.newaxis, :, :] - points[:, np.newaxis, :]
+        first, second = np.nonzero(np.triu(np.hypot(vectors[..., 0], vectors[..., 1]) < distance, 1))
+        return set(zip(first.tolist(), second.tolist()))
+
+    rng = np.random.RandomState(1)
+    print "Testing spatial_hash.pairs against all pairs"
+    passed = True
+    for n, size, cell_size, distance in [(0, 10.0, 1.0, 1.0), (1, 10.0, 1.0, 1.0), (200, 10.0, 1.0, 1.0),
+                                         (500, 100.0, 10.0, 7.0), (500, 5.0, 10.0, 10.0), (1000, 300.0, 4.0, 4.0)]:
+        points = rng.uniform(-size, size, (n, 2))
+        if n:
+            points[n // 2:n // 2 + 5] = points[0]  # some boats on the same point
+        first, second, vectors = spatial_hash(points, cell_size).pairs(distance)
+        found = set((min(i, j), max(i, j)) for i, j in zip(first.tolist(), second.tolist()))
+        same = found == all_pairs(points, distance) and len(found) == len(first) and \
+            np.allclose(vectors, points[second] - points[first])
+        print "  {0:5} points, {1:6} pairs: {2}".format(n, len(found), same)
+        passed = passed and same
+    print
+
+    print "Testing wind shadow and collisions"
+    interactions = boat_interactions()
+    points = np.array([[0.0, 0.0], [5.0, 0.5], [5.0, 3.0], [-5.0, 0.0], [20.0, 0.0]])
+    wind_speed, wind_direction = interactions.shadow(points, (np.full(5, 10.0), np.zeros(5)))
+    expected = [10.0 * (1 - 0.3 * 0.5), 10.0 * (1 - 0.3 * 0.5), 10.0, 10.0, 10.0]
+    # a boat near the tip of a shadow at an angle to the axes, two shadow lengths of cells away
+    angle = utilsmath.rad(11)
+    tip = np.array([[9.99, 0.0], [20.08, 0.0]])
+    tip_speed = interactions.shadow(tip, (np.full(2, 10.0), np.full(2, angle)))[0]
+    along = 10.09 * cos(angle)
+    shadow_passed = np.allclose(wind_speed, expected) and \
+        np.allclose(tip_speed, [10.0, 10.0 * (1 - 0.3 * (1 - along / interactions.shadow_length))])
+    print "  boats downwind of a boat lose wind, the others keep it: {0}".format(shadow_passed)
+    boats = fleet.fleet()
+    for location in [(10.0, 0.0), (10.3, 0.0), (10.3, 0.0), (50.0, 1.0)]:
+        boats.add_boat(location, 0.0, 1.0, 0.0, 0.0)
+    boats.speed[:] = 2.0
+    for i in range(20):
+        interactions.collide(boats)
+    points = boats.frame.points_to_cartesian(boats.point[:boats.size])
+    vectors = points[np.newaxis, :, :] - points[:, np.newaxis, :]
+    distance = np.hypot(vectors[..., 0], vectors[..., 1])[np.triu_indices(boats.size, 1)]
+    collide_passed = distance.min() > 0.99 * interactions.collision_distance and \
+        interactions.collisions.tolist()[3] == 0 and boats.speed[3] == 2.0 and boats.speed[0] < 2.0
+    print "  colliding boats pushed apart and slowed down, the others untouched: {0}".format(collide_passed)
+    passed = passed and shadow_passed and collide_passed
+    print
+
+    print "Benchmark (wind shadow and collisions of boats 4 units apart on average)"
+    for n in [100, 1000, 10000, 100000]:
+        side = 4.0 * sqrt(n)
+        points = rng.uniform(0, side, (n, 2))
+        wind = (np.full(n, 10.0), np.zeros(n))
+        boats = fleet.fleet(n)
+        for point in points:
+            boats.add_boat(utilsmath.cartesian_to_polar(point), 0.0, 1.0, 0.0, 0.0)
+        interactions = boat_interactions()
+
+        def step():
+            interactions.shadow(points, wind)
+            interactions.collide(boats)
+        seconds = min(timeit.repeat(step, number=3, repeat=3)) / 3
+        if n <= 1000:
+            reference = min(timeit.repeat(lambda: (all_pairs(points, sim_config.shadow_length),
+                                                   all_pairs(points, sim_config.collision_distance)),
+                                          number=1, repeat=3))
+            print "  {0:6} boats: {1:8.3f} ms (all pairs search alone {2:8.3f} ms)".format(n, seconds * 1000,
+                                                                                         reference * 1000)
+        else:
+            print "  {0:6} boats: {1:8.3f} ms".format(n, seconds * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"
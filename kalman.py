@@ -0,0 +1,324 @@
+#
+# Kalman Filter
+#
+# Provides a 4-state constant-velocity Kalman filter (x, y, vx, vy) with position measurements and, optionally,
+# process noise: a random change of velocity of variance q per step (white noise acceleration).
+# F, H, Q and R are constant, so all products are written out in closed form and the 2x2 S is inverted directly.
+# State and covariance live in preallocated lists that are updated in place; no matrices are built per step.
+# fleet_kalman_filter runs the same filter for many agents at once over stacked (N,4) and (N,4,4) arrays.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+
+
+class kalman_filter:
+
+    # --------
+    # init:
+    #   creates the filter
+    #       P: initial 4x4 uncertainty (list of lists)
+    #       R: measurement variance of x and y
+    #       q: process noise, the variance of the change of vx and vy per step
+    #       steady_state: once the gain converges, freeze it and skip the covariance updates. Only a filter with
+    #                     process noise has a steady state gain: without, P and K decay towards zero for good.
+    #       tolerance: largest change of any gain entry between steps that counts as converged
+    #
+    def __init__(self, P=None, R=0.01, q=0.0, steady_state=False, tolerance=1e-6):
+        if steady_state and q <= 0:
+            raise ValueError("A steady state gain needs process noise (q > 0)")
+        if P is None:
+            P = [[0., 0., 0., 0.], [0., 0., 0., 0.], [0., 0., 0.1, 0.], [0., 0., 0., 10.]]
+        self.P = [list(row) for row in P]
+        self.K = [[0., 0.], [0., 0.], [0., 0.], [0., 0.]]
+        self.x = [0., 0., 0., 0.]
+        self.scratch = [[0., 0., 0., 0.], [0., 0., 0., 0.]]
+        self.R = R
+        self.q = q
+        self.steady_state = steady_state
+        self.tolerance = tolerance
+        self.converged = False
+
+    # ----------
+    # step:
+    #   predict from state (x, y, vx, vy) and update with measured position (zx, zy)
+    #   return the new state as a list [x, y, vx, vy] (the filter's own buffer)
+    #
+    def step(self, x, y, vx, vy, zx, zy):
+        # prediction: x = F x
+        x += vx
+        y += vy
+
+        if not self.converged:
+            self.__update_covariance()
+
+        # measurement update: x = x + K (z - H x)
+        K = self.K
+        dx = zx - x
+        dy = zy - y
+        state = self.x
+        state[0] = x + K[0][0]*dx + K[0][1]*dy
+        state[1] = y + K[1][0]*dx + K[1][1]*dy
+        state[2] = vx + K[2][0]*dx + K[2][1]*dy
+        state[3] = vy + K[3][0]*dx + K[3][1]*dy
+        return state
+
+    def __update_covariance(self):
+        P = self.P
+        K = self.K
+
+        # prediction: P = F P F^T + Q
+        q = self.q
+        p02 = P[0][2] + P[2][2]
+        p03 = P[0][3] + P[2][3]
+        p12 = P[1][2] + P[3][2]
+        p13 = P[1][3] + P[3][3]
+        p00 = P[0][0] + P[0][2] + P[2][0] + P[2][2]
+        p01 = P[0][1] + P[0][3] + P[2][1] + P[2][3]
+        p10 = P[1][0] + P[1][2] + P[3][0] + P[3][2]
+        p11 = P[1][1] + P[1][3] + P[3][1] + P[3][3]
+        p20 = P[2][0] + P[2][2]
+        p21 = P[2][1] + P[2][3]
+        p30 = P[3][0] + P[3][2]
+        p31 = P[3][1] + P[3][3]
+        if q:
+            p00 += q / 4
+            p11 += q / 4
+            p02 += q / 2
+            p20 += q / 2
+            p13 += q / 2
+            p31 += q / 2
+            P[2][2] += q
+            P[3][3] += q
+        P[0][0] = p00
+        P[0][1] = p01
+        P[0][2] = p02
+        P[0][3] = p03
+        P[1][0] = p10
+        P[1][1] = p11
+        P[1][2] = p12
+        P[1][3] = p13
+        P[2][0] = p20
+        P[2][1] = p21
+        P[3][0] = p30
+        P[3][1] = p31
+
+        # S = H P H^T + R, inverted in closed form
+        s00 = p00 + self.R
+        s01 = p01
+        s10 = p10
+        s11 = p11 + self.R
+        det = s00*s11 - s01*s10
+        i00 = s11 / det
+        i01 = -s01 / det
+        i10 = -s10 / det
+        i11 = s00 / det
+
+        # K = P H^T S^-1
+        change = 0.0
+        for i in (0, 1, 2, 3):
+            row = P[i]
+            k0 = row[0]*i00 + row[1]*i10
+            k1 = row[0]*i01 + row[1]*i11
+            change = max(change, abs(k0 - K[i][0]), abs(k1 - K[i][1]))
+            K[i][0] = k0
+            K[i][1] = k1
+
+        # P = (I - K H) P
+        r0, r1 = self.scratch
+        r0[:] = P[0]
+        r1[:] = P[1]
+        for i in (0, 1, 2, 3):
+            row = P[i]
+            k0 = K[i][0]
+            k1 = K[i][1]
+            for j in (0, 1, 2, 3):
+                row[j] -= k0*r0[j] + k1*r1[j]
+
+        if self.steady_state and change < self.tolerance:
+            self.converged = True
+
+
+class fleet_kalman_filter:
+
+    F = np.array([[1., 0., 1., 0.], [0., 1., 0., 1.], [0., 0., 1., 0.], [0., 0., 0., 1.]])
+
+    # --------
+    # init:
+    #   creates an empty set of filters
+    #       capacity: number of filters to allocate room for; arrays grow as filters are added
+    #       R: measurement variance of x and y
+    #       q: process noise (see kalman_filter)
+    #
+    def __init__(self, capacity=16, R=0.01, q=0.0):
+        self.size = 0
+        self.R = R
+        self.Q = q * np.array([[.25, 0., .5, 0.], [0., .25, 0., .5], [.5, 0., 1., 0.], [0., .5, 0., 1.]])
+        self.P = np.zeros((max(capacity, 1), 4, 4))
+        self.x = np.zeros((max(capacity, 1), 4))
+
+    # ----------
+    # add_filter:
+    #   add a filter with initial uncertainty P (defaults to the one of kalman_filter) and return its index
+    #
+    def add_filter(self, P=None):
+        if P is None:
+            P = kalman_filter().P
+        if self.size == len(self.P):
+            self.P = np.concatenate((self.P, np.zeros(self.P.shape)))
+            self.x = np.concatenate((self.x, np.zeros(self.x.shape)))
+
+        index = self.size
+        self.size += 1
+        self.P[index] = P
+        return index
+
+    # ----------
+    # step:
+    #   run kalman_filter.step for several filters at once
+    #       indices: filter indices (n,)
+    #       states: (x, y, vx, vy) per filter (n,4)
+    #       measurements: measured (x, y) per filter (n,2)
+    #   return the new states (n,4)
+    #
+    def step(self, indices, states, measurements):
+        indices = np.asarray(indices)
+        x = np.array(states, dtype=float)
+        z = np.asarray(measurements, dtype=float)
+
+        # prediction
+        x[:, 0:2] += x[:, 2:4]
+        P = np.matmul(np.matmul(self.F, self.P[indices]), self.F.T) + self.Q
+
+        # S = H P H^T + R, inverted in closed form for all filters
+        s00 = P[:, 0, 0] + self.R
+        s01 = P[:, 0, 1]
+        s10 = P[:, 1, 0]
+        s11 = P[:, 1, 1] + self.R
+        det = s00*s11 - s01*s10
+        S_inv = np.empty((len(indices), 2, 2))
+        S_inv[:, 0, 0] = s11 / det
+        S_inv[:, 0, 1] = -s01 / det
+        S_inv[:, 1, 0] = -s10 / det
+        S_inv[:, 1, 1] = s00 / det
+
+        # measurement update
+        K = np.matmul(P[:, :, 0:2], S_inv)
+        y = z - x[:, 0:2]
+        x += np.matmul(K, y[:, :, np.newaxis])[:, :, 0]
+        self.P[indices] = P - np.matmul(K, P[:, 0:2, :])
+        self.x[indices] = x
+        return x
+
+
+# reference_step:
+#   the generic matrix based filter step this filter replaces (used for testing and benchmarking), with process
+#   noise q (see kalman_filter)
+def reference_step(P, state, z, q=0.0):
+    import matrix
+    u = matrix.matrix([[0.0], [0.0], [0.0], [0.0]])
+    F = matrix.matrix([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]])
+    H = matrix.matrix([[1., 0., 0., 0.], [0., 1., 0., 0.]])
+    R = matrix.matrix([[0.01, 0.], [0., 0.01]])
+    I = matrix.matrix([[1., 0., 0., 0.], [0., 1., 0., 0.], [0., 0., 1., 0.], [0., 0., 0., 1.]])
+    Q = matrix.matrix([[q/4, 0., q/2, 0.], [0., q/4, 0., q/2], [q/2, 0., q, 0.], [0., q/2, 0., q]])
+
+    x = matrix.matrix([[v] for v in state])
+    x = (F * x) + u
+    P = F * P * F.transpose() + Q
+    Z = matrix.matrix([[z[0]], [z[1]]])
+    y = Z - (H * x)
+    S = H * P * H.transpose() + R
+    K = P * H.transpose() * S.inverse()
+    x = x + (K * y)
+    P = (I - (K * H)) * P
+    return P, [row[0] for row in x.value]
+
+
+# if kalman.py is run as a script, compare against the matrix filter and run a microbenchmark
+if __name__ == '__main__':
+    import random
+    import timeit
+    import matrix
+
+    random.seed(1)
+    steps = 300
+    inputs = []
+    for i in range(steps):
+        state = [random.uniform(-100, 100), random.uniform(-100, 100), random.uniform(-10, 10), random.uniform(-10, 10)]
+        z = (state[0] + state[2] + random.gauss(0, 0.1), state[1] + state[3] + random.gauss(0, 0.1))
+        inputs.append((state, z))
+
+    print "Testing kalman_filter against the matrix filter"
+    q = 0.01
+    passed = True
+    for process_noise in [0.0, q]:
+        P = matrix.matrix([[0., 0., 0., 0.], [0., 0., 0., 0.], [0., 0., 0.1, 0.], [0., 0., 0., 10.]])
+        fast = kalman_filter(q=process_noise)
+        max_error = 0.0
+        for state, z in inputs:
+            P, expected = reference_step(P, state, z, process_noise)
+            actual = fast.step(state[0], state[1], state[2], state[3], z[0], z[1])
+            max_error = max([max_error] + [abs(a - b) for a, b in zip(actual, expected)])
+        print "  process noise {0}: max state error {1:.3g}: {2}".format(process_noise, max_error, max_error < 1e-9)
+        passed = passed and max_error < 1e-9
+
+    # with process noise the gain converges to the steady state gain, the frozen gain then tracks the full filter
+    full = kalman_filter(q=q)
+    steady = kalman_filter(q=q, steady_state=True)
+    max_steady_error = 0.0
+    for state, z in inputs:
+        expected = full.step(state[0], state[1], state[2], state[3], z[0], z[1])
+        actual = steady.step(state[0], state[1], state[2], state[3], z[0], z[1])
+        max_steady_error = max([max_steady_error] + [abs(a - b) for a, b in zip(actual, expected)])
+    steady_passed = steady.converged and max_steady_error < 1e-6
+    print "  steady state gain converged: {0}, max state error {1:.3g}: {2}".format(steady.converged, max_steady_error,
+                                                                                  steady_passed)
+    try:
+        kalman_filter(steady_state=True)
+        no_noise_passed = False
+    except ValueError:
+        no_noise_passed = True
+    print "  steady state without process noise rejected: {0}".format(no_noise_passed)
+    passed = passed and steady_passed and no_noise_passed
+
+    # run 10 filters side by side, each on a shifted copy of the inputs
+    print "Testing fleet_kalman_filter against kalman_filter"
+    nr_of_filters = 10
+    singles = [kalman_filter(q=q) for i in range(nr_of_filters)]
+    batched = fleet_kalman_filter(4, q=q)
+    indices = [batched.add_filter() for i in range(nr_of_filters)]
+    max_fleet_error = 0.0
+    for step in range(steps):
+        states = [inputs[(step + i) % steps][0] for i in indices]
+        z = [inputs[(step + i) % steps][1] for i in indices]
+        actual = batched.step(indices, states, z)
+        for i in indices:
+            expected = singles[i].step(states[i][0], states[i][1], states[i][2], states[i][3], z[i][0], z[i][1])
+            max_fleet_error = max([max_fleet_error] + [abs(a - b) for a, b in zip(actual[i], expected)])
+    fleet_passed = max_fleet_error < 1e-9
+    print "  max state error {0:.3g}: {1}".format(max_fleet_error, fleet_passed)
+    passed = passed and fleet_passed
+    print
+
+    print "Benchmark ({0} filter steps)".format(steps)
+
+    def run_reference():
+        P = matrix.matrix([[0., 0., 0., 0.], [0., 0., 0., 0.], [0., 0., 0.1, 0.], [0., 0., 0., 10.]])
+        for state, z in inputs:
+            P, x = reference_step(P, state, z, q)
+
+    def run_fast(steady_state):
+        f = kalman_filter(q=q, steady_state=steady_state)
+        for state, z in inputs:
+            f.step(state[0], state[1], state[2], state[3], z[0], z[1])
+
+    times = [min(timeit.repeat(run, number=10, repeat=3)) / 10 for run in
+             [run_reference, lambda: run_fast(False), lambda: run_fast(True)]]
+    print "  matrix filter:       {0:.2f} ms".format(times[0] * 1000)
+    print "  closed form:         {0:.2f} ms ({1:.1f}x)".format(times[1] * 1000, times[0] / times[1])
+    print "  steady state gain:   {0:.2f} ms ({1:.1f}x)".format(times[2] * 1000, times[0] / times[2])
+    print
+    print "PASSED!" if passed else "FAILED!"
@@ -0,0 +1,352 @@
+#
+# Localizers
+#
+# A localizer estimates where a boat agent is from its previous belief, its measured speed and heading (the last
+# move) and this step's measured location; sailboat_control.localize calls update(boat_agent), which sets
+# boat_agent.believed_point. sim_config.localizer selects the localizer of new agents:
+#   kalman:   the constant velocity Kalman filter (see kalman.py) on the measured location converted to cartesian
+#             coordinates. Cheap, but it models the measurement noise as small and gaussian in x and y, while
+#             provide_measurements scales the radius by a random factor and adds noise to the bearing.
+#   particle: a particle filter that weighs its particles with that measurement model itself. The particles are
+#             propagated, weighted and resampled as NumPy arrays; systematic resampling is O(N).
+#
+# With sim_config.batch_localization, headless.py localizes the whole fleet with one filter (see create_fleet and
+# sailboat_control.localize_fleet): kalman.fleet_kalman_filter, or fleet_particle_filter, which keeps the particles
+# of all boats in one (boats, particles, 2) array and updates them a chunk of boats at a time.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+import kalman
+
+
+class kalman_localizer:
+
+    # the agent's own kalman_filter (see sailboat_control.kalman)
+    def update(self, boat_agent):
+        boat_agent.kalman()
+
+
+class particle_localizer:
+
+    # --------
+    # init:
+    #   creates the filter; the particles are spread around the agent's belief on the first update
+    #       rng: random number generator the filter's own noise generator is seeded from (e.g. environment.rng)
+    #       nr_of_particles: number of particles
+    #       motion_sigma: standard deviation of the position noise added to every move, next to the noise of the
+    #                     measured speed (speed_error times the speed)
+    #       init_sigma: standard deviation of the initial spread around the first belief
+    #       resample_ratio: resample when the effective number of particles drops below this share of them
+    #
+    def __init__(self, rng, nr_of_particles=sim_config.particle_count, motion_sigma=sim_config.particle_motion_sigma,
+                 init_sigma=sim_config.particle_init_sigma, resample_ratio=sim_config.particle_resample_ratio):
+        self.noise = np.random.RandomState(rng.getrandbits(32))
+        self.nr_of_particles = nr_of_particles
+        self.motion_sigma = motion_sigma
+        self.init_sigma = init_sigma
+        self.resample_ratio = resample_ratio
+        self.particles = None  # (N,2) cartesian positions
+        self.log_weights = None  # (N,) unnormalized, 0 for the most likely particle
+        self.resamples = 0
+
+    def update(self, boat_agent):
+        frame = boat_agent.frame
+        if self.particles is None:
+            self.particles = np.array(frame.to_cartesian(boat_agent.believed_point), dtype=float) + \
+                self.noise.normal(0.0, self.init_sigma, (self.nr_of_particles, 2))
+            self.log_weights = np.zeros(self.nr_of_particles)
+
+        # prediction: move every particle by the measured velocity plus noise
+        speed, heading = boat_agent.believed_speed, boat_agent.believed_heading
+        particles = self.particles
+        particles += (speed * cos(heading), speed * sin(heading))
+        particles += self.noise.normal(0.0, motion_noise(speed, self.motion_sigma), particles.shape)
+
+        weights, self.log_weights = weigh(particles, self.log_weights, boat_agent.measured_location[0],
+                                          boat_agent.measured_location[1])
+        estimate = weights.dot(particles)
+        boat_agent.believed_point = frame.from_cartesian((float(estimate[0]), float(estimate[1])))
+
+        if 1.0 / weights.dot(weights) < self.resample_ratio * self.nr_of_particles:
+            self.particles = particles[systematic_resample(weights, self.noise.random_sample())]
+            self.log_weights[:] = 0.0
+            self.resamples += 1
+
+
+class fleet_particle_filter:
+
+    # --------
+    # init:
+    #   creates an empty set of particle filters (see particle_localizer for the other arguments)
+    #       capacity: number of filters to allocate room for; arrays grow as filters are added
+    #       chunk_size: number of filters updated together
+    #
+    def __init__(self, rng, capacity=16, nr_of_particles=sim_config.particle_count,
+                 motion_sigma=sim_config.particle_motion_sigma, init_sigma=sim_config.particle_init_sigma,
+                 resample_ratio=sim_config.particle_resample_ratio, chunk_size=16):
+        self.noise = np.random.RandomState(rng.getrandbits(32))
+        self.nr_of_particles = nr_of_particles
+        self.motion_sigma = motion_sigma
+        self.init_sigma = init_sigma
+        self.resample_ratio = resample_ratio
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.particles = np.zeros((max(capacity, 1), nr_of_particles, 2))
+        self.log_weights = np.zeros((max(capacity, 1), nr_of_particles))
+        self.started = np.zeros(max(capacity, 1), dtype=bool)
+        self.resamples = 0
+
+    # ----------
+    # add_filter:
+    #   add a filter and return its index
+    #
+    def add_filter(self):
+        if self.size == len(self.particles):
+            self.particles = np.concatenate((self.particles, np.zeros(self.particles.shape)))
+            self.log_weights = np.concatenate((self.log_weights, np.zeros(self.log_weights.shape)))
+            self.started = np.concatenate((self.started, np.zeros(self.started.shape, dtype=bool)))
+        self.size += 1
+        return self.size - 1
+
+    # ----------
+    # step:
+    #   run particle_localizer.update for several filters at once (the interface of fleet_kalman_filter.step)
+    #       indices: filter indices (n,)
+    #       states: believed (x, y) and measured (vx, vy) per filter (n,4)
+    #       measurements: measured (x, y) per filter (n,2)
+    #   return the estimated positions (n,2)
+    #
+    def step(self, indices, states, measurements):
+        indices = np.asarray(indices)
+        states = np.asarray(states, dtype=float)
+        z = np.asarray(measurements, dtype=float)
+
+        new = ~self.started[indices]
+        if new.any():
+            self.particles[indices[new]] = states[new, np.newaxis, 0:2] + \
+                self.noise.normal(0.0, self.init_sigma, (np.count_nonzero(new), self.nr_of_particles, 2))
+            self.started[indices[new]] = True
+
+        # a few boats at a time, so the particles and the temporary arrays of a chunk stay in the cache
+        estimates = np.empty((len(indices), 2))
+        for start in range(0, len(indices), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            estimates[chunk] = self.__step_chunk(indices[chunk], states[chunk], z[chunk])
+        return estimates
+
+    def __step_chunk(self, indices, states, z):
+        # the filters of a contiguous range of indices are updated in place, others are copied out and back
+        contiguous = indices[-1] - indices[0] == len(indices) - 1 and np.all(np.diff(indices) == 1)
+        if contiguous:
+            particles = self.particles[indices[0]:indices[-1] + 1]
+            log_weights = self.log_weights[indices[0]:indices[-1] + 1]
+        else:
+            particles = self.particles[indices]
+            log_weights = self.log_weights[indices]
+
+        # prediction
+        particles += states[:, np.newaxis, 2:4]
+        sigma = motion_noise(np.hypot(states[:, 2], states[:, 3]), self.motion_sigma)
+        noise = self.noise.standard_normal(particles.shape)
+        noise *= sigma[:, np.newaxis, np.newaxis]
+        particles += noise
+
+        # measurement update (on the measurements in polar coordinates, as provide_measurements made them)
+        weights, log_weights[:] = weigh(particles, log_weights, np.hypot(z[:, 0], z[:, 1])[:, np.newaxis],
+                                        np.arctan2(z[:, 1], z[:, 0])[:, np.newaxis])
+        estimates = np.einsum('bn,bnk->bk', weights, particles)
+
+        rows = np.flatnonzero(1.0 / np.einsum('bn,bn->b', weights, weights) <
+                              self.resample_ratio * self.nr_of_particles)
+        if len(rows):
+            picks = systematic_resample(weights[rows], self.noise.random_sample(len(rows)))
+            particles[rows] = particles[rows[:, np.newaxis], picks]
+            log_weights[rows] = 0.0
+            self.resamples += len(rows)
+
+        if not contiguous:
+            self.particles[indices] = particles
+            self.log_weights[indices] = log_weights
+        return estimates
+
+
+# motion_noise:
+#   standard deviation of the position noise of a move at speed: motion_sigma and the error of the measured speed
+def motion_noise(speed, motion_sigma):
+    return np.hypot(motion_sigma, sim_config.speed_error * speed)
+
+
+# ------
+# weigh:
+#   the normalized weights and the new log weights of particles after a measured location (measured_radius,
+#   measured_bearing). The measured radius is the true radius times N(1, location_radius_error), the measured
+#   bearing the true bearing plus N(0, location_bearing_error) (see true_sailboat.provide_measurements). The
+#   particles are turned into the frame of the measured bearing, where a particle's bearing error is its own angle.
+#       particles: cartesian positions (..., N, 2)
+#       log_weights: unnormalized log weights before the measurement (..., N)
+#       measured_radius, measured_bearing: scalars, or (..., 1) arrays
+#
+def weigh(particles, log_weights, measured_radius, measured_bearing):
+    # the floors keep noise free settings finite
+    radius_error = max(sim_config.location_radius_error, 1e-6)
+    bearing_error = max(sim_config.location_bearing_error, 1e-6)
+    c = np.cos(measured_bearing)
+    s = np.sin(measured_bearing)
+    along = particles[..., 0] * c + particles[..., 1] * s
+    across = particles[..., 1] * c - particles[..., 0] * s
+    radius_residual = (measured_radius / np.hypot(along, across) - 1.0) / radius_error
+    bearing_residual = np.arctan2(across, along) / bearing_error
+    log_weights = log_weights - 0.5 * (radius_residual**2 + bearing_residual**2)
+    log_weights -= log_weights.max(axis=-1)[..., np.newaxis]
+    # particles e^300 times less likely than the best one count as nothing; the floor keeps exp out of denormals
+    np.maximum(log_weights, -300.0, out=log_weights)
+    weights = np.exp(log_weights)
+    weights /= weights.sum(axis=-1)[..., np.newaxis]
+    return weights, log_weights
+
+
+# ---------------------
+# systematic_resample:
+#   indices of the particles drawn by systematic resampling: N evenly spaced positions (u + k) / N, k < N, over
+#   the cumulative weights. Particle i is drawn once for every position in its share of the cumulative weights,
+#   which is a difference of two counts, so no search is needed: O(N).
+#       weights: normalized weights (N,), or one row of them per filter (n,N)
+#       u: offset of the positions, uniform in [0, 1) (one per row)
+#
+def systematic_resample(weights, u):
+    n = weights.shape[-1]
+    cumulative = np.cumsum(weights, axis=-1)
+    cumulative[..., -1] = 1.0  # guard against rounding
+    below = np.clip(np.ceil(cumulative * n - np.asarray(u)[..., np.newaxis]), 0, n).astype(int)
+    counts = np.diff(below, axis=-1, prepend=0)
+    # every row draws n particles, so the indices of all rows split into rows of n again
+    return np.repeat(np.tile(np.arange(n), weights.size // n), counts.ravel()).reshape(weights.shape)
+
+
+localizers = {'kalman': kalman_localizer, 'particle': particle_localizer}
+
+
+# create:
+#   a new localizer of the kind selected by name (default sim_config.localizer) for an agent in env
+def create(env, name=None):
+    if name is None:
+        name = sim_config.localizer
+    if name == 'kalman':
+        return kalman_localizer()
+    if name == 'particle':
+        return particle_localizer(env.rng)
+    raise ValueError('unknown localizer: {0}'.format(name))
+
+
+# create_fleet:
+#   a new fleet filter of the kind selected by name for nr_of_boats agents in env (see sailboat_control.localize_fleet)
+def create_fleet(env, nr_of_boats, name=None):
+    if name is None:
+        name = sim_config.localizer
+    if name == 'kalman':
+        return kalman.fleet_kalman_filter(nr_of_boats, q=sim_config.kalman_process_noise)
+    if name == 'particle':
+        return fleet_particle_filter(env.rng, nr_of_boats)
+    raise ValueError('unknown localizer: {0}'.format(name))
+
+
+# if localizer.py is run as a script, compare the localizers' errors in races and time them
+if __name__ == '__main__':
+    import random
+    import timeit
+    import utilsmath
+    import environment
+    import sailboat_control
+    import headless
+
+    sim_config.print_boat_data = False
+    print "Testing systematic_resample"
+    rows = np.random.RandomState(1).random_sample((3, 1000))
+    rows /= rows.sum(axis=1)[:, np.newaxis]
+    picks = systematic_resample(rows, [0.0, 0.5, 0.999])
+    resample_passed = np.array_equal(picks[1], systematic_resample(rows[1], 0.5))
+    for weights, indices in zip(rows, picks):
+        counts = np.bincount(indices, minlength=len(weights))
+        resample_passed = resample_passed and np.all(np.abs(counts - weights * len(weights)) < 1.0)
+    print "  every particle drawn within one of N * weight times: {0}".format(resample_passed)
+    print
+
+    print "Testing localization error (10 races of 300 steps, 3 boats)"
+    errors = {}
+    for name, batch_localization in [('kalman', False), ('particle', False), ('particle', True)]:
+        sim_config.localizer = name
+        measured = []
+        believed = []
+        for seed in range(10):
+            env = environment.environment(random.Random(seed))
+            fleet_filter = create_fleet(env, 3) if batch_localization else None
+            boat_agents = [sailboat_control.sailboat_control(env, fleet_filter) for i in range(3)]
+            for i in range(300):
+                if fleet_filter is not None:
+                    sailboat_control.localize_fleet(boat_agents, fleet_filter)
+                controls = [boat_agent.boat_action(localize=fleet_filter is None) for boat_agent in boat_agents]
+                for boat_agent in boat_agents:
+                    true_point = env.frame.to_cartesian(env.boats[boat_agent.boat_id].point)
+                    believed_point = env.frame.to_cartesian(boat_agent.believed_point)
+                    measured_point = utilsmath.polar_to_cartesian(boat_agent.measured_location)
+                    believed.append(hypot(believed_point[0] - true_point[0], believed_point[1] - true_point[1]))
+                    measured.append(hypot(measured_point[0] - true_point[0], measured_point[1] - true_point[1]))
+                env.update(controls)
+                env.change_wind(i)
+        errors[name, batch_localization] = np.mean(believed)
+        print "  {0:<8} (batch {1:<5}): mean error {2:.3f} (measurements {3:.3f})".format(
+            name, str(batch_localization), np.mean(believed), np.mean(measured))
+    localization_passed = max(errors['particle', False], errors['particle', True]) < errors['kalman', False]
+    print "  particle filters more accurate: {0}".format(localization_passed)
+    print
+
+    print "Benchmark (one update of one boat)"
+    env = environment.environment(random.Random(1))
+    boat_agent = sailboat_control.sailboat_control(env)
+    boat_agent.measure()
+    boat_agent.measure()
+    for nr_of_particles in [100, 1000, 10000]:
+        boat_agent.localizer = particle_localizer(env.rng, nr_of_particles)
+        seconds = min(timeit.repeat(lambda: boat_agent.localizer.update(boat_agent), number=100, repeat=3)) / 100
+        print "  {0:6} particles: {1:.3f} ms".format(nr_of_particles, seconds * 1000)
+    boat_agent.localizer = kalman_localizer()
+    seconds = min(timeit.repeat(lambda: boat_agent.localizer.update(boat_agent), number=1000, repeat=3)) / 1000
+    print "  kalman:           {0:.3f} ms".format(seconds * 1000)
+    print
+
+    print "Benchmark (headless step of 500 boats, {0} particles each)".format(sim_config.particle_count)
+    for name, batch_localization in [('kalman', False), ('kalman', True), ('particle', False), ('particle', True)]:
+        sim_config.localizer = name
+        sim_config.batch_localization = batch_localization
+        race = headless.race(500, 1)
+        race.step()
+        seconds = min(timeit.repeat(race.step, number=5, repeat=3)) / 5
+        print "  {0:<8} (batch {1:<5}): {2:.3f} ms".format(name, str(batch_localization), seconds * 1000)
+    sim_config.localizer = 'kalman'
+    sim_config.batch_localization = False
+    print
+
+    # measure and localize, as a headless step does, with a particle_localizer per agent or one fleet_particle_filter
+    print "Benchmark (localizing 500 boats, {0} particles each)".format(sim_config.particle_count)
+    sim_config.localizer = 'particle'
+    env = environment.environment(random.Random(1))
+    fleet_filter = fleet_particle_filter(env.rng, 500)
+    per_agent = [sailboat_control.sailboat_control(env) for i in range(500)]
+    batched = [sailboat_control.sailboat_control(env, fleet_filter) for i in range(500)]
+
+    def localize_per_agent():
+        for boat_agent in per_agent:
+            boat_agent.localize()
+
+    for name, run in [('per agent', localize_per_agent),
+                      ('fleet filter', lambda: sailboat_control.localize_fleet(batched, fleet_filter))]:
+        run()
+        seconds = min(timeit.repeat(run, number=5, repeat=3)) / 5
+        print "  {0:<12}: {1:.3f} ms".format(name, seconds * 1000)
+    sim_config.localizer = 'kalman'
+    print
+    print "PASSED!" if resample_passed and localization_passed else "FAILED!"
@@ -0,0 +1,116 @@
+#
+# Monte Carlo Simulation
+#
+# Runs many seeded headless simulations in parallel worker processes and aggregates their results.
+# Every run has its own random number generator (random.Random(seed)), so a run gives the same result
+# no matter which process runs it or in which order.
+#
+#   python montecarlo.py --runs 1000 --steps 300 --boats 1 --output montecarlo.json
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+import sim_config
+import headless
+
+
+percentiles = [10, 25, 50, 75, 90]
+
+
+def init_worker():
+    sim_config.print_boat_data = False
+
+
+# run_one:
+#   run the headless simulation for one (seed, steps, nr_of_boats) job; used by the worker processes
+def run_one(job):
+    seed, steps, nr_of_boats = job
+    return headless.run(steps, nr_of_boats, seed)
+
+
+# run:
+#   run one headless simulation per seed and return the list of results, in the order of seeds
+#       processes: number of worker processes (defaults to the number of cores). 1 runs in this process.
+#
+def run(seeds, steps=None, nr_of_boats=None, processes=None):
+    jobs = [(seed, steps, nr_of_boats) for seed in seeds]
+    if processes == 1:
+        init_worker()
+        return [run_one(job) for job in jobs]
+
+    pool = multiprocessing.Pool(processes, init_worker)
+    try:
+        # small chunks keep all cores busy even though some runs finish early
+        chunksize = max(1, len(jobs) // (4 * (processes or multiprocessing.cpu_count())))
+        return pool.map(run_one, jobs, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize(values):
+    if len(values) == 0:
+        return None
+    values = np.array(values, dtype=float)
+    summary = {'mean': float(values.mean()), 'min': float(values.min()), 'max': float(values.max())}
+    for p, value in zip(percentiles, np.percentile(values, percentiles)):
+        summary['p{0}'.format(p)] = float(value)
+    return summary
+
+
+# aggregate:
+#   combine the per boat results of many runs into finish step, cross track error and marks rounded statistics
+def aggregate(results):
+    boats = [boat for result in results for boat in result['boats']]
+    finish_steps = [boat['finish_step'] for boat in boats if boat['finish_step'] is not None]
+
+    return {'runs': len(results),
+            'boats': len(boats),
+            'finish_rate': float(len(finish_steps)) / len(boats) if boats else 0.0,
+            'finish_step': summarize(finish_steps),
+            'mean_cross_track_error': summarize([boat['mean_cross_track_error'] for boat in boats]),
+            'max_cross_track_error': summarize([boat['max_cross_track_error'] for boat in boats]),
+            'marks_rounded': summarize([boat['marks_rounded'] for boat in boats])}
+
+
+def format_summary(name, summary):
+    if summary is None:
+        return '  {0}: no data'.format(name)
+    return '  {0}: mean {1:.2f}, p10 {2:.2f}, p50 {3:.2f}, p90 {4:.2f}'.format(name, summary['mean'], summary['p10'],
+                                                                              summary['p50'], summary['p90'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run seeded headless simulations in parallel')
+    parser.add_argument('--runs', type=int, default=100, help='Number of simulations')
+    parser.add_argument('--first-seed', type=int, default=0, help='Seeds are first-seed .. first-seed + runs - 1')
+    parser.add_argument('--steps', type=int, default=sim_config.max_nr_of_steps, help='Maximum number of steps')
+    parser.add_argument('--boats', type=int, default=sim_config.nr_of_boats, help='Number of boats per run')
+    parser.add_argument('--processes', type=int, help='Number of worker processes (default: number of cores)')
+    parser.add_argument('--output', help='Write aggregated statistics as JSON to this file')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    seeds = range(args.first_seed, args.first_seed + args.runs)
+    results = run(seeds, args.steps, args.boats, args.processes)
+    elapsed = time.time() - start_time
+
+    stats = aggregate(results)
+    stats['elapsed'] = elapsed
+    stats['runs_per_second'] = len(results) / elapsed
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(stats, f, indent=2)
+
+    print 'Finished {0} runs in {1:.2f}s ({2:.1f} runs/s)'.format(stats['runs'], elapsed, stats['runs_per_second'])
+    print '  finish rate: {0:.1%}'.format(stats['finish_rate'])
+    print format_summary('finish step', stats['finish_step'])
+    print format_summary('mean cross track error', stats['mean_cross_track_error'])
+    print format_summary('marks rounded', stats['marks_rounded'])
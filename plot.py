@@ -16,14 +16,28 @@ import utilsmath
 
 
 can_plot = False
-try:
-    import matplotlib as mpl
-    import matplotlib.pyplot as plt
-    can_plot = True
-except ImportError, e:
-    print "No plotting because: {0}".format(e)
-    print "  Windows: try downloading from http://www.lfd.uci.edu/~gohlke/pythonlibs/#matplotlib"
-    print "  Linux: use 'sudo apt-get install python-matplotlib'"
+mpl = None
+plt = None
+tried_matplotlib = False
+
+
+# load_matplotlib:
+#   import matplotlib on first use (importing it takes longer than a short headless run), return can_plot
+def load_matplotlib():
+    global can_plot, mpl, plt, tried_matplotlib
+    if not tried_matplotlib:
+        tried_matplotlib = True
+        try:
+            import matplotlib
+            import matplotlib.pyplot
+            mpl = matplotlib
+            plt = matplotlib.pyplot
+            can_plot = True
+        except ImportError, e:
+            print "No plotting because: {0}".format(e)
+            print "  Windows: try downloading from http://www.lfd.uci.edu/~gohlke/pythonlibs/#matplotlib"
+            print "  Linux: use 'sudo apt-get install python-matplotlib'"
+    return can_plot
 
 class plot:
 
@@ -36,8 +50,7 @@ class plot:
         pass
 
     def start(self):
-        global can_plot
-        if not can_plot:
+        if not load_matplotlib():
             return
 
         self.fig = plt.figure(figsize=(15, 15))
@@ -45,7 +58,8 @@ class plot:
         plt.ion()  # enable interactive plotting
 
     def end(self):
-        plt.ioff()
+        if can_plot:
+            plt.ioff()
 
     def show(self):
         global can_plot
@@ -56,12 +70,14 @@ class plot:
         #self.fig.show(block=True)
 
     def draw(self):
-        plt.draw()
+        if can_plot:
+            plt.draw()
         #self.fig.draw()
 
 
     def clear(self):
-        plt.cla()
+        if can_plot:
+            plt.cla()
 
 
     def plot_course(self, env, polar_plot):
@@ -69,7 +85,7 @@ class plot:
         # draw arrow for start direction
         mid_start_angle = utilsmath.normalize_angle((env.course[0].angle + env.course[1].angle) / 2)
         far_dist = env.course[0].radius
-        near_dist = env.course[0].radius - sim_config.course_range / 10.
+        near_dist = env.course[0].radius - env.course_range / 10.
         polar_plot.arrow((far_dist, mid_start_angle), (near_dist, mid_start_angle))
 
         count = 0
@@ -0,0 +1,158 @@
+#
+# Polar Diagram
+#
+# Provides a polar_table: boat speed precomputed on a grid of relative wind angle x wind speed
+# (with an optional boom axis) and looked up by linear interpolation.
+# The same table is shared by the physics (true_sailboat / fleet) and the planner (sailboat_control).
+# Speeds are for a boat with max_speed_ratio 1; scale by the boat's max_speed_ratio.
+# Lookups take scalars or arrays, so whole fleets or sets of candidate headings are evaluated in one call.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import sim_config
+
+
+# model_speed:
+#   the gaussian speed model of a boat with max_speed_ratio 1.
+#   The boat is fastest when sailing directly down-wind (run), slower if the wind comes from the sides (reach),
+#   and stalls and even moves backwards if the wind is head-on.
+def model_speed(wind_angle, wind_strength, stall_ratio=0.05):
+    max_speed = wind_strength
+    stall_range = stall_ratio * max_speed
+    return (max_speed + stall_range)*np.exp(-(np.asarray(wind_angle)**2)/2) - stall_range
+
+
+# axis_position:
+#   return the lower grid index and the fractional position for values on a regular or irregular axis
+#   values outside of the axis are extrapolated linearly from the first/last grid cell
+def axis_position(axis, values):
+    if len(axis) == 1:
+        return np.zeros(np.shape(values), dtype=int), np.zeros(np.shape(values))
+    index = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+    fraction = (values - axis[index]) / (axis[index + 1] - axis[index])
+    return index, fraction
+
+
+class polar_table:
+
+    # --------
+    # init:
+    #   creates the table
+    #       angles: relative wind angles in [-pi, pi], ascending
+    #       wind_speeds: wind speeds, ascending
+    #       speeds: boat speeds with shape (len(booms), len(angles), len(wind_speeds))
+    #               or (len(angles), len(wind_speeds)) for a table that ignores the boom
+    #       booms: boom angles, ascending (defaults to a single 0 boom)
+    #
+    def __init__(self, angles, wind_speeds, speeds, booms=None):
+        self.angles = np.asarray(angles, dtype=float)
+        self.wind_speeds = np.asarray(wind_speeds, dtype=float)
+        self.booms = np.asarray(booms if booms is not None else [0.0], dtype=float)
+        self.speeds = np.asarray(speeds, dtype=float).reshape(len(self.booms), len(self.angles), len(self.wind_speeds))
+
+    # -----------
+    # from_model:
+    #   build a table by sampling model_speed
+    #
+    @classmethod
+    def from_model(cls, angle_step=sim_config.polar_angle_step, max_wind_speed=sim_config.polar_max_wind_speed,
+                   wind_speed_step=1.0):
+        nr_of_angles = int(round(2*pi / angle_step)) + 1
+        angles = np.linspace(-pi, pi, nr_of_angles)
+        wind_speeds = np.arange(0.0, max_wind_speed + wind_speed_step / 2, wind_speed_step)
+        speeds = model_speed(angles[:, np.newaxis], wind_speeds[np.newaxis, :])
+        return cls(angles, wind_speeds, speeds)
+
+    # -----
+    # load:
+    #   load a table saved with save (NumPy .npz file with angles, wind_speeds, booms and speeds)
+    #
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['angles'], data['wind_speeds'], data['speeds'], data['booms'])
+
+    def save(self, path):
+        np.savez(path, angles=self.angles, wind_speeds=self.wind_speeds, booms=self.booms, speeds=self.speeds)
+
+    # ------
+    # speed:
+    #   boat speed for relative wind angle, wind speed and (optionally) boom angle; scalars or arrays
+    #   angles are normalized onto [-pi, pi] first
+    #
+    def speed(self, wind_angle, wind_speed, boom=0.0):
+        wind_angle = np.mod(np.asarray(wind_angle, dtype=float) + pi, 2*pi) - pi
+        wind_speed = np.asarray(wind_speed, dtype=float)
+
+        a, ta = axis_position(self.angles, wind_angle)
+        w, tw = axis_position(self.wind_speeds, wind_speed)
+        b, tb = axis_position(self.booms, np.asarray(boom, dtype=float))
+        a, ta, w, tw, b, tb = np.broadcast_arrays(a, ta, w, tw, b, tb)
+
+        speed = self.__bilinear(b, a, ta, w, tw)
+        if len(self.booms) > 1:
+            speed = speed + tb * (self.__bilinear(b + 1, a, ta, w, tw) - speed)
+
+        if speed.ndim == 0:
+            return float(speed)
+        return speed
+
+    def __bilinear(self, b, a, ta, w, tw):
+        s = self.speeds
+        a1 = np.minimum(a + 1, len(self.angles) - 1)
+        w1 = np.minimum(w + 1, len(self.wind_speeds) - 1)
+        low = s[b, a, w] + tw * (s[b, a, w1] - s[b, a, w])
+        high = s[b, a1, w] + tw * (s[b, a1, w1] - s[b, a1, w])
+        return low + ta * (high - low)
+
+
+table = None
+
+
+# default_table:
+#   the table shared by physics and planner: loaded from sim_config.polar_table_file if set,
+#   otherwise built from model_speed. Built on first use.
+def default_table():
+    global table
+    if table is None:
+        if sim_config.polar_table_file is not None:
+            table = polar_table.load(sim_config.polar_table_file)
+        else:
+            table = polar_table.from_model()
+    return table
+
+
+# if polar.py is run as a script, test the table against the model
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import os
+
+    t = polar_table.from_model()
+    random.seed(1)
+    angles = np.array([random.uniform(-pi, pi) for i in range(1000)])
+    winds = np.array([random.uniform(0, 25) for i in range(1000)])
+
+    # errors relative to wind speed
+    max_error = (np.abs(t.speed(angles, winds) - model_speed(angles, winds)) / winds).max()
+    scalar_error = max(abs(t.speed(a, w) - model_speed(a, w)) / w for a, w in zip(angles[:20], winds[:20]))
+    wrap_error = np.abs(t.speed(angles + 2*pi, winds) - t.speed(angles, winds)).max()
+
+    path = os.path.join(tempfile.mkdtemp(), 'polar.npz')
+    t.save(path)
+    load_error = np.abs(polar_table.load(path).speed(angles, winds) - t.speed(angles, winds)).max()
+
+    print "Testing polar_table"
+    tests = [("interpolation error", max_error, 1e-4),
+             ("scalar lookup error", scalar_error, 1e-4),
+             ("wrapped angle error", wrap_error, 1e-9),
+             ("save/load error", load_error, 0.0)]
+    passed = True
+    for name, error, limit in tests:
+        print "  {0} {1:.3g} <= {2}: {3}".format(name, error, limit, error <= limit)
+        passed = passed and error <= limit
+    print
+    print "PASSED!" if passed else "FAILED!"
@@ -0,0 +1,237 @@
+#
+# Trajectory Recorder
+#
+# Records the state of the environment and of every boat each step into preallocated NumPy column buffers,
+# one column per field. Full buffers are flushed in chunks to one raw binary file per field, next to an index
+# (recording.json) with the dtype and shape of every column, so a recording can be memory-mapped back with load().
+# Fields are opt-in; recording only what is needed keeps both the per step cost and the files small.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import os
+import json
+import numpy as np
+import sim_config
+import utilsmath
+
+
+# locations:
+#   (radius, bearing) of (n,2) points of a coordinate frame (see coordinates.py)
+def locations(frame, points):
+    return utilsmath.cartesian_to_polar_array(np.asarray(frame.points_to_cartesian(points), dtype=float).reshape(-1, 2))
+
+
+# believed_points:
+#   believed point of each boat agent, NaN for agents that haven't localized yet
+def believed_points(boat_agents):
+    return np.array([boat_agent.believed_point if boat_agent.believed_point is not None else (nan, nan)
+                     for boat_agent in boat_agents], dtype=float).reshape(-1, 2)
+
+
+# per boat fields: name -> (width, function(env, boat_agents) returning an (nr_of_boats, width) array or (nr_of_boats,))
+boat_fields = {
+    'location': (2, lambda env, boat_agents: locations(env.frame, env.fleet.point[:env.fleet.size])),
+    'speed': (1, lambda env, boat_agents: env.fleet.speed[:env.fleet.size]),
+    'heading': (1, lambda env, boat_agents: env.fleet.heading[:env.fleet.size]),
+    'relative_wind_angle': (1, lambda env, boat_agents: env.fleet.relative_wind_angle[:env.fleet.size]),
+    'rudder': (1, lambda env, boat_agents: env.fleet.rudder[:env.fleet.size]),
+    'boom': (1, lambda env, boat_agents: env.fleet.boom[:env.fleet.size]),
+    'believed_location': (2, lambda env, boat_agents: locations(env.frame, believed_points(boat_agents))),
+    'believed_speed': (1, lambda env, boat_agents: [boat_agent.believed_speed for boat_agent in boat_agents]),
+    'believed_heading': (1, lambda env, boat_agents: [boat_agent.believed_heading for boat_agent in boat_agents]),
+    'measured_heading': (1, lambda env, boat_agents: [boat_agent.measured_heading for boat_agent in boat_agents]),
+}
+
+# environment fields: name -> (width, function(env) returning a tuple of width values)
+env_fields = {
+    'wind': (2, lambda env: env.current_wind),
+    'goal_wind': (2, lambda env: env.goal_wind),
+    'wind_change': (2, lambda env: (env.wind_speed_change, env.wind_direction_change)),
+}
+
+all_fields = sorted(env_fields) + sorted(boat_fields)
+
+
+class trajectory_recorder:
+
+    # --------
+    # init:
+    #   creates the recorder
+    #       nr_of_boats: number of boats recorded every step
+    #       fields: names of the recorded fields (see boat_fields and env_fields), None for sim_config.record_fields
+    #       path: directory the recording is flushed to. None keeps only the current chunk in memory.
+    #       chunk_size: number of steps buffered between flushes
+    #
+    def __init__(self, nr_of_boats, fields=None, path=None, chunk_size=sim_config.record_chunk_size):
+        if fields is None:
+            fields = sim_config.record_fields if sim_config.record_fields is not None else all_fields
+        for field in fields:
+            if field not in boat_fields and field not in env_fields:
+                raise ValueError('unknown field: {0}'.format(field))
+
+        self.nr_of_boats = nr_of_boats
+        self.fields = list(fields)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.count = 0  # steps in the buffers
+        self.nr_of_steps = 0  # steps recorded in total
+
+        self.step = np.zeros(chunk_size, dtype=np.int64)
+        self.columns = {}
+        for field in self.fields:
+            if field in boat_fields:
+                self.columns[field] = np.zeros((chunk_size, nr_of_boats, boat_fields[field][0]))
+            else:
+                self.columns[field] = np.zeros((chunk_size, env_fields[field][0]))
+
+        if path is not None:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for field in ['step'] + self.fields:
+                open(self.__column_file(field), 'wb').close()
+            self.__write_index()
+
+    # -------
+    # record:
+    #   append the state of env and boat_agents at step i
+    #
+    def record(self, env, boat_agents, i):
+        if self.count == self.chunk_size:
+            self.flush()
+
+        row = self.count
+        self.step[row] = i
+        for field in self.fields:
+            column = self.columns[field]
+            if field in boat_fields:
+                values = np.asarray(boat_fields[field][1](env, boat_agents), dtype=float)[:self.nr_of_boats]
+                column[row] = values.reshape(column.shape[1:])
+            else:
+                column[row] = env_fields[field][1](env)
+        self.count += 1
+        self.nr_of_steps += 1
+
+    # -----
+    # last:
+    #   the most recently recorded step as a dictionary field -> row (also 'step')
+    #
+    def last(self):
+        if self.count == 0:
+            return None
+        row = self.count - 1
+        values = dict((field, self.columns[field][row]) for field in self.fields)
+        values['step'] = int(self.step[row])
+        return values
+
+    # ------
+    # flush:
+    #   append the buffered steps to the column files and empty the buffers
+    #
+    def flush(self):
+        if self.path is not None and self.count > 0:
+            for field, column in [('step', self.step)] + [(field, self.columns[field]) for field in self.fields]:
+                with open(self.__column_file(field), 'ab') as f:
+                    f.write(column[:self.count].tobytes())
+            self.count = 0
+            self.__write_index()
+        self.count = 0
+
+    def close(self):
+        self.flush()
+
+    def __column_file(self, field):
+        return os.path.join(self.path, field + '.bin')
+
+    def __write_index(self):
+        flushed = self.nr_of_steps - self.count
+        columns = {'step': {'dtype': self.step.dtype.str, 'shape': [flushed]}}
+        for field in self.fields:
+            column = self.columns[field]
+            columns[field] = {'dtype': column.dtype.str, 'shape': [flushed] + list(column.shape[1:])}
+        with open(os.path.join(self.path, 'recording.json'), 'w') as f:
+            json.dump({'nr_of_boats': self.nr_of_boats, 'nr_of_steps': flushed, 'columns': columns}, f, indent=2)
+
+
+# load:
+#   memory-map a recording flushed to path
+#   return a dictionary field -> read-only array of shape (steps,) for 'step', (steps, width) for environment
+#   fields and (steps, nr_of_boats, width) for boat fields
+#
+def load(path):
+    with open(os.path.join(path, 'recording.json')) as f:
+        index = json.load(f)
+
+    columns = {}
+    for field, column in index['columns'].items():
+        shape = tuple(column['shape'])
+        if shape[0] == 0:
+            columns[field] = np.zeros(shape, dtype=column['dtype'])
+        else:
+            columns[field] = np.memmap(os.path.join(path, field + '.bin'), dtype=column['dtype'], mode='r',
+                                       shape=shape)
+    return columns
+
+
+# if recorder.py is run as a script, record a race and compare the recording with the boats' state
+if __name__ == '__main__':
+    import random
+    import shutil
+    import tempfile
+    import timeit
+    import environment
+    import sailboat_control
+
+    sim_config.print_boat_data = False
+    nr_of_boats = 10
+    steps = 300
+    path = tempfile.mkdtemp()
+
+    env = environment.environment(random.Random(1))
+    boat_agents = [sailboat_control.sailboat_control(env) for i in range(nr_of_boats)]
+    recorder = trajectory_recorder(nr_of_boats, path=path, chunk_size=64)
+    expected = []
+    for i in range(steps):
+        controls = [boat_agent.boat_action() for boat_agent in boat_agents]
+        recorder.record(env, boat_agents, i)
+        expected.append([(boat.location, boat.speed, boat_agent.believed_location)
+                         for boat, boat_agent in zip(env.boats, boat_agents)])
+        env.update(controls)
+        env.change_wind(i)
+    recorder.close()
+
+    print "Testing a recording of {0} steps with {1} boats".format(steps, nr_of_boats)
+    recording = load(path)
+    max_error = 0.0
+    for i in range(steps):
+        for b_id, (location, speed, believed_location) in enumerate(expected[i]):
+            max_error = max(max_error, abs(recording['location'][i, b_id, 0] - location[0]),
+                            abs(utilsmath.normalize_angle(recording['location'][i, b_id, 1] - location[1])),
+                            abs(recording['speed'][i, b_id, 0] - speed),
+                            abs(recording['believed_location'][i, b_id, 0] - believed_location[0]))
+    passed = len(recording['step']) == steps and list(recording['step']) == range(steps) and max_error < 1e-9
+    print "  {0} steps read back, max error {1:.3g}: {2}".format(len(recording['step']), max_error, passed)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    print "  {0:.1f} kB on disk".format(size / 1024.0)
+    shutil.rmtree(path)
+    print
+
+    print "Benchmark (one step with {0} boats)".format(nr_of_boats)
+    import report
+    import sys
+    import StringIO
+
+    memory_recorder = trajectory_recorder(nr_of_boats)
+    sim_config.print_boat_data = True
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        times = [min(timeit.repeat(run, number=100, repeat=3)) / 100 for run in
+                 [lambda: memory_recorder.record(env, boat_agents, 0), lambda: report.report(env, boat_agents, 0)]]
+    finally:
+        sys.stdout = stdout
+    print "  record:          {0:.3f} ms".format(times[0] * 1000)
+    print "  text report:     {0:.3f} ms".format(times[1] * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"
@@ -0,0 +1,224 @@
+#
+# Replanning Scheduler
+#
+# Decides which boat agents replan each step. An agent asks for a replan when the wind shifted or changed speed
+# beyond a threshold since its last plan, when its cross track error exceeds a bound, or when it rounded a mark.
+# At most budget agents of the fleet replan per step, the ones with the stalest plans first; the others keep
+# asking until their turn comes. Replans are incremental (see sailboat_control.plan): a leg of the plan keeps its
+# tacks unless the wind half way along it changed beyond the thresholds, or a leg before it had to be replanned.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import numpy as np
+import utilsmath
+import sim_config
+
+
+class replan_scheduler:
+
+    # --------
+    # init:
+    #   creates the scheduler; settings left None are sim_config's as they are when the scheduler is created
+    #       budget: maximum number of agents that replan per step
+    #       wind_shift: change of wind direction (radians) since the last plan that triggers a replan
+    #       wind_speed_change: change of wind speed since the last plan that triggers a replan
+    #       cross_track_error: cross track error that triggers a replan (sim_config's None never triggers)
+    #       mark_rounded: replan when the agent rounded a mark since the last plan (passing one crossing of a
+    #                     mark doesn't trigger: replanning right after the crossing between two marks tends to
+    #                     recross it)
+    #
+    def __init__(self, budget=None, wind_shift=None, wind_speed_change=None, cross_track_error=None,
+                 mark_rounded=None):
+        self.budget = budget if budget is not None else sim_config.replan_budget
+        self.wind_shift = wind_shift if wind_shift is not None else sim_config.replan_wind_shift
+        self.wind_speed_change = wind_speed_change if wind_speed_change is not None else \
+            sim_config.replan_wind_speed_change
+        self.cross_track_error = cross_track_error if cross_track_error is not None else \
+            sim_config.replan_cross_track_error
+        self.mark_rounded = mark_rounded if mark_rounded is not None else sim_config.replan_on_mark_rounded
+        self.triggered = {'wind': 0, 'cross_track_error': 0, 'mark_rounded': 0}  # replans per trigger
+        self.deferred = 0  # agent steps spent waiting for the budget
+
+    # --------
+    # trigger:
+    #   the reason boat_agent should replan ('wind', 'cross_track_error' or 'mark_rounded'), or None
+    #
+    def trigger(self, boat_agent):
+        env = boat_agent.env
+        if boat_agent.planned_wind is None or env.course_complete(boat_agent.mark_state):
+            return None
+
+        if self.mark_rounded and boat_agent.mark_state.index != boat_agent.planned_mark_state[0]:
+            return 'mark_rounded'
+
+        wind = env.wind_at(boat_agent.believed_point)
+        if abs(wind[0] - boat_agent.planned_wind[0]) > self.wind_speed_change or \
+                abs(utilsmath.normalize_angle(wind[1] - boat_agent.planned_wind[1])) > self.wind_shift:
+            return 'wind'
+
+        if self.cross_track_error is not None and abs(boat_agent.cross_track_error()) > self.cross_track_error:
+            return 'cross_track_error'
+
+        return None
+
+    # ------------
+    # changed_legs:
+    #   the number of legs of boat_agent's plan up to the last one whose wind (half way along the leg) shifted or
+    #   changed speed beyond the thresholds since the leg was planned; the legs after it can keep their tacks
+    #
+    def changed_legs(self, boat_agent):
+        legs = boat_agent.legs
+        if not legs:
+            return 0
+        speeds, directions = boat_agent.env.winds(np.array([leg.middle for leg in legs]))
+        planned = np.array([leg.wind for leg in legs], dtype=float)
+        changed = (np.abs(speeds - planned[:, 0]) > self.wind_speed_change) | \
+            (np.abs(utilsmath.normalize_angle_array(directions - planned[:, 1])) > self.wind_shift)
+        changed = np.flatnonzero(changed)
+        return int(changed[-1]) + 1 if len(changed) else 0
+
+    # ---------
+    # schedule:
+    #   set replan on the agents that replan in step i and return them
+    #   agents that will plan anyway (their first plan) are not counted against the budget
+    #
+    def schedule(self, boat_agents, i):
+        waiting = []
+        for boat_agent in boat_agents:
+            if boat_agent.replan:
+                boat_agent.planned_step = i
+                continue
+            reason = self.trigger(boat_agent)
+            if reason is not None:
+                waiting.append((boat_agent.planned_step, boat_agent.boat_id, boat_agent, reason))
+
+        # stalest plans first
+        waiting.sort(key=lambda request: request[:2])
+        chosen = waiting[:self.budget]
+        for planned_step, boat_id, boat_agent, reason in chosen:
+            boat_agent.replan = True
+            boat_agent.replan_legs = self.changed_legs(boat_agent)
+            boat_agent.planned_step = i
+            self.triggered[reason] += 1
+        self.deferred += len(waiting) - len(chosen)
+        return [boat_agent for planned_step, boat_id, boat_agent, reason in chosen]
+
+
+# if replanner.py is run as a script, test the triggers and the scheduling with stub agents
+if __name__ == '__main__':
+
+    class stub_env:
+        def __init__(self, wind):
+            self.wind = wind
+
+        def wind_at(self, point):
+            return self.wind
+
+        def winds(self, points):
+            return np.repeat(self.wind[0], len(points)), np.repeat(self.wind[1], len(points))
+
+        def course_complete(self, mark_state):
+            return mark_state.index >= 10
+
+    class stub_mark_state:
+        def __init__(self, index):
+            self.index = index
+
+    class stub_leg:
+        def __init__(self, wind):
+            self.middle = (0.0, 0.0)
+            self.wind = wind
+
+    # an agent that planned at planned_step for the wind of env; plan is what sailboat_control.plan records
+    class stub_agent:
+        def __init__(self, env, boat_id, planned_step=0):
+            self.env = env
+            self.boat_id = boat_id
+            self.believed_point = (0.0, 0.0)
+            self.mark_state = stub_mark_state(3)
+            self.cte = 0.0
+            self.replan = False
+            self.replan_legs = None
+            self.plan()
+            self.planned_step = planned_step
+
+        def cross_track_error(self):
+            return self.cte
+
+        def plan(self):
+            self.replan = False
+            self.replan_legs = None
+            self.planned_wind = self.env.wind
+            self.planned_mark_state = (self.mark_state.index, 0)
+            self.legs = [stub_leg(self.env.wind) for i in range(4)]
+
+    wind = (10.0, utilsmath.rad(90))
+    scheduler = replan_scheduler(2, utilsmath.rad(10), 2.0, 20.0, True)
+
+    print "Testing the triggers"
+    env = stub_env(wind)
+    agent = stub_agent(env, 0)
+    reasons = [scheduler.trigger(agent)]
+    agent.mark_state.index += 1
+    reasons.append(scheduler.trigger(agent))
+    agent.plan()
+    env.wind = (wind[0], wind[1] + utilsmath.rad(15))
+    reasons.append(scheduler.trigger(agent))
+    env.wind = (wind[0] + 3.0, wind[1])
+    reasons.append(scheduler.trigger(agent))
+    env.wind = (wind[0] + 1.0, wind[1] - utilsmath.rad(5))
+    reasons.append(scheduler.trigger(agent))
+    agent.cte = -25.0
+    reasons.append(scheduler.trigger(agent))
+    agent.mark_state.index = 10
+    reasons.append(scheduler.trigger(agent))
+    expected = [None, 'mark_rounded', 'wind', 'wind', None, 'cross_track_error', None]
+    triggers_passed = reasons == expected
+    print "  none, mark rounded, wind shift, wind speed, small change, cross track error, finished: {0}".format(
+        triggers_passed)
+    no_mark_rounded = stub_agent(env, 1)
+    no_mark_rounded.mark_state.index += 1
+    no_mark_passed = replan_scheduler(2, mark_rounded=False).trigger(no_mark_rounded) is None
+    print "  rounding a mark without mark_rounded doesn't trigger: {0}".format(no_mark_passed)
+
+    print "Testing changed legs"
+    env = stub_env(wind)
+    agent = stub_agent(env, 0)
+    agent.legs[1].wind = (wind[0], wind[1] + utilsmath.rad(20))
+    agent.legs[3].wind = (wind[0] + 1.0, wind[1])
+    changed_passed = scheduler.changed_legs(agent) == 2
+    agent.legs[3].wind = (wind[0] - 5.0, wind[1])
+    changed_passed = changed_passed and scheduler.changed_legs(agent) == 4
+    agent.legs = []
+    changed_passed = changed_passed and scheduler.changed_legs(agent) == 0
+    print "  up to the last leg with a changed wind: {0}".format(changed_passed)
+
+    print "Testing the budget"
+    env = stub_env(wind)
+    # boats 1, 2 and 4 planned first, boat 3 after them; boat 0 still has to make its first plan
+    agents = [stub_agent(env, boat_id, planned_step) for boat_id, planned_step in enumerate([0, -2, -2, -1, -2])]
+    agents[0].replan = True
+    env.wind = (wind[0], wind[1] + utilsmath.rad(15))
+    scheduler = replan_scheduler(2, utilsmath.rad(10), 2.0, 20.0, True)
+    order = []
+    legs_passed = True
+    for i in range(1, 5):
+        chosen = scheduler.schedule(agents, i)
+        order.append([agent.boat_id for agent in chosen])
+        for agent in agents:
+            if agent.replan:
+                # the chosen agents replan every leg: the wind changed along all of them
+                legs_passed = legs_passed and agent.planned_step == i and \
+                    agent.replan_legs == (4 if agent in chosen else None)
+                agent.plan()
+    # the stalest plans first, on a tie the lowest boat id; boat 0 made its first plan outside the budget
+    budget_passed = order == [[1, 2], [4, 3], [], []] and legs_passed
+    counters_passed = scheduler.triggered == {'wind': 4, 'cross_track_error': 0, 'mark_rounded': 0} and \
+        scheduler.deferred == 2
+    print "  at most budget agents, stalest plans first: {0}".format(budget_passed)
+    print "  deferred agents replan later, counters: {0}".format(counters_passed)
+    print
+    passed = triggers_passed and no_mark_passed and changed_passed and budget_passed and counters_passed
+    print "PASSED!" if passed else "FAILED!"
@@ -1,39 +1,81 @@
 #
 # Utility functions for reporting environment and boat statuses
 #
+# report formats the latest step of a trajectory_recorder (see recorder.py) as text; the recorder only
+# records the fields that are printed.
+#
 # Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
 #
 
+from math import *
 import sim_config
+import recorder
+
+_recorder = None
+
+
+# the fields report prints with the current sim_config display flags
+def report_fields():
+    fields = []
+    if sim_config.print_wind_change:
+        fields += ['goal_wind', 'wind_change']
+    if sim_config.print_env_data:
+        fields += ['wind']
+    if sim_config.print_boat_data:
+        fields += ['location', 'speed', 'heading', 'relative_wind_angle', 'rudder']
+    if sim_config.print_boat_belief:
+        fields += ['believed_location', 'believed_speed', 'believed_heading', 'measured_heading']
+    return fields
+
+
+# an in memory recorder for the printed fields, recreated when the display flags or the number of boats change
+def report_recorder(nr_of_boats):
+    global _recorder
+    fields = report_fields()
+    if _recorder is None or _recorder.fields != fields or _recorder.nr_of_boats != nr_of_boats:
+        _recorder = recorder.trajectory_recorder(nr_of_boats, fields, chunk_size=1)
+    return _recorder
+
+
+def location(row):
+    if isnan(row[0]):
+        return None
+    return float(row[0]), float(row[1])
+
 
 def report(env, boat_agents, i):
+    nr_of_boats = min(sim_config.nr_of_boats, len(boat_agents))
+    step_recorder = report_recorder(nr_of_boats)
+    step_recorder.record(env, boat_agents[:nr_of_boats], i)
+    values = step_recorder.last()
+
     print ' '
     print '---step', i, '---'
 
     # Printing environment and boats data
     if sim_config.print_wind_change:
         print ' '
-        print 'new goal wind', env.goal_wind
-        print 'wind change', (env.wind_speed_change, env.wind_direction_change)
+        print 'new goal wind', tuple(float(v) for v in values['goal_wind'])
+        print 'wind change', tuple(float(v) for v in values['wind_change'])
     if sim_config.print_env_data:
         print ' '
-        print 'wind', env.current_wind
+        print 'wind', tuple(float(v) for v in values['wind'])
     if sim_config.print_boat_data or sim_config.print_boat_belief:
-        for b_id in range(sim_config.nr_of_boats):
+        for b_id in range(nr_of_boats):
             print ' '
             print 'boat', b_id
             if sim_config.print_boat_data:
-                print 'real position', env.boats[b_id].location
-                print 'real speed', env.boats[b_id].speed
-                print 'real heading', env.boats[b_id].heading
-                print 'wind angle', env.boats[b_id].relative_wind_angle
-                print 'rudder', env.boats[b_id].rudder
+                print 'real position', location(values['location'][b_id])
+                print 'real speed', float(values['speed'][b_id][0])
+                print 'real heading', float(values['heading'][b_id][0])
+                print 'wind angle', float(values['relative_wind_angle'][b_id][0])
+                print 'rudder', float(values['rudder'][b_id][0])
             if sim_config.print_boat_belief:
                 print ' '
-                print 'bel. position', boat_agents[b_id].believed_location
-                print 'bel. speed', boat_agents[b_id].believed_speed
-                print 'bel. heading', boat_agents[b_id].believed_heading
-                print 'meas heading', boat_agents[b_id].measured_heading
+                print 'bel. position', location(values['believed_location'][b_id])
+                print 'bel. speed', float(values['believed_speed'][b_id][0])
+                print 'bel. heading', float(values['believed_heading'][b_id][0])
+                print 'meas heading', float(values['measured_heading'][b_id][0])
 
     print '---end step---'
 
@@ -45,4 +87,4 @@ def start():
 
 def end():
     print ' '
-    print 'Finished simulation'
\ No newline at end of file
+    print 'Finished simulation'
@@ -8,27 +8,87 @@
 #
 
 import utilsmath
-import matrix
+import kalman
 import sim_config
 import environment
-import scipy.optimize
+import tack_solver
+import localizer
+import timing
+import numpy as np
 from math import *
 import random
+import bisect
 random.seed(123)
 
-class sailboat_control:
 
-    def __init__(self, env):
+# tack_leg:
+#   the tacks planned from one way point (or the boat) to the next way point
+#   a leg depends only on its start point, the heading it starts with, its way point and the local wind, so a replan
+#   reuses every leg of the previous plan whose inputs are unchanged
+class tack_leg:
+    def __init__(self, way_point_index, start, prev_heading, middle, wind, tacks, heading):
+        self.way_point_index = way_point_index  # index into sailboat_control.course_way_points
+        self.start = start
+        self.prev_heading = prev_heading
+        self.middle = middle  # half way from start to the way point
+        self.wind = wind  # local wind at middle the leg was planned for
+        self.tacks = tacks  # intermediate tacks followed by the way point
+        self.heading = heading  # heading from start to the way point (the prev_heading of the next leg)
+
+
+# localize_fleet:
+#   localize all boat_agents with one batched filter step
+#   the agents must have been created with the same fleet_filter (see localizer.create_fleet)
+def localize_fleet(boat_agents, fleet_filter):
+    filtered = [boat_agent for boat_agent in boat_agents if boat_agent.measure()]
+    if filtered:
+        frame = filtered[0].frame
+        believed = np.array([boat_agent.believed_point for boat_agent in filtered])
+        velocity = np.array([(boat_agent.believed_speed, boat_agent.believed_heading) for boat_agent in filtered])
+        measured = np.array([boat_agent.measured_location for boat_agent in filtered])
+
+        # Convert to cartesian coordinates (measurements are polar)
+        c = frame.points_to_cartesian(believed)
+        states = np.column_stack((c[:, 0], c[:, 1],
+                                  velocity[:, 0]*np.cos(velocity[:, 1]), velocity[:, 0]*np.sin(velocity[:, 1])))
+        z = np.column_stack((measured[:, 0]*np.cos(measured[:, 1]), measured[:, 0]*np.sin(measured[:, 1])))
+
+        x = fleet_filter.step([boat_agent.filter_index for boat_agent in filtered], states, z)
+        points = frame.points_from_cartesian(x[:, 0:2])
+
+        for boat_agent, point in zip(filtered, points):
+            boat_agent.prev_believed_point = boat_agent.believed_point
+            boat_agent.believed_point = (float(point[0]), float(point[1]))
+            boat_agent.update_mark_state()
+
+    for boat_agent in boat_agents:
+        boat_agent.update_relative_wind_angle()
+
+
+class sailboat_control(object):
+
+    # --------
+    # init:
+    #   creates the boat agent and its true_sailboat in env
+    #       fleet_filter: fleet filter shared by all agents that are localized with localize_fleet (see
+    #                     localizer.create_fleet). If None, the agent runs its own localizer.
+    #
+    #   All points (believed location, way points, tacking) are kept in env's coordinate frame
+    #   (see coordinates.py); believed_location gives the polar view.
+    #
+    def __init__(self, env, fleet_filter=None):
         self.env = env
+        self.frame = env.frame
         self.boat_id = self.env.create_boat()
 
-        #self.believed_location = self.env.boats[self.boat_id].location  # Initial believed location
-        self.believed_location = 0.0, 0.0
+        self.believed_point = None  # Set from the true location on the first localize
         self.believed_heading = 0.0
         self.believed_speed = 0.0
 
-        self.prev_believed_location = None
+        self.prev_believed_point = None
 
+        self.measured = False  # set by sense: True if the believed location is to be updated from the measurements
+        self.sensed_rudder = None  # set by sense: the rudder measurement for igor_controls
         self.measured_location = (0.0, 0.0)
         self.measured_heading = 0.0
         self.measured_rudder = 0.0
@@ -37,30 +97,57 @@ class sailboat_control:
         self.relative_wind_angle = 0.0
         self.mark_state = environment.mark_state(2, 0)
         self.replan = True
+        self.replan_legs = None  # set by the scheduler: the wind changed only along the first replan_legs legs
+        self.course_way_points = None  # [((mark index, crossing index), way point)] of the whole course
+        self.legs = []  # tack_legs of the current plan
+        self.corners = []  # smoothed (p1, pavg, p2) of every inner tack of the current plan
+        self.planned_wind = None  # wind, mark state and step of the last plan (see replanner.py)
+        self.planned_mark_state = None
+        self.planned_step = 0
         self.last_cross_track_error = 0.0
         self.int_cross_track_error = 0.0
 
-        # Kalman filter variables
-        self.kalman_u = matrix.matrix([[0.0], [0.0], [0.0], [0.0]])  # external motion
-        self.kalman_P = matrix.matrix([[0., 0., 0., 0.], [0., 0., 0., 0.], [0., 0., 0.1, 0.], [0., 0., 0., 10.]])  # initial uncertainty
-        self.kalman_F = matrix.matrix([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]])  # next state function
-        self.kalman_H = matrix.matrix([[1., 0., 0., 0.], [0., 1., 0., 0.]])  # measurement function
-        self.kalman_R = matrix.matrix([[0.01, 0.], [0., 0.01]])  # measurement uncertainty
-        self.kalman_I = matrix.matrix([[1., 0., 0., 0.], [0., 1., 0., 0.], [0., 0., 1., 0.], [0., 0., 0., 1.]])  # identity matrix
+        # Kalman filter (constant velocity model, see kalman.py)
+        self.kalman_filter = kalman.kalman_filter(q=sim_config.kalman_process_noise,
+                                                  steady_state=sim_config.kalman_steady_state)
+        self.fleet_filter = fleet_filter
+        if fleet_filter is not None:
+            self.filter_index = fleet_filter.add_filter()
+        self.localizer = localizer.create(env) if fleet_filter is None else None  # see localizer.py
 
         self.igor_target_tack = 1
 
+    # believed_location: (radius, bearing)
+    @property
+    def believed_location(self):
+        if self.believed_point is None:
+            return 0.0, 0.0
+        return self.frame.location(self.believed_point)
+
+    @believed_location.setter
+    def believed_location(self, value):
+        self.believed_point = self.frame.point(value)
+
 
     # return (boom_adjust_angle, rudder_adjust_angle)
-    def boat_action(self):
-        self.localize()
+    #   localize: set to False if the agent has already been localized this step (see localize_fleet)
+    def boat_action(self, localize=True):
+        if localize:
+            t = timing.start()
+            self.localize()
+            timing.stop('boat_action.localize', t, self.boat_id)
         if self.replan:
-            self.plan()
+            t = timing.start()
+            self.plan(self.replan_legs)
+            timing.stop('boat_action.plan', t, self.boat_id)
 
+        t = timing.start()
         if sim_config.use_igor:
-            return self.igor_controls()
-
-        return self.controls()
+            controls = self.igor_controls()
+        else:
+            controls = self.controls()
+        timing.stop('boat_action.control', t, self.boat_id)
+        return controls
 
     def controls(self):
         projection_ratio, cross_track_error = self.__calculate_cte()
@@ -72,8 +159,8 @@ class sailboat_control:
             desired_rudder += -diff_cross_track_error * sim_config.cte_ratio[1]
             desired_rudder += -self.int_cross_track_error * sim_config.cte_ratio[2]
         else:
-            to_next_tack = utilsmath.sub_vectors_polar(self.tacking[self.tacking_index+1], self.tacking[self.tacking_index])
-            desired_heading = to_next_tack[1]
+            to_next_tack = self.frame.sub(self.tacking[self.tacking_index+1], self.tacking[self.tacking_index])
+            desired_heading = self.frame.angle(to_next_tack)
             #desired_rudder = desired_heading - self.believed_heading
             desired_rudder = desired_heading - self.measured_heading
 
@@ -100,19 +187,54 @@ class sailboat_control:
 
 
     def localize(self):
+        self.update_belief(self.measure())
+
+    # --------------
+    # sense/decide:
+    #   boat_action split in two: sense takes this step's measurements (all that draws from the environment's
+    #   random number generator, in the order boat_action draws them), decide localizes on them, plans and returns
+    #   the controls. decide only reads the environment, so the agents of a fleet can decide concurrently after
+    #   sensing one after the other (see decisions.py).
+    #       localize: False if the agent has already been localized this step (see localize_fleet)
+    #
+    def sense(self, localize=True):
+        if localize:
+            self.measured = self.measure()
+        if sim_config.use_igor:
+            self.sensed_rudder = self.env.boats[self.boat_id].measure_rudder()
+
+    def decide(self):
+        t = timing.start()
+        self.update_belief(self.measured)
+        timing.stop('boat_action.localize', t, self.boat_id)
+        return self.boat_action(localize=False)
+
+    # update the believed location from this step's measurements, if measured (see measure)
+    def update_belief(self, measured):
+        if measured:
+            self.prev_believed_point = self.believed_point
+            self.localizer.update(self)
+            self.update_mark_state()
+
+        self.update_relative_wind_angle()
+
+    # take this step's measurements
+    # return True if the believed location should be updated by the localizer
+    def measure(self):
         self.measured_location, self.measured_heading, self.measured_speed = self.env.boats[self.boat_id].provide_measurements()
         self.believed_heading = self.measured_heading
         self.believed_speed = self.measured_speed
         self.measured_rudder = self.env.boats[self.boat_id].measure_rudder()
 
-        if self.believed_location == (0.0, 0.0):
-            # Initial location - do not run Kalman
-            self.believed_location = self.env.boats[self.boat_id].location
-        else:
-            self.prev_believed_location = self.believed_location
-            self.kalman()
+        if self.believed_point is None:
+            # Initial location - do not run the localizer
+            self.believed_point = self.env.boats[self.boat_id].point
+            return False
+        return True
 
-        self.relative_wind_angle = utilsmath.normalize_angle(self.believed_heading - self.env.current_wind[1])
+    def update_relative_wind_angle(self):
+        self.relative_wind_angle = utilsmath.normalize_angle(self.believed_heading -
+                                                             self.env.wind_at(self.believed_point)[1])
 
 
     # calculate the projection onto the expected line segment and distance from that segment
@@ -120,9 +242,9 @@ class sailboat_control:
         if self.tacking_index + 1 >= len(self.tacking):
             return 0.0, 0.0
 
-        tack_start = utilsmath.polar_to_cartesian(self.tacking[self.tacking_index])
-        tack_end = utilsmath.polar_to_cartesian(self.tacking[self.tacking_index + 1])
-        xy_location = utilsmath.polar_to_cartesian(self.believed_location)
+        tack_start = self.frame.to_cartesian(self.tacking[self.tacking_index])
+        tack_end = self.frame.to_cartesian(self.tacking[self.tacking_index + 1])
+        xy_location = self.frame.to_cartesian(self.believed_point)
 
         segment_vec = [tack_end[0]-tack_start[0], tack_end[1]-tack_start[1]]
         segment_len = sqrt(segment_vec[0] ** 2 + segment_vec[1] ** 2)
@@ -152,50 +274,51 @@ class sailboat_control:
 
 
 
-    def __update_mark_state(self):
-        if self.prev_believed_location:
-            self.env.update_mark_state(self.prev_believed_location, self.believed_location, self.mark_state)
+    # advance the believed mark state over the crossings of the last believed step
+    def update_mark_state(self):
+        if self.prev_believed_point:
+            while not self.env.course_complete(self.mark_state) and \
+                    self.env.update_mark_state(self.prev_believed_point, self.believed_point, self.mark_state):
+                pass
+
+    # cross track error of the believed location from the tack the igor controls steer along
+    def cross_track_error(self):
+        return utilsmath.cross_track_error(self.frame.to_cartesian(self.believed_point),
+                                           self.frame.to_cartesian(self.tacking[self.igor_target_tack - 1]),
+                                           self.frame.to_cartesian(self.tacking[self.igor_target_tack]))
 
     def __way_point(self, mark, crossing):
         # is this the first entry of a course_mark
         if crossing[0] == 0:
-            delta = [sim_config.mark_buffer_distance, crossing[1]]
+            delta = self.frame.vector(sim_config.mark_buffer_distance, crossing[1])
         else:
-            delta = [crossing[0]/2.0, crossing[1]]
-        return utilsmath.add_vectors_polar([mark.radius, mark.angle], delta)
+            delta = self.frame.vector(crossing[0]/2.0, crossing[1])
+        return self.frame.add(mark.point, delta)
 
+    # the way points of the whole course only depend on the course, so they are calculated once;
+    # the way points still to go are the ones from the current mark state on
     def __calculate_way_points(self):
-        self.way_points = []
-        mark_index = self.mark_state.index
-        crossing_index = self.mark_state.crossing_index
-        while mark_index < len(self.env.course):
-            # get the mark
-            mark = self.env.course[mark_index]
-
-            # skip the mark if it has no crossings
-            if len(mark.crossings) == 0:
-                mark_index += 1
-                continue
-
-            # append the way point
-            crossing = mark.crossings[crossing_index]
-            self.way_points.append(self.__way_point(mark, crossing))
-
-            # advance to next crossing (advance mark if we have visited all of this mark's crossings)
-            crossing_index += 1
-            if crossing_index >= len(mark.crossings):
-                crossing_index = 0
-                mark_index += 1
+        if self.course_way_points is None:
+            self.course_way_points = []
+            for mark_index, mark in enumerate(self.env.course):
+                for crossing_index, crossing in enumerate(mark.crossings):
+                    self.course_way_points.append(((mark_index, crossing_index), self.__way_point(mark, crossing)))
+
+        self.first_way_point = bisect.bisect_left(self.course_way_points,
+                                                  ((self.mark_state.index, self.mark_state.crossing_index),))
+        self.way_points = [way_point for key, way_point in self.course_way_points[self.first_way_point:]]
 
     def plot_plan(self, plotter):
         last_way_point = self.believed_location
         for way_point in self.way_points:
+            way_point = self.frame.location(way_point)
             #self.env.plotter.line(last_way_point, way_point, color='magenta')
             plotter.line(last_way_point, way_point, color='magenta')
             last_way_point = way_point
 
         last_tack = self.believed_location
         for tack in self.tacking:
+            tack = self.frame.location(tack)
             #self.env.plotter.line(last_tack, tack, color='blue')
             plotter.line(last_tack, tack, color='blue')
             last_tack = tack
@@ -203,22 +326,9 @@ class sailboat_control:
 
     # find the angle on port or starboard side of desired angle that give the best speed
     # limit the angle to +/- pi/2
-    def __calculate_optimal_tack(self, to_port, desired_angle):
-
-        wind_angle = self.env.current_wind[1]
-
-        # this is our estimate of speed in the direction of desired_angle
-        # returns -speed to allow scipy to optimize (find minimum)
-        def directional_speed(delta_angle):
-            true_angle = delta_angle + desired_angle
-            stall_ratio = 0.05
-            speed_ratio = (1.0 + stall_ratio) * e**(-(abs(true_angle - wind_angle)**2)/2) - stall_ratio
-            directional_speed = cos(delta_angle) * speed_ratio
-            return -directional_speed
-
-        bounds = (0.0, pi/2.0) if to_port else (-pi/2.0, 0.0)
-        best_angle = scipy.optimize.minimize_scalar(directional_speed, bounds=bounds, method='bounded')
-        return utilsmath.normalize_angle(best_angle.x + desired_angle)
+    # solutions are cached by the shared tack_solver (see tack_solver.py)
+    def __calculate_optimal_tack(self, to_port, desired_angle, wind):
+        return tack_solver.default_solver().optimal_tack(to_port, desired_angle, wind)
 
 
     # choose the angle closest to the base angle
@@ -233,16 +343,21 @@ class sailboat_control:
 
     # find intermediate points between way_points
     # we want to make sure we start and end close to the desired direction
-    def __calculate_intermediates(self, last_location, to_waypoint, prev_heading, next_heading):
+    #   wind: the local wind along the way
+    def __calculate_intermediates(self, last_location, to_waypoint, prev_heading, next_heading, wind):
+        if sim_config.tack_optimizer == 'joint':
+            return self.__calculate_joint_intermediates(last_location, to_waypoint, prev_heading, next_heading, wind)
+
         # check optimal angle on port/starboard side of desired direction to next way_point
-        port_optimal_angle = self.__calculate_optimal_tack(True, to_waypoint[1])
-        starboard_optimal_angle = self.__calculate_optimal_tack(False, to_waypoint[1])
+        to_waypoint_angle = self.frame.angle(to_waypoint)
+        port_optimal_angle = self.__calculate_optimal_tack(True, to_waypoint_angle, wind)
+        starboard_optimal_angle = self.__calculate_optimal_tack(False, to_waypoint_angle, wind)
 
         # Only tack if one of the optimal angles isn't straight to waypoint
         # There might be a more optimal route if we tack on the optimal in one direction and then
         # use sub-optimal in the other direction, but for now just keep it simple.
-        is_port_close = self.__is_angle_close(port_optimal_angle, to_waypoint[1], utilsmath.rad(1))
-        is_starboard_close = self.__is_angle_close(starboard_optimal_angle, to_waypoint[1], utilsmath.rad(1))
+        is_port_close = self.__is_angle_close(port_optimal_angle, to_waypoint_angle, utilsmath.rad(1))
+        is_starboard_close = self.__is_angle_close(starboard_optimal_angle, to_waypoint_angle, utilsmath.rad(1))
         if is_port_close or is_starboard_close:
             return []
 
@@ -257,58 +372,143 @@ class sailboat_control:
 
         v1 = utilsmath.polar_to_cartesian([1.0, start_tack])
         v2 = utilsmath.polar_to_cartesian([1.0, middle_tack1])
-        to_w = utilsmath.polar_to_cartesian(to_waypoint)
+        to_w = self.frame.to_cartesian(to_waypoint)
         a = utilsmath.solve2dLinear(v1[0], v2[0], v1[1], v2[1], to_w[0], to_w[1])
 
-        v0 = utilsmath.polar_to_cartesian(last_location)
+        v0 = self.frame.to_cartesian(last_location)
 
         # if we end our turn at a different angle than we start than we just need to tack once
         if start_tack != last_tack:
-            return [utilsmath.cartesian_to_polar((a[0]*v1[0] + v0[0], a[0]*v1[1] + v0[1]))]
+            return [self.frame.from_cartesian((a[0]*v1[0] + v0[0], a[0]*v1[1] + v0[1]))]
         # if we end our turn at the same angle than we need to tack twice, so that we end up with a heading
         # closest to the next desired heading
         else:
             # use the midpoint of the v1 to tack, sail v2 fully, then tack back to the remainder of v1
             point1 = (a[0]*v1[0]*0.5 + v0[0], a[0]*v1[1]*0.5 + v0[1])
             point2 = (a[1]*v2[0] + point1[0], a[0]*v2[1] + point1[1])
-            return [utilsmath.cartesian_to_polar(point1), utilsmath.cartesian_to_polar(point2)]
+            return [self.frame.from_cartesian(point1), self.frame.from_cartesian(point2)]
+
+    # find intermediate points between way_points with the pair of tack angles that reaches the way point fastest
+    # (see tack_solver.joint_tacks) instead of the best tack on each side; no tacks if sailing straight is fastest.
+    # Only the angles are optimized: the distance sailed on each tack is fixed by them, and the speed model has no
+    # cost per tack, so how the distances are split up doesn't change the time. Like __calculate_intermediates,
+    # start on the tack closest to prev_heading (so the boat carries on through the gate of the way point it comes
+    # from) and end on the tack closest to next_heading: one tack if they differ, else two, with the start tack
+    # split in halves around the middle one
+    def __calculate_joint_intermediates(self, last_location, to_waypoint, prev_heading, next_heading, wind):
+        to_waypoint_angle = self.frame.angle(to_waypoint)
+        port_delta, starboard_delta = tack_solver.default_solver().joint_tacks(to_waypoint_angle, wind)[:2]
+        if self.__is_angle_close(port_delta, 0.0, utilsmath.rad(1)) or \
+                self.__is_angle_close(starboard_delta, 0.0, utilsmath.rad(1)):
+            return []
+
+        port_angle = utilsmath.normalize_angle(to_waypoint_angle + port_delta)
+        starboard_angle = utilsmath.normalize_angle(to_waypoint_angle + starboard_delta)
+        start_tack, middle_tack = self.__choose_angles(prev_heading, port_angle, starboard_angle)
+        last_tack = self.__choose_angles(next_heading, port_angle, starboard_angle)[0]
+
+        # the distances sailed on each tack add up to to_waypoint
+        to_w = self.frame.to_cartesian(to_waypoint)
+        distance = sqrt(to_w[0]**2 + to_w[1]**2)
+        port_distance = -sin(starboard_delta) / sin(port_delta - starboard_delta) * distance
+        starboard_distance = sin(port_delta) / sin(port_delta - starboard_delta) * distance
+        start_distance, middle_distance = (port_distance, starboard_distance) if start_tack == port_angle else \
+            (starboard_distance, port_distance)
+        v0 = self.frame.to_cartesian(last_location)
+        v1 = utilsmath.polar_to_cartesian([start_distance, start_tack])
+        v2 = utilsmath.polar_to_cartesian([middle_distance, middle_tack])
+        if start_tack != last_tack:
+            return [self.frame.from_cartesian((v0[0] + v1[0], v0[1] + v1[1]))]
+        # sail half of the start tack, all of the middle one, then tack back for the other half
+        point1 = (v0[0] + v1[0]*0.5, v0[1] + v1[1]*0.5)
+        point2 = (point1[0] + v2[0], point1[1] + v2[1])
+        return [self.frame.from_cartesian(point1), self.frame.from_cartesian(point2)]
              
 
     # micro planning (tacking)
-    def __calculate_tacking(self):
-        last_location = self.believed_location
-        self.tacking = [self.believed_location]
+    # legs of the previous plan are reused where their inputs are unchanged; the inputs of a leg follow from the
+    # previous leg, so once one leg is reused the rest of the previous plan is spliced in as is
+    #   local_legs: the wind changed only along the first local_legs legs of the previous plan; later legs may keep
+    #               tacks planned for an older wind. None requires every leg to be planned for the current wind.
+    # return the number of tacks at the end of the tacking that were reused
+    def __calculate_tacking(self, local_legs=None):
+        previous = dict((leg.way_point_index, i) for i, leg in enumerate(self.legs))
+        legs = []
+        reused = []
+
+        last_location = self.believed_point
         prev_heading = self.believed_heading
         for i in range(len(self.way_points)):
             way_point = self.way_points[i]
 
-            to_waypoint = utilsmath.sub_vectors_polar(way_point, last_location)
+            to_waypoint = self.frame.sub(way_point, last_location)
+            to_waypoint_angle = self.frame.angle(to_waypoint)
             if i+1 < len(self.way_points):
-                ignore, next_heading = utilsmath.sub_vectors_polar(self.way_points[i+1], way_point)
+                next_heading = self.frame.angle(self.frame.sub(self.way_points[i+1], way_point))
                 # if next_heading is close enough to the direction we are already going, skip this way_point
-                if self.__is_angle_close(to_waypoint[1], next_heading, utilsmath.rad(10)):
+                if self.__is_angle_close(to_waypoint_angle, next_heading, utilsmath.rad(10)):
                     # don't append anything to tacking list or update loop variables since we are skipping this waypoint
                     continue
             else:
-                next_heading = to_waypoint[1]
-
-            intermediates = self.__calculate_intermediates(last_location, to_waypoint, prev_heading, next_heading)
-            
-            # add intermediates to tacking list
-            self.tacking += intermediates
-            self.tacking.append(way_point)
+                next_heading = to_waypoint_angle
+
+            # reuse the rest of the previous plan from this leg on if it starts the same way
+            cached = previous.get(self.first_way_point + i)
+            if cached is not None and self.legs[cached].start == last_location and \
+                    self.legs[cached].prev_heading == prev_heading:
+                rest = self.legs[cached:]
+                near = rest if local_legs is None else self.legs[cached:local_legs]
+                if self.__same_wind(near):
+                    reused = rest
+                    break
+
+            # plan the leg for the wind half way
+            start = self.frame.to_cartesian(last_location)
+            end = self.frame.to_cartesian(way_point)
+            middle = self.frame.from_cartesian(((start[0] + end[0]) / 2.0, (start[1] + end[1]) / 2.0))
+            wind = self.env.wind_at(middle)
+            intermediates = self.__calculate_intermediates(last_location, to_waypoint, prev_heading, next_heading,
+                                                           wind)
+            legs.append(tack_leg(self.first_way_point + i, last_location, prev_heading, middle, wind,
+                                 intermediates + [way_point], to_waypoint_angle))
 
             # update loop variables
             last_location = way_point
-            prev_heading = to_waypoint[1]
-
-    def __smooth_tacking(self):
+            prev_heading = to_waypoint_angle
+
+        self.legs = legs + reused
+        self.tacking = [self.believed_point]
+        for leg in self.legs:
+            self.tacking += leg.tacks
+        return sum(len(leg.tacks) for leg in reused)
+
+    # True if the wind half way along every leg in legs is still the wind the leg was planned for
+    def __same_wind(self, legs):
+        if not legs:
+            return True
+        speeds, directions = self.env.winds(np.array([leg.middle for leg in legs]))
+        return np.array_equal(np.column_stack((speeds, directions)), np.array([leg.wind for leg in legs], dtype=float))
+
+    # reused: number of tacks at the end of the tacking that are the same as at the end of the previous tacking;
+    # their corners are taken from the previous smoothing
+    def __smooth_tacking(self, reused=0):
+        n = len(self.tacking)
+        previous = self.corners
+        offset = len(previous) - (n - 2)
+        self.corners = []
         smoothed = [self.tacking[0]]
-        prev_point = utilsmath.polar_to_cartesian(self.tacking[0])
-        for i in range(1, len(self.tacking)-1):
+        prev_point = self.frame.to_cartesian(self.tacking[0])
+        for i in range(1, n-1):
+            if i > n - reused and i - 1 + offset < len(previous):
+                # this corner and both its neighbors are unchanged
+                self.corners += previous[i - 1 + offset:]
+                for corner in previous[i - 1 + offset:]:
+                    smoothed += corner
+                break
+
             # smooth the corners just a bit
-            this_point = utilsmath.polar_to_cartesian(self.tacking[i])
-            next_point = utilsmath.polar_to_cartesian(self.tacking[i+1])
+            this_point = self.frame.to_cartesian(self.tacking[i])
+            next_point = self.frame.to_cartesian(self.tacking[i+1])
             v1 = [this_point[0] - prev_point[0], this_point[1] - prev_point[1]]
             v2 = [next_point[0] - this_point[0], next_point[1] - this_point[1]]
             v1_len = sqrt(v1[0]**2 + v1[1]**2)
@@ -322,9 +522,9 @@ class sailboat_control:
 
             # add an average point of all three
             pavg = [(this_point[0] + p1[0] + p2[0]) / 3.0, (this_point[1] + p1[1] + p2[1]) / 3.0]
-            smoothed.append(utilsmath.cartesian_to_polar(p1))
-            smoothed.append(utilsmath.cartesian_to_polar(pavg))
-            smoothed.append(utilsmath.cartesian_to_polar(p2))
+            corner = (self.frame.from_cartesian(p1), self.frame.from_cartesian(pavg), self.frame.from_cartesian(p2))
+            self.corners.append(corner)
+            smoothed += corner
 
             prev_point = this_point
 
@@ -333,52 +533,56 @@ class sailboat_control:
 
 
 
-    def plan(self):
-        self.__update_mark_state()
+    # plan (or replan) the way points and tacking from the believed location to the finish
+    # only the legs whose inputs changed since the last plan are recalculated (see __calculate_tacking)
+    #   local_legs: the wind changed only along the first local_legs legs of the previous plan (see
+    #               replanner.changed_legs)
+    def plan(self, local_legs=None):
         self.__calculate_way_points()
-        self.__calculate_tacking()
+        if not self.legs and len(self.way_points) >= sim_config.tack_precompute_min_way_points:
+            # solve all tack angles for the current wind at once, the tacking is then just lookups
+            tack_solver.default_solver().precompute(self.env.wind_at(self.believed_point)[0],
+                                                    sim_config.tack_optimizer == 'joint')
+        reused = self.__calculate_tacking(local_legs)
         # smoothing is minor but helps enough for some cases that were going off the rails!
-        self.__smooth_tacking()
+        self.__smooth_tacking(reused)
         # reset tacking index
         self.tacking_index = 0
+        self.igor_target_tack = 1
         self.replan = False
+        self.replan_legs = None
+        self.planned_wind = self.env.wind_at(self.believed_point)
+        self.planned_mark_state = (self.mark_state.index, self.mark_state.crossing_index)
 
     def kalman(self):
 
-        # Convert polar coordinates to cartesian
-        c = utilsmath.polar_to_cartesian(self.believed_location)
+        # Convert to cartesian coordinates (velocity and measurements are polar)
+        c = self.frame.to_cartesian(self.believed_point)
         v = utilsmath.polar_to_cartesian((self.believed_speed, self.believed_heading))
         m = utilsmath.polar_to_cartesian(self.measured_location)
 
-        x = matrix.matrix([[c[0]], [c[1]], [v[0]], [v[1]]])
+        # prediction and measurement update
+        x = self.kalman_filter.step(c[0], c[1], v[0], v[1], m[0], m[1])
 
-        # prediction
-        x = (self.kalman_F * x) + self.kalman_u
-        self.kalman_P = self.kalman_F * self.kalman_P * self.kalman_F.transpose()
-
-        # measurement update
-        Z = matrix.matrix([[m[0]], [m[1]]])
-        y = Z - (self.kalman_H * x)
-        S = self.kalman_H * self.kalman_P * self.kalman_H.transpose() + self.kalman_R
-        K = self.kalman_P * self.kalman_H.transpose() * S.inverse()
-        x = x + (K * y)
-        self.kalman_P = (self.kalman_I - (K * self.kalman_H)) * self.kalman_P  # prediction
-
-        self.believed_location = (utilsmath.cartesian_to_polar((x.value[0][0], x.value[1][0])))
+        self.believed_point = self.frame.from_cartesian((x[0], x[1]))
         #self.believed_speed, self.believed_heading = utilsmath.cartesian_to_polar((x.value[2][0], x.value[3][0]))
 
 
     def igor_controls(self):
         # Check if you are close enough to the target tack point. If so, switch to the next tack point.
-        tack_point_distance = utilsmath.distance_polar(self.believed_location, self.tacking[self.igor_target_tack])
-        while tack_point_distance < 2.0:
+        tack_point_distance = self.frame.distance(self.believed_point, self.tacking[self.igor_target_tack])
+        # stay on the last tack point once we get there
+        while tack_point_distance < 2.0 and self.igor_target_tack < len(self.tacking) - 1:
             self.igor_target_tack += 1
-            tack_point_distance = utilsmath.distance_polar(self.believed_location, self.tacking[self.igor_target_tack])
+            tack_point_distance = self.frame.distance(self.believed_point, self.tacking[self.igor_target_tack])
 
-        dir = utilsmath.sub_vectors_polar(self.tacking[self.igor_target_tack], self.believed_location)
-        desired_rudder = utilsmath.normalize_angle(dir[1] - self.believed_heading)
+        dir = self.frame.sub(self.tacking[self.igor_target_tack], self.believed_point)
+        desired_rudder = utilsmath.normalize_angle(self.frame.angle(dir) - self.believed_heading)
 
-        self.measured_rudder = self.env.boats[self.boat_id].measure_rudder()
+        if self.sensed_rudder is not None:
+            self.measured_rudder, self.sensed_rudder = self.sensed_rudder, None
+        else:
+            self.measured_rudder = self.env.boats[self.boat_id].measure_rudder()
 
         rudder_delta = desired_rudder - self.measured_rudder
 
@@ -396,3 +600,130 @@ class sailboat_control:
         boom = 0.0
 
         return boom, rudder_delta
+
+
+# if sailboat_control.py is run as a script, check the tack points of the joint tack optimizer and that incremental
+# replans give the tacking of a full plan, and time them
+if __name__ == '__main__':
+    sim_config.print_boat_data = False
+    agent = sailboat_control(environment.environment(random.Random(1)))
+    frame = agent.frame
+    wind = (15.0, utilsmath.rad(20))
+    upwind = utilsmath.normalize_angle(wind[1] + pi + utilsmath.rad(10))
+    port_delta, starboard_delta = tack_solver.default_solver().joint_tacks(upwind, wind)[:2]
+    port_angle = utilsmath.normalize_angle(upwind + port_delta)
+    starboard_angle = utilsmath.normalize_angle(upwind + starboard_delta)
+
+    # legs (distance, heading) from start through the tack points to start + to_waypoint (cartesian)
+    def legs(start, to_waypoint, tacks):
+        points = [frame.to_cartesian(point) for point in [start] + tacks]
+        end = frame.to_cartesian(start)
+        end = (end[0] + to_waypoint[0], end[1] + to_waypoint[1])
+        return [utilsmath.cartesian_to_polar((b[0] - a[0], b[1] - a[1])) for a, b in zip(points, points[1:] + [end])]
+
+    print "Testing the joint tack points"
+    passed = True
+    start = frame.point((30.0, 1.0))
+    distance = 40.0
+    to_waypoint = utilsmath.polar_to_cartesian((distance, upwind))
+    port_distance = -sin(starboard_delta) / sin(port_delta - starboard_delta) * distance
+    starboard_distance = sin(port_delta) / sin(port_delta - starboard_delta) * distance
+    for prev_heading, next_heading, headings in [(port_angle, starboard_angle, [port_angle, starboard_angle]),
+                                                 (starboard_angle, port_angle, [starboard_angle, port_angle]),
+                                                 (port_angle, port_angle, [port_angle, starboard_angle, port_angle]),
+                                                 (starboard_angle, starboard_angle,
+                                                  [starboard_angle, port_angle, starboard_angle])]:
+        tacks = agent._sailboat_control__calculate_joint_intermediates(
+            start, frame.vector(distance, upwind), prev_heading, next_heading, wind)
+        sailed = legs(start, to_waypoint, tacks)
+        # every leg on the expected tack, and the legs on each tack add up to its distance
+        on_tacks = len(sailed) == len(headings) and \
+            all(abs(utilsmath.normalize_angle(leg[1] - heading)) < 1e-6 for leg, heading in zip(sailed, headings))
+        on_port = sum(leg[0] for leg, heading in zip(sailed, headings) if heading == port_angle)
+        on_starboard = sum(leg[0] for leg, heading in zip(sailed, headings) if heading == starboard_angle)
+        add_up = abs(on_port - port_distance) < 1e-6 and abs(on_starboard - starboard_distance) < 1e-6
+        print "  {0} tacks: on the expected headings {1}, distances add up {2}".format(len(tacks), on_tacks, add_up)
+        passed = passed and on_tacks and add_up
+
+    # downwind the boat sails straight
+    straight = agent._sailboat_control__calculate_joint_intermediates(
+        start, frame.vector(distance, wind[1]), wind[1], wind[1], wind) == []
+    print "  downwind: no tacks {0}".format(straight)
+    passed = passed and straight
+    print
+
+    # an incremental replan has to give the tacking of a full plan by a new agent in the same place
+    import timeit
+    import replanner
+
+    def full_plan(agent):
+        fresh = sailboat_control(agent.env)
+        fresh.believed_point = agent.believed_point
+        fresh.believed_heading = agent.believed_heading
+        fresh.mark_state = environment.mark_state(agent.mark_state.index, agent.mark_state.crossing_index)
+        fresh.plan()
+        return fresh
+
+    def same_plan(agent, fresh):
+        return len(agent.tacking) == len(fresh.tacking) and len(agent.corners) == len(fresh.corners) and \
+            np.allclose(agent.tacking, fresh.tacking) and np.allclose(np.array(agent.corners), np.array(fresh.corners))
+
+    print "Testing incremental replanning"
+    sim_config.wind_field = 'puffs'
+    env = environment.environment(random.Random(2))
+    agent = sailboat_control(env)
+    agent.measure()
+    agent.plan()
+
+    # the boat sailed half of its first tack
+    start_legs, start_corners = agent.legs, agent.corners
+    start = frame.to_cartesian(agent.tacking[0])
+    first_tack = frame.to_cartesian(agent.tacking[1])
+    agent.believed_point = frame.from_cartesian(((start[0] + first_tack[0]) / 2.0, (start[1] + first_tack[1]) / 2.0))
+    agent.plan()
+    moved = same_plan(agent, full_plan(agent))
+
+    def replan():
+        agent.legs, agent.corners = start_legs, start_corners
+        agent.plan()
+
+    def plan():
+        agent.legs, agent.corners = [], []
+        agent.plan()
+
+    # time the replan after the move the way the boat would run it, and a full plan from the same place
+    times = [(name, min(timeit.repeat(run, number=100, repeat=3)) / 100)
+             for name, run in [('incremental', replan), ('full', plan)]]
+
+    # the boat rounded the next mark
+    agent.believed_point = agent.way_points[0]
+    agent.mark_state = environment.mark_state(*agent.course_way_points[agent.first_way_point + 1][0])
+    agent.plan()
+    rounded = same_plan(agent, full_plan(agent))
+    print "  after moving: {0}, after rounding a mark: {1}".format(moved, rounded)
+
+    # a strong puff over the first leg: a full replan for the new wind, or a replan of the legs the scheduler found
+    # changed that keeps the others
+    field = env.wind_field
+    ny, nx = field.grid.shape[2:]
+    g = (np.array(frame.to_cartesian(agent.legs[0].middle)) - field.offset - field.origin) / field.cell_size
+    x, y = np.meshgrid(np.arange(nx) - g[0], np.arange(ny) - g[1])
+    field.grid = field.grid + np.array([0.0, 8.0])[:, np.newaxis, np.newaxis] * np.exp(-(x**2 + y**2) / 8.0)
+    scheduler = replanner.replan_scheduler(1)
+    local_legs = scheduler.changed_legs(agent)
+    legs, corners = agent.legs, agent.corners
+    agent.plan()
+    shifted = same_plan(agent, full_plan(agent))
+    agent.legs, agent.corners = legs, corners
+    agent.plan(local_legs)
+    local = 0 < local_legs < len(legs) and agent.legs[-1] is legs[-1] and scheduler.changed_legs(agent) == 0
+    print "  after a wind change: {0}, only the {1} of {2} legs in the puff replanned: {3}".format(
+        shifted, local_legs, len(legs), local)
+    passed = passed and moved and rounded and shifted and local
+    print
+
+    print "Benchmark (replanning after moving)"
+    for name, seconds in times:
+        print "  {0:12}: {1:.3f} ms".format(name, seconds * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"
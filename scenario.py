@@ -0,0 +1,188 @@
+#
+# Scenarios
+#
+# A scenario pins down the inputs of a run: the course (marks and crossings) and start heading, the prevailing wind,
+# the wind settings and the wind field, the number of boats and steps, and the seed and state of the random number
+# generator right after the environment was created. It is saved as a directory with the settings (scenario.json),
+# the course arrays and generator state (scenario.npz) and the wind field, if any (wind_field/, see windfield.py).
+# Building the environment of a loaded scenario skips generating the course and the wind field, and the run
+# continues exactly like the run the scenario was taken from, on any machine:
+#
+#   python headless.py --seed 123 --boats 10 --save-scenario scenarios/race123
+#   python headless.py --scenario scenarios/race123
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import os
+import json
+import random
+import numpy as np
+
+import sim_config
+import environment
+import course_geometry
+import windfield
+
+format_version = 1
+
+# sim_config settings a scenario keeps, and its environment uses instead of sim_config's (see environment.py)
+settings = ['wind_speed_sigma', 'wind_direction_sigma', 'wind_change_rate', 'course_range', 'num_course_marks']
+
+# course_geometry arrays saved in scenario.npz
+course_arrays = ['radius', 'angle', 'to_port', 'crossing_mark', 'crossing_length', 'crossing_angle']
+
+
+class scenario:
+
+    # --------
+    # init:
+    #   creates the scenario
+    #       course: course_geometry.course_geometry
+    #       start_heading: heading of the boats at the start
+    #       wind_prevailing: (speed, direction) of the prevailing wind
+    #       wind_field: windfield.wind_field in its initial state, or None
+    #       nr_of_boats, steps: size of the run
+    #       seed: seed the scenario was generated from (only for reference)
+    #       rng_state: state of the environment's random number generator after creating the environment
+    #       config: values of the sim_config settings (see settings above)
+    #
+    def __init__(self, course, start_heading, wind_prevailing, wind_field, nr_of_boats, steps, seed, rng_state,
+                 config):
+        self.course = course
+        self.start_heading = start_heading
+        self.wind_prevailing = tuple(wind_prevailing)
+        self.wind_field = wind_field
+        self.nr_of_boats = nr_of_boats
+        self.steps = steps
+        self.seed = seed
+        self.rng_state = rng_state
+        self.config = config
+
+    # -----------------
+    # from_environment:
+    #   the scenario of env, a freshly created environment (no boats yet, no steps taken)
+    #
+    @classmethod
+    def from_environment(cls, env, nr_of_boats=None, steps=None, seed=None):
+        return cls(env.course, env.start_heading, env.wind_prevailing,
+                   env.wind_field.copy() if env.wind_field is not None else None,
+                   nr_of_boats if nr_of_boats is not None else sim_config.nr_of_boats,
+                   steps if steps is not None else sim_config.max_nr_of_steps,
+                   seed, env.rng.getstate(), dict((name, getattr(sim_config, name)) for name in settings))
+
+    # ---------
+    # generate:
+    #   the scenario of a new environment with random.Random(seed) and the current sim_config
+    #
+    @classmethod
+    def generate(cls, seed, nr_of_boats=None, steps=None):
+        return cls.from_environment(environment.environment(random.Random(seed)), nr_of_boats, steps, seed)
+
+    # -------------------
+    # create_environment:
+    #   return a new environment.environment in the scenario's initial state, with the scenario's settings (sim_config
+    #   is left as it is; the number of boats and steps are up to the race, see headless.race)
+    #
+    def create_environment(self):
+        rng = random.Random()
+        rng.setstate(self.rng_state)
+        return environment.environment(rng, scenario=self)
+
+    # the course and the wind field for a new environment (they keep per environment state, the arrays are shared)
+    def course_geometry(self):
+        return course_geometry.course_geometry(*[getattr(self.course, name) for name in course_arrays])
+
+    def new_wind_field(self):
+        return self.wind_field.copy() if self.wind_field is not None else None
+
+    def save(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        arrays = dict((name, getattr(self.course, name)) for name in course_arrays)
+        version, state, gauss_next = self.rng_state
+        arrays['rng_state'] = np.array(state, dtype=np.uint64)
+        np.savez(os.path.join(path, 'scenario.npz'), **arrays)
+        if self.wind_field is not None:
+            self.wind_field.save(os.path.join(path, 'wind_field'))
+        with open(os.path.join(path, 'scenario.json'), 'w') as f:
+            json.dump({'format': format_version,
+                       'seed': self.seed,
+                       'rng_version': version,
+                       'rng_gauss_next': gauss_next,
+                       'nr_of_boats': self.nr_of_boats,
+                       'steps': self.steps,
+                       'start_heading': self.start_heading,
+                       'wind_prevailing': self.wind_prevailing,
+                       'wind_field': 'wind_field' if self.wind_field is not None else None,
+                       'settings': self.config}, f, indent=2, sort_keys=True)
+
+
+# load:
+#   load a scenario saved with scenario.save
+#
+def load(path):
+    with open(os.path.join(path, 'scenario.json')) as f:
+        saved = json.load(f)
+    if saved['format'] != format_version:
+        raise ValueError('unsupported scenario format: {0}'.format(saved['format']))
+
+    arrays = np.load(os.path.join(path, 'scenario.npz'))
+    course = course_geometry.course_geometry(*[arrays[name] for name in course_arrays])
+    wind_field = None
+    if saved['wind_field'] is not None:
+        wind_field = windfield.wind_field.load(os.path.join(path, saved['wind_field']))
+    rng_state = (saved['rng_version'], tuple(int(word) for word in arrays['rng_state']), saved['rng_gauss_next'])
+    config = dict((str(name), value) for name, value in saved['settings'].items())
+    return scenario(course, saved['start_heading'], saved['wind_prevailing'], wind_field, saved['nr_of_boats'],
+                    saved['steps'], saved['seed'], rng_state, config)
+
+
+# if scenario.py is run as a script, check that runs from saved scenarios repeat the runs they were taken from
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    import timeit
+    import headless
+
+    sim_config.print_boat_data = False
+    path = tempfile.mkdtemp()
+    passed = True
+    print "Testing runs from saved scenarios"
+    for wind_field in [None, 'puffs']:
+        sim_config.wind_field = wind_field
+        identical = 0
+        for seed in range(5):
+            expected = headless.run(200, 3, seed)
+            scenario.generate(seed, 3, 200).save(path)
+            actual = headless.run(scenario=load(path))
+            identical += expected['boats'] == actual['boats'] and expected['steps'] == actual['steps']
+        print "  wind field {0}: {1} of 5 runs identical".format(wind_field, identical)
+        passed = passed and identical == 5
+    sim_config.wind_field = None
+
+    # a scenario with other settings than sim_config's runs with its own, and leaves sim_config as it is
+    defaults = dict((name, getattr(sim_config, name)) for name in settings + ['nr_of_boats', 'max_nr_of_steps'])
+    sim_config.wind_speed_sigma, sim_config.wind_direction_sigma, sim_config.wind_change_rate = 2.0, 0.3, 50
+    sim_config.course_range = 150
+    expected = headless.run(200, 3, 7)
+    scenario.generate(7, 3, 200).save(path)
+    for name, value in defaults.items():
+        setattr(sim_config, name, value)
+    actual = headless.run(scenario=load(path))
+    own_settings = expected['boats'] == actual['boats'] and expected['steps'] == actual['steps']
+    unchanged = all(getattr(sim_config, name) == value for name, value in defaults.items())
+    print "  other settings than sim_config: run identical {0}, sim_config unchanged {1}".format(own_settings, unchanged)
+    passed = passed and own_settings and unchanged
+    print
+
+    print "Benchmark (creating an environment with a 10000 mark course)"
+    sim_config.num_course_marks = 10000
+    scenario.generate(1).save(path)
+    generated = min(timeit.repeat(lambda: environment.environment(random.Random(1)), number=10, repeat=3)) / 10
+    loaded = min(timeit.repeat(lambda: load(path).create_environment(), number=10, repeat=3)) / 10
+    print "  generated: {0:.3f} ms, loaded: {1:.3f} ms".format(generated * 1000, loaded * 1000)
+    shutil.rmtree(path)
+    print
+    print "PASSED!" if passed else "FAILED!"
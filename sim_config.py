@@ -14,6 +14,11 @@ import utilsmath
 max_nr_of_steps = 300  # Maximum number of steps simulation is allowed to run
 
 
+# --------
+# Internal state
+cartesian_state = True  # Keep points as (x, y) internally and convert to polar only for plotting/reporting (see coordinates.py)
+
+
 # --------
 # Display
 #
@@ -22,6 +27,11 @@ print_boat_belief = True
 print_env_data = True
 print_wind_change = False
 plot_crossings = False
+timing = False  # Accumulate wall time per phase of the step loop and print a summary at the end (see timing.py)
+#
+# Recording (see recorder.py)
+record_fields = None  # Names of the fields recorded by recorder.trajectory_recorder, None records all of them
+record_chunk_size = 1024  # Steps buffered in memory between flushes to disk
 
 
 # --------
@@ -33,9 +43,50 @@ nr_of_boats = 1
 max_rudder = utilsmath.rad(85)
 cte_ratio = (utilsmath.rad(5.0), utilsmath.rad(10.0), 0.0)
 use_igor = True
+decision_workers = 1  # Threads the agents decide on each step (see decisions.py); 1 decides one agent after the other
+#
+# Localization
+kalman_process_noise = 0.0  # Variance of the change of the boat's velocity per step assumed by the Kalman filters
+kalman_steady_state = False  # Freeze the Kalman gain once it converges (skips covariance updates); needs process noise
+batch_localization = False  # headless.py: run the Kalman filters of all boats in one batched step
+localizer = 'kalman'  # 'kalman' or 'particle' (see localizer.py)
+particle_count = 1000  # Particles per boat of the particle filter
+particle_motion_sigma = 0.02  # Position noise added to every particle per step, next to the speed error's
+particle_init_sigma = 0.05  # Spread of the particles around the first believed location
+particle_resample_ratio = 0.5  # Resample when the effective number of particles drops below this share
+#
+# Polar diagram (boat speed table, see polar.py)
+polar_table_file = None  # Set to a .npz file saved by polar.polar_table.save to load the table instead of building it
+polar_angle_step = utilsmath.rad(1)  # Table resolution in relative wind angle
+polar_max_wind_speed = 40  # Table covers wind speeds 0..polar_max_wind_speed (extrapolated beyond)
+#
+# Tack solver (cached optimal tack angles, see tack_solver.py)
+tack_angle_resolution = utilsmath.rad(0.1)  # Quantization of the desired heading relative to the wind
+tack_wind_resolution = 0.5  # Quantization of the wind speed
+tack_cache_size = 100000  # Maximum number of cached solutions
+tack_precompute_min_way_points = 20  # Courses with at least this many way points precompute all tack angles
+tack_optimizer = 'independent'  # 'independent': the best tack angle on each side, 'joint': the best pair of tack angles
+tack_heading_margin = utilsmath.rad(30)  # 'joint' scores a heading by its slowest speed within this margin
+#
+# Replanning (see replanner.py)
+replan_budget = 0  # Agents of the fleet that may replan per step; 0 plans only once, at the start
+replan_wind_shift = utilsmath.rad(10)  # Wind direction change since the last plan that triggers a replan
+replan_wind_speed_change = 2.0  # Wind speed change since the last plan that triggers a replan
+replan_cross_track_error = 20.0  # Cross track error that triggers a replan (None never triggers)
+replan_on_mark_rounded = True  # Replan when a mark was rounded since the last plan
 #
 # Momentum
 speed_momentum = 0.2  # Boat speed can increase/decrease only by this much
+#
+# Interactions between boats (see interactions.py)
+boat_interactions = False  # Wind shadow, collisions and a start grid instead of one start point for all boats
+shadow_length = 10.0  # Distance downwind a boat's wind shadow reaches
+shadow_width = 4.0  # Width of a wind shadow
+shadow_penalty = 0.3  # Share of the wind a boat takes from a boat right behind it, falling off downwind
+collision_distance = 1.0  # Boats closer than this collide and are pushed apart
+collision_speed_factor = 0.5  # Share of its speed a boat keeps after a collision
+start_grid_spacing = 2.0  # Distance between the boats on the start grid
+start_grid_row = None  # Boats per row of the start grid, None fits the rows into the start gate
 
 
 # --------
@@ -69,9 +120,19 @@ wind_speed_sigma = 0.0  # Standard deviation for wind speed.
 wind_direction_sigma = 0.0  # Standard deviation for wind direction.
 wind_change_rate = 300  # Nr of time steps. Wind change will be spread across this many time steps. Integer, >=1
 #
+# Wind field (local wind, see windfield.py)
+wind_field = None  # None: the same wind everywhere. 'puffs': random puffs on top of the wind. Or a saved field's directory.
+wind_field_cell_size = 5.0  # Grid spacing of generated fields
+wind_puffs = 40  # Number of puffs of a generated field
+wind_puff_sigma = 3.0  # Standard deviation of a puff's wind vector
+wind_puff_radius = 15.0  # Radius of a puff
+wind_puff_drift = 0.05  # Distance the puffs drift per step, as a proportion of the wind speed
+#
 # Course
 course_range = 100
 num_landmarks = 5
 num_course_marks = 5
 mark_buffer_distance = 10
+gate_cell_size = 10.0  # Grid cell size of the gate crossing index (see crossings.py)
+gate_ray_length_ratio = 4.0  # Crossing rays are cut off at this multiple of course_range
 smooth_dist = 7.0 # make sure this is less than the mark_buffer_distance
@@ -33,11 +33,18 @@ import environment
 import sailboat_control
 import report
 import plot
+import timing
+import replanner
+import decisions
 import argparse
 
 parser = argparse.ArgumentParser(description='Graph environment test')
 parser.add_argument('--crossings', action='store_true', help='Plot marker crossings')
+parser.add_argument('--timing', action='store_true', help='Print the time spent per phase (see timing.py)')
+parser.add_argument('--timing-output', help='Write the time spent per phase as JSON to this file')
 args = parser.parse_args()
+if args.timing or args.timing_output:
+    timing.enable()
 
 env = environment.environment()
 polar_plot = plot.plot()
@@ -56,15 +63,18 @@ boat_agents = []
 for i in range(sim_config.nr_of_boats):
     boat_agents.append(sailboat_control.sailboat_control(env))
 
+scheduler = replanner.replan_scheduler(sim_config.replan_budget) if sim_config.replan_budget > 0 else None
+decision_phase = decisions.decision_phase(sim_config.decision_workers)
+
 report.start()
 
 i = 0
 while not env.is_finished(i):
-    all_boats_controls = []
+    if scheduler is not None:
+        scheduler.schedule(boat_agents, i)
+    all_boats_controls = decision_phase.run(boat_agents)
     for boat_agent in boat_agents:
-        (boom_angle, rudder_angle) = boat_agent.boat_action()
-        all_boats_controls.append((boom_angle, rudder_angle))
-
+        t = timing.start()
         polar_plot.true_boat(env.boats[boat_agent.boat_id].location)
         polar_plot.boat_belief(boat_agents[boat_agent.boat_id].believed_location)
         #polar_plot.boat_measured(boat_agents[boat_agent.boat_id].measured_location)
@@ -73,14 +83,26 @@ while not env.is_finished(i):
         if i == 0:
             boat_agent.plot_plan(polar_plot)
             pass
+        timing.stop('plot', t, boat_agent.boat_id)
 
+    t = timing.start()
     report.report(env, boat_agents, i)
+    timing.stop('report', t)
 
     # Update Environment and change wind conditions for the next time step
+    t = timing.start()
     env.update(all_boats_controls)
+    timing.stop('update', t)
+    t = timing.start()
     env.change_wind(i)
+    timing.stop('change_wind', t)
     i += 1
 
 report.end()
+decision_phase.close()
+if args.timing:
+    timing.print_summary(per_agent=True)
+if args.timing_output:
+    timing.export(args.timing_output)
 polar_plot.end()
 polar_plot.show()
@@ -0,0 +1,340 @@
+#
+# Tack Solver
+#
+# Provides a tack_solver which finds the optimal tack angle on the port or starboard side of a desired heading.
+# The answer only depends on the side, the desired heading relative to the wind direction and the wind speed,
+# so solutions are cached on those (quantized) with LRU eviction. A cache miss is solved on its own; precompute
+# solves every relative angle for a wind speed in one vectorized pass, after which planning costs only lookups.
+# Both use the same vectorized grid search, so a precomputed solution is the same as a cache miss's.
+#
+# The best tack on each side doesn't make the best pair of tacks: the pair that reaches a point upwind fastest
+# trades some speed towards the point on one tack for a shorter way on the other. joint_tacks finds that pair
+# (see sim_config.tack_optimizer) by scoring a grid of pairs at once with the travel time of the speed model (with
+# a margin for heading errors near the wind, see margin_speed), then refining the best on ever finer grids. The
+# time per unit of distance only depends on the relative angle and the wind speed too, so the pairs are cached and
+# precomputed the same way. Only the angles are optimized: they fix the distance sailed on each tack, and without
+# a cost per tack neither the number of tacks nor where they are placed changes the time.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import collections
+import numpy as np
+import sim_config
+import utilsmath
+import polar
+
+
+class tack_solver:
+
+    # --------
+    # init:
+    #   creates the solver; settings left None are sim_config's as they are when the solver is created
+    #       table: polar_table used to estimate boat speed (defaults to polar.default_table())
+    #       angle_resolution: quantization of the desired heading relative to the wind
+    #       wind_resolution: quantization of the wind speed
+    #       max_size: maximum number of cached solutions; least recently used solutions are evicted first
+    #       heading_margin: of the joint tacks (see margin_speed)
+    #
+    def __init__(self, table=None, angle_resolution=None, wind_resolution=None, max_size=None, heading_margin=None):
+        self.table = table if table is not None else polar.default_table()
+        self.heading_margin = heading_margin if heading_margin is not None else sim_config.tack_heading_margin
+        self.angle_resolution = angle_resolution if angle_resolution is not None else sim_config.tack_angle_resolution
+        self.wind_resolution = wind_resolution if wind_resolution is not None else sim_config.tack_wind_resolution
+        self.max_size = max_size if max_size is not None else sim_config.tack_cache_size
+        self.cache = collections.OrderedDict()
+        self.precomputed = set()
+        self.hits = 0
+        self.misses = 0
+        # while frozen (see freeze), solutions found and wind speeds to precompute wait here for thaw
+        self.frozen = False
+        self.pending = {}
+        self.pending_wind_bins = set()
+
+    # ------------
+    # optimal_tack:
+    #   return the heading on the port (to_port) or starboard side of desired_angle, within pi/2,
+    #   that gives the best speed in the direction of desired_angle
+    #       wind: (speed, direction)
+    #
+    def optimal_tack(self, to_port, desired_angle, wind):
+        wind_bin = int(round(wind[0] / self.wind_resolution))
+        angle_bin = int(round(utilsmath.normalize_angle(desired_angle - wind[1]) / self.angle_resolution))
+        delta = self.__lookup((to_port, angle_bin, wind_bin), lambda: self.solve_one(
+            to_port, angle_bin * self.angle_resolution, wind_bin * self.wind_resolution))
+        return utilsmath.normalize_angle(delta + desired_angle)
+
+    # -----------
+    # joint_tacks:
+    #   return the tack deltas (relative to desired_angle) on the port and the starboard side, within 3*pi/4, that
+    #   together reach a point in the direction of desired_angle fastest, and the time that takes per unit of
+    #   distance. One delta is 0 if sailing straight is fastest.
+    #       wind: (speed, direction)
+    #
+    def joint_tacks(self, desired_angle, wind):
+        wind_bin = int(round(wind[0] / self.wind_resolution))
+        angle_bin = int(round(utilsmath.normalize_angle(desired_angle - wind[1]) / self.angle_resolution))
+        return self.__lookup(('joint', angle_bin, wind_bin), lambda: tuple(
+            float(value[0]) for value in self.solve_joint(angle_bin * self.angle_resolution,
+                                                          wind_bin * self.wind_resolution)))
+
+    # the cached solution of key, solved with solve on a miss
+    def __lookup(self, key, solve):
+        if self.frozen:
+            solution = self.cache.get(key)
+            if solution is None:
+                solution = self.pending.get(key)
+            if solution is None:
+                solution = solve()
+                self.pending[key] = solution
+            return solution
+
+        solution = self.cache.pop(key, None)
+        if solution is None:
+            self.misses += 1
+            solution = solve()
+        else:
+            self.hits += 1
+        self.__insert(key, solution)
+        return solution
+
+    # ----------
+    # precompute:
+    #   solve and cache both sides (or the joint tacks) for every relative angle at this wind speed
+    #
+    def precompute(self, wind_speed, joint=False):
+        wind_bin = int(round(wind_speed / self.wind_resolution))
+        if (joint, wind_bin) in self.precomputed:
+            return
+        if self.frozen:
+            self.pending_wind_bins.add((joint, wind_bin))
+            return
+        self.precomputed.add((joint, wind_bin))
+
+        nr_of_bins = int(ceil(pi / self.angle_resolution))
+        angle_bins = np.arange(-nr_of_bins, nr_of_bins + 1)
+        if joint:
+            solutions = self.solve_joint(angle_bins * self.angle_resolution, wind_bin * self.wind_resolution)
+            for angle_bin, solution in zip(angle_bins, zip(*solutions)):
+                self.__insert(('joint', int(angle_bin), wind_bin), tuple(float(value) for value in solution))
+            return
+        for to_port in (True, False):
+            deltas = self.solve(to_port, angle_bins * self.angle_resolution, wind_bin * self.wind_resolution)
+            for angle_bin, delta in zip(angle_bins, deltas):
+                self.__insert((to_port, int(angle_bin), wind_bin), float(delta))
+
+    # ---------
+    # solve_one:
+    #   find the best tack delta for a single relative angle (see solve)
+    #
+    def solve_one(self, to_port, relative_angle, wind_speed):
+        return float(self.solve(to_port, relative_angle, wind_speed))
+
+    # -----
+    # solve:
+    #   find the best tack delta (relative to the desired heading) for each relative angle in one vectorized pass
+    #       relative_angles: desired heading minus wind direction (scalar or array)
+    #   a grid of nr_of_candidates finds the best delta, then refinements grids of refine candidates around it, each
+    #   spanning two steps of the previous grid, narrow it down (a few calls of the table, which cost about as much
+    #   for one relative angle as for many)
+    #
+    def solve(self, to_port, relative_angles, wind_speed, nr_of_candidates=91, refine=17, refinements=4):
+        relative_angles = np.atleast_1d(np.asarray(relative_angles, dtype=float))[:, np.newaxis]
+        rows = np.arange(len(relative_angles))
+
+        # this is our estimate of speed in the direction of the desired heading, negated (we search for minimum)
+        def directional_speed(delta):
+            return -np.cos(delta) * self.table.speed(delta + relative_angles, wind_speed)
+
+        low, high = (0.0, pi/2.0) if to_port else (-pi/2.0, 0.0)
+        candidates = np.linspace(low, high, nr_of_candidates)[np.newaxis, :]
+        step = (high - low) / (nr_of_candidates - 1)
+        offsets = np.linspace(-step, step, refine)[np.newaxis, :]
+        for i in range(refinements + 1):
+            best = np.broadcast_to(candidates, (len(rows), candidates.shape[1]))[
+                rows, np.argmin(directional_speed(candidates), axis=1)]
+            candidates = np.clip(best[:, np.newaxis] + offsets, low, high)
+            offsets = offsets * 2.0 / (refine - 1)
+
+        return best if best.size > 1 else best[0]
+
+    # -----------
+    # unit_times:
+    #   the time per unit of distance to reach a point in the direction of relative_angles by sailing port_deltas
+    #   and starboard_deltas from it (the three broadcast against each other)
+    #
+    def unit_times(self, relative_angles, wind_speed, port_deltas, starboard_deltas):
+        # time per unit of distance on each tack: huge rather than inf on a tack the boat can't sail, so that not
+        # sailing it (a distance of 0) costs nothing
+        port_pace = 1.0 / np.maximum(self.margin_speed(port_deltas + relative_angles, wind_speed), 1e-9)
+        starboard_pace = 1.0 / np.maximum(self.margin_speed(starboard_deltas + relative_angles, wind_speed), 1e-9)
+        # distances along both tacks that add up to a unit step towards the point
+        # (both deltas 0 sail straight; tacks pi or more apart can't reach it)
+        det = np.sin(port_deltas - starboard_deltas)
+        straight = (port_deltas == 0.0) & (starboard_deltas == 0.0)
+        safe_det = np.where(det > 0.0, det, 1.0)
+        port_distance = np.where(straight, 1.0, -np.sin(starboard_deltas) / safe_det)
+        starboard_distance = np.sin(port_deltas) / safe_det
+        times = port_distance * port_pace + starboard_distance * starboard_pace
+        return np.where((det <= 0.0) & ~straight, np.inf, times)
+
+    # the speed a boat can count on when it keeps within heading_margin of relative_angles: the slower end (the
+    # boat slows down towards the wind; near it a heading error stalls the boat, which the speed alone doesn't show)
+    def margin_speed(self, relative_angles, wind_speed):
+        return np.minimum(self.table.speed(relative_angles - self.heading_margin, wind_speed),
+                          self.table.speed(relative_angles + self.heading_margin, wind_speed))
+
+    # -----------
+    # solve_joint:
+    #   find the joint tacks (see joint_tacks) for each relative angle in one vectorized pass
+    #       relative_angles: desired heading minus wind direction (scalar or array)
+    #       max_delta: largest tack delta on either side
+    #   return arrays of the port deltas, starboard deltas and times per unit of distance
+    #   a grid of nr_of_candidates^2 pairs finds the best, then refinements grids of refine^2 pairs around the best
+    #   one, each spanning two steps of the previous grid, narrow it down
+    #
+    def solve_joint(self, relative_angles, wind_speed, nr_of_candidates=19, refine=13, refinements=2,
+                    max_delta=3.0*pi/4.0):
+        relative_angles = np.atleast_1d(np.asarray(relative_angles, dtype=float))[:, np.newaxis, np.newaxis]
+        rows = np.arange(len(relative_angles))
+        candidates = np.linspace(0.0, max_delta, nr_of_candidates)
+        # the first grid is the same for every relative angle
+        port = candidates[np.newaxis, :, np.newaxis]
+        starboard = -candidates[np.newaxis, np.newaxis, :]
+        step = candidates[1] - candidates[0]
+        offsets = np.linspace(-step, step, refine)
+
+        for i in range(refinements + 1):
+            times = self.unit_times(relative_angles, wind_speed, port, starboard)
+            best = np.argmin(times.reshape(len(rows), -1), axis=1)
+            best = (rows, best // times.shape[2], best % times.shape[2])
+            best_port = np.broadcast_to(port, times.shape)[best]
+            best_starboard = np.broadcast_to(starboard, times.shape)[best]
+            best_time = times[best]
+            port = np.clip(best_port[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis], 0.0, max_delta)
+            starboard = np.clip(best_starboard[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :],
+                                -max_delta, 0.0)
+            offsets = offsets * 2.0 / (refine - 1)
+
+        return best_port, best_starboard, best_time
+
+    # --------------
+    # freeze / thaw:
+    #   while frozen, agents on several threads can use the solver at once (see decisions.py), and what they get
+    #   doesn't depend on the order they ask in: the cache is only read, misses are solved one by one (also for
+    #   wind speeds whose precompute waits for thaw) and nothing is evicted. thaw adds the new solutions and then
+    #   the precomputed wind speeds to the cache in a fixed order.
+    #
+    def freeze(self):
+        self.frozen = True
+
+    def thaw(self):
+        self.frozen = False
+        pending, self.pending = self.pending, {}
+        for key in sorted(pending):
+            self.__insert(key, pending[key])
+        wind_bins, self.pending_wind_bins = self.pending_wind_bins, set()
+        for joint, wind_bin in sorted(wind_bins):
+            self.precompute(wind_bin * self.wind_resolution, joint)
+
+    def __insert(self, key, delta):
+        self.cache[key] = delta
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+
+solver = None
+
+
+# default_solver:
+#   the tack_solver shared by all agents in this process, created on first use
+def default_solver():
+    global solver
+    if solver is None:
+        solver = tack_solver()
+    return solver
+
+
+# if tack_solver.py is run as a script, compare against scipy's bounded minimization and time the cache
+if __name__ == '__main__':
+    import random
+    import time
+    import scipy.optimize
+
+    def scipy_tack(table, to_port, desired_angle, wind):
+        def directional_speed(delta_angle):
+            return -cos(delta_angle) * table.speed(delta_angle + desired_angle - wind[1], wind[0])
+        bounds = (0.0, pi/2.0) if to_port else (-pi/2.0, 0.0)
+        best_angle = scipy.optimize.minimize_scalar(directional_speed, bounds=bounds, method='bounded')
+        return utilsmath.normalize_angle(best_angle.x + desired_angle)
+
+    random.seed(1)
+    table = polar.default_table()
+    cases = [(random.random() < 0.5, utilsmath.random_angle(), (15, utilsmath.random_angle())) for i in range(200)]
+
+    start = time.time()
+    expected = [scipy_tack(table, *case) for case in cases]
+    scipy_time = time.time() - start
+
+    # compare the achieved speed towards desired_angle, not the angles (the optimum can be flat)
+    def max_speed_loss(s):
+        loss = 0.0
+        for (to_port, desired_angle, wind), scipy_angle in zip(cases, expected):
+            angle = s.optimal_tack(to_port, desired_angle, wind)
+            speeds = [cos(a - desired_angle) * table.speed(a - wind[1], wind[0]) for a in (angle, scipy_angle)]
+            loss = max(loss, (speeds[1] - speeds[0]) / wind[0])
+        return loss
+
+    passed = True
+    print "Testing tack_solver against scipy.optimize.minimize_scalar"
+    precomputed = tack_solver(table)
+    precomputed.precompute(15)
+    for name, s in [("cache misses", tack_solver(table)), ("precomputed", precomputed)]:
+        loss = max_speed_loss(s)
+        passed = passed and loss < 1e-4
+        print "  {0}: max relative speed loss {1:.3g}: {2}".format(name, loss, loss < 1e-4)
+    same = sum(precomputed.optimal_tack(*case) == tack_solver(table).optimal_tack(*case) for case in cases)
+    passed = passed and same == len(cases)
+    print "  precomputed tacks same as cache misses: {0} of {1}: {2}".format(same, len(cases), same == len(cases))
+    print
+
+    print "Testing joint_tacks against the best tack on each side"
+    s = tack_solver(table)
+    precomputed = tack_solver(table)
+    precomputed.precompute(15, True)
+    slower = 0
+    same = 0
+    for to_port, desired_angle, wind in cases:
+        # joint_tacks solves the quantized relative angle
+        relative_angle = round(utilsmath.normalize_angle(desired_angle - wind[1]) / s.angle_resolution) * \
+            s.angle_resolution
+        deltas = [utilsmath.normalize_angle(s.optimal_tack(side, desired_angle, wind) - desired_angle)
+                  for side in (True, False)]
+        joint = s.joint_tacks(desired_angle, wind)
+        slower += joint[2] > s.unit_times(relative_angle, wind[0], *deltas) * (1.0 + 1e-6)
+        same += precomputed.joint_tacks(desired_angle, wind) == joint
+    passed = passed and slower == 0 and same == len(cases) and precomputed.misses == 0
+    print "  joint tacks slower than the best on each side: {0}: {1}".format(slower, slower == 0)
+    print "  precomputed joint tacks same as cache misses: {0} of {1}: {2}".format(
+        same, len(cases), same == len(cases) and precomputed.misses == 0)
+    print
+
+    start = time.time()
+    s = tack_solver(table)
+    s.precompute(15)
+    precompute_time = time.time() - start
+    start = time.time()
+    for case in cases:
+        s.optimal_tack(*case)
+    lookup_time = time.time() - start
+    print "Benchmark ({0} tack angles)".format(len(cases))
+    print "  scipy:      {0:.2f} ms".format(scipy_time * 1000)
+    print "  precompute: {0:.2f} ms ({1} solutions)".format(precompute_time * 1000, len(s.cache))
+    print "  lookups:    {0:.2f} ms ({1} hits, {2} misses)".format(lookup_time * 1000, s.hits, s.misses)
+    start = time.time()
+    s = tack_solver(table)
+    s.precompute(15, True)
+    print "  joint precompute: {0:.2f} ms ({1} solutions)".format((time.time() - start) * 1000, len(s.cache))
+    print
+    print "PASSED!" if passed else "FAILED!"
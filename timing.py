@@ -0,0 +1,105 @@
+#
+# Timing
+#
+# Accumulates wall time and call counts per phase of the simulation step (and per agent for the phases that run
+# once per boat) and prints or exports them as a summary table at the end of a run. A phase is timed with
+#
+#   t = timing.start()
+#   ...
+#   timing.stop('boat_action.plan', t, boat_id)
+#
+# Phases named 'parent.child' are parts of phase 'parent'; percentages are of the sum of the top level phases.
+# While timing is disabled start returns None and stop returns right away, so the instrumentation costs two
+# function calls per phase.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import json
+import timeit
+import threading
+import sim_config
+
+clock = timeit.default_timer
+enabled = sim_config.timing
+totals = {}  # (phase, agent) -> [seconds, calls]; agent is None for phases that run once per step
+lock = threading.Lock()  # agents may decide on several threads (see decisions.py)
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    totals.clear()
+
+
+# start:
+#   return the start time of a phase, or None while timing is disabled
+def start():
+    if enabled:
+        return clock()
+    return None
+
+
+# stop:
+#   add the time since t (from start) to phase, for agent if given
+def stop(phase, t, agent=None):
+    if t is None:
+        return
+    elapsed = clock() - t
+    with lock:
+        total = totals.get((phase, agent))
+        if total is None:
+            totals[(phase, agent)] = [elapsed, 1]
+        else:
+            total[0] += elapsed
+            total[1] += 1
+
+
+# summary:
+#   return one row (phase, agent, seconds, calls) per phase and agent, plus a total row (agent 'all') for every
+#   phase timed per agent; slowest phase first, with the parts of a phase right after it
+#
+def summary():
+    phases = {}
+    for (phase, agent), (seconds, calls) in totals.items():
+        rows = phases.setdefault(phase, [])
+        rows.append((phase, agent, seconds, calls))
+
+    table = []
+    for phase, rows in phases.items():
+        rows.sort(key=lambda row: (row[1] is None, row[1]))
+        if len(rows) > 1 or rows[0][1] is not None:
+            rows.insert(0, (phase, 'all', sum(row[2] for row in rows), sum(row[3] for row in rows)))
+        table.append(rows)
+    seconds = dict((phase, rows[0][2]) for phase, rows in phases.items())
+    table.sort(key=lambda rows: (-seconds.get(rows[0][0].split('.')[0], 0.0), rows[0][0].split('.')[0],
+                                 '.' in rows[0][0], -rows[0][2]))
+    return [row for rows in table for row in rows]
+
+
+# print_summary:
+#   print the summary as a table; per agent rows only if per_agent is set
+#
+def print_summary(per_agent=False):
+    rows = summary()
+    total = sum(seconds for phase, agent, seconds, calls in rows if agent in (None, 'all') and '.' not in phase)
+    print ' '
+    print '{0:<22} {1:>6} {2:>10} {3:>8} {4:>10} {5:>6}'.format('phase', 'agent', 'total ms', 'calls', 'us/call', '%')
+    for phase, agent, seconds, calls in rows:
+        if agent not in (None, 'all') and not per_agent:
+            continue
+        share = '{0:6.1f}'.format(100.0 * seconds / total) if total and agent in (None, 'all') else ''
+        print '{0:<22} {1:>6} {2:>10.2f} {3:>8} {4:>10.2f} {5:>6}'.format(
+            phase, '' if agent is None else agent, seconds * 1000, calls, seconds / calls * 1e6, share)
+
+
+# export:
+#   write the summary to a JSON file
+#
+def export(path):
+    with open(path, 'w') as f:
+        json.dump([{'phase': phase, 'agent': agent, 'seconds': seconds, 'calls': calls}
+                   for phase, agent, seconds, calls in summary()], f, indent=2)
@@ -2,7 +2,8 @@
 # Sailboat
 # 
 # Provides a true_sailboat which simulates the real (unknown to the robot)
-# position and heading of the boat
+# position and heading of the boat.
+# The state lives in a row of a fleet (see fleet.py); a true_sailboat is a per-row view of it.
 #
 # Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
 #
@@ -11,8 +12,23 @@ from math import *
 import random
 import utilsmath
 import sim_config
+import fleet as fleet_module
+import polar
 
-class true_sailboat:
+
+# fleet_field:
+#   property that reads/writes this boat's row of a fleet array
+def fleet_field(name):
+    def get(self):
+        return float(getattr(self.fleet, name)[self.index])
+
+    def set(self, value):
+        getattr(self.fleet, name)[self.index] = value
+
+    return property(get, set)
+
+
+class true_sailboat(object):
 
     # --------
     # init: 
@@ -24,35 +40,61 @@ class true_sailboat:
     #       max_speed_ratio: maximum boat speed under ideal conditions, as a proportion of current wind speed
     #       relative_wind_angle: angle of the wind relative to boat's heading
     #       speed: boat's current speed
+    #       fleet: fleet that stores the boat's state. If None, the boat gets a fleet of its own.
+    #              Noise is drawn from the fleet's random number generator.
     #
     def __init__(self, location, initial_mark_state, heading=pi/2.0, max_speed_ratio=0.7,
                                                             boom_control_error=sim_config.boom_control_error,
                                                             boom_measure_error=sim_config.boom_measure_error,
                                                             rudder_control_error=sim_config.rudder_control_error,
-                                                            rudder_measure_error=sim_config.rudder_measure_error):
-        self.location = location
-        self.heading = heading
-        self.boom = 0
-        self.rudder = 0
-        self.max_speed_ratio = max_speed_ratio
-        self.relative_wind_angle = 0
-        self.speed = 0
+                                                            rudder_measure_error=sim_config.rudder_measure_error,
+                                                            fleet=None):
+        if fleet is None:
+            fleet = fleet_module.fleet(1)
+        self.fleet = fleet
+        self.index = fleet.add_boat(location, heading, max_speed_ratio, boom_control_error, rudder_control_error)
         self.boom_measure_error = boom_measure_error
-        self.boom_control_error = boom_control_error
         self.rudder_measure_error = rudder_measure_error
-        self.rudder_control_error = rudder_control_error
         self.mark_state = initial_mark_state
-        self.previous_speed = 0.0
+
+    heading = fleet_field('heading')
+    boom = fleet_field('boom')
+    rudder = fleet_field('rudder')
+    max_speed_ratio = fleet_field('max_speed_ratio')
+    relative_wind_angle = fleet_field('relative_wind_angle')
+    speed = fleet_field('speed')
+    previous_speed = fleet_field('previous_speed')
+    boom_control_error = fleet_field('boom_control_error')
+    rudder_control_error = fleet_field('rudder_control_error')
+
+    # location: (radius, bearing)
+    @property
+    def location(self):
+        return self.fleet.frame.location(self.point)
+
+    @location.setter
+    def location(self, value):
+        self.fleet.point[self.index] = self.fleet.frame.point(value)
+
+    # point: location in the fleet's coordinate frame (see coordinates.py)
+    @property
+    def point(self):
+        first, second = self.fleet.point[self.index]
+        return float(first), float(second)
+
+    @point.setter
+    def point(self, value):
+        self.fleet.point[self.index] = value
 
     # ----------
     # updateControls:
     # update controls based on desired deltas
     def updateControls(self, controls):
         if controls[0] != 0:
-            self.boom = utilsmath.normalize_angle(self.boom + controls[0] + random.gauss(0, self.boom_control_error))
+            self.boom = utilsmath.normalize_angle(self.boom + controls[0] + self.fleet.rng.gauss(0, self.boom_control_error))
 
         if controls[1] != 0:
-            self.rudder = utilsmath.normalize_angle(self.rudder + controls[1] + random.gauss(0, self.rudder_control_error))
+            self.rudder = utilsmath.normalize_angle(self.rudder + controls[1] + self.fleet.rng.gauss(0, self.rudder_control_error))
             self.rudder = min(self.rudder, sim_config.max_rudder)
             self.rudder = max(self.rudder, -sim_config.max_rudder)
 
@@ -62,25 +104,26 @@ class true_sailboat:
     def update(self, env):
         # Boat's speed depends on the angle at which wind is blowing at the boat, wind strength, and boom angle
         # todo: implement considering boom angle
-        self.relative_wind_angle = utilsmath.normalize_angle(self.heading - env.current_wind[1])
-        self.speed = self.calculate_speed(self.relative_wind_angle, env.current_wind[0], self.boom)
+        wind = env.wind_at(self.point)
+        self.relative_wind_angle = utilsmath.normalize_angle(self.heading - wind[1])
+        self.speed = self.calculate_speed(self.relative_wind_angle, wind[0], self.boom)
 
         # Determine velocity direction
         if self.speed <= 0.0:
             # Boat stalled. Rotate it.
             if self.relative_wind_angle < 0.0:
                 # Rotate boat counter-clockwise at the rate proportional to wind strength
-                self.heading = utilsmath.normalize_angle(self.heading + env.current_wind[0]*0.01)
+                self.heading = utilsmath.normalize_angle(self.heading + wind[0]*0.01)
             else:
                 # Rotate boat clockwise at the rate proportional to wind strength
-                self.heading = utilsmath.normalize_angle(self.heading - env.current_wind[0]*0.01)
+                self.heading = utilsmath.normalize_angle(self.heading - wind[0]*0.01)
         else:
             self.adjust_heading()
 
         # Add velocity vector to the boat's location vector to create new location
-        v1 = self.location
-        v2 = (self.speed, self.heading)
-        self.location = (utilsmath.add_vectors_polar(v1, v2))
+        v1 = self.point
+        v2 = self.fleet.frame.vector(self.speed, self.heading)
+        self.point = self.fleet.frame.add(v1, v2)
 
         # We probably don't really need to keep track of the "true" mark state.
         # The simulated version will probably be enough
@@ -100,12 +143,8 @@ class true_sailboat:
         # Boat's maximum possible speed depends on the boat's heading relative to the wind direction.
         # We assume that the boat is fastest when sailing directly down-wind (run), slower if the wind comes from the
         # sides (reach), the boat stalls and even moves backwards (while slowly turning around) if he wind is head-on.
-
-        max_speed = self.max_speed_ratio * wind_strength
-        stall_range = 0.05 * max_speed
-
-        # Using normal distribution function
-        speed = (max_speed + stall_range)*e**(-(wind_angle**2)/2) - stall_range
+        # The speed curve is precomputed in the shared polar table (see polar.py).
+        speed = self.max_speed_ratio * polar.default_table().speed(wind_angle, wind_strength, boom)
 
         # Add momentum. Speed can not decrease or increase more than 20% at the time.
         if self.previous_speed > 1.0:
@@ -123,16 +162,16 @@ class true_sailboat:
     def provide_measurements(self):
 
         # Location
-        location = (self.location[0] * random.gauss(1.0, sim_config.location_radius_error),
-                    utilsmath.normalize_angle(self.location[1] + random.gauss(0.0, sim_config.location_bearing_error)))
+        location = (self.location[0] * self.fleet.rng.gauss(1.0, sim_config.location_radius_error),
+                    utilsmath.normalize_angle(self.location[1] + self.fleet.rng.gauss(0.0, sim_config.location_bearing_error)))
 
         # Heading
-        heading = utilsmath.normalize_angle(self.heading + random.gauss(0.0, sim_config.heading_error))
+        heading = utilsmath.normalize_angle(self.heading + self.fleet.rng.gauss(0.0, sim_config.heading_error))
 
         # Speed
-        speed = self.speed * random.gauss(1.0, sim_config.speed_error)
+        speed = self.speed * self.fleet.rng.gauss(1.0, sim_config.speed_error)
 
         return location, heading, speed
 
     def measure_rudder(self):
-        return utilsmath.normalize_angle(self.rudder + random.gauss(0.0, sim_config.rudder_measure_error))
+        return utilsmath.normalize_angle(self.rudder + self.fleet.rng.gauss(0.0, sim_config.rudder_measure_error))
@@ -0,0 +1,325 @@
+#
+# Controller Tuning
+#
+# Searches the controller and course following settings (the cross track error gains sim_config.cte_ratio, which
+# only the cte controller uses, smooth_dist, mark_buffer_distance and max_rudder) on a grid or adaptively, and
+# scores every candidate over the same seeded headless races in parallel worker processes:
+#
+#   python tuning.py --search grid --points 4 --seeds 16 --cache tuning.jsonl
+#   python tuning.py --search adaptive --rounds 6 --samples 12 --seeds 16 --cache tuning.jsonl
+#   python tuning.py --cte-controller --parameters cte_ratio_p cte_ratio_d --cache tuning.jsonl
+#
+# The score of a race is the mean over its boats of the finish step; a boat that doesn't finish scores twice the
+# steps less the marks it rounded. Lower is better. Every race score is appended to the cache file as soon as it is
+# done, keyed by a hash of the parameters and race settings (including every other sim_config setting that shapes
+# a race) and by the seed, so a search that was interrupted, or is run again with more seeds, points or rounds,
+# only runs the races that aren't in the cache yet. Candidates (the grid, and the adaptive samples drawn from
+# random.Random(search seed)) are the same on every run.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import collections
+import multiprocessing
+import numpy as np
+
+import sim_config
+import utilsmath
+import tack_solver
+import headless
+
+
+# the parameters that can be tuned and the range they are searched in (angles in radians)
+space = collections.OrderedDict([
+    ('cte_ratio_p', (utilsmath.rad(1.0), utilsmath.rad(15.0))),
+    ('cte_ratio_d', (0.0, utilsmath.rad(20.0))),
+    ('cte_ratio_i', (0.0, utilsmath.rad(1.0))),
+    ('smooth_dist', (2.0, 12.0)),
+    ('mark_buffer_distance', (5.0, 20.0)),
+    ('max_rudder', (utilsmath.rad(30.0), utilsmath.rad(85.0))),
+])
+cte_parameters = ['cte_ratio_p', 'cte_ratio_d', 'cte_ratio_i']
+
+
+# current:
+#   the values of all parameters in sim_config
+def current():
+    p, d, i = sim_config.cte_ratio
+    return {'cte_ratio_p': p, 'cte_ratio_d': d, 'cte_ratio_i': i, 'smooth_dist': sim_config.smooth_dist,
+            'mark_buffer_distance': sim_config.mark_buffer_distance, 'max_rudder': sim_config.max_rudder}
+
+
+# apply:
+#   set the parameters in sim_config
+def apply(parameters):
+    sim_config.cte_ratio = (parameters['cte_ratio_p'], parameters['cte_ratio_d'], parameters['cte_ratio_i'])
+    sim_config.smooth_dist = parameters['smooth_dist']
+    sim_config.mark_buffer_distance = parameters['mark_buffer_distance']
+    sim_config.max_rudder = parameters['max_rudder']
+
+
+# candidate:
+#   all parameters: the current ones, replaced by values (rounded, so equal candidates hash equally)
+def candidate(values):
+    parameters = current()
+    parameters.update((name, round(float(value), 9)) for name, value in values.items())
+    return parameters
+
+
+# sim_config settings that don't shape a race (output and threads), and the ones the parameters and the other race
+# settings cover
+unkeyed_settings = set(['print_boat_data', 'print_boat_belief', 'print_env_data', 'print_wind_change',
+                        'plot_crossings', 'timing', 'record_fields', 'record_chunk_size', 'decision_workers', 'nr_of_boats',
+                        'max_nr_of_steps', 'use_igor', 'cte_ratio', 'smooth_dist', 'mark_buffer_distance', 'max_rudder'])
+
+
+# race_config:
+#   the other sim_config settings that shape a race (course, wind, errors, localizer, planner, ...), so that a
+#   search after any of them changed doesn't reuse the scores of the old ones
+def race_config():
+    return dict((name, value) for name, value in vars(sim_config).items()
+                if not name.startswith('_') and name not in unkeyed_settings and not hasattr(math, name) and
+                isinstance(value, (bool, int, long, float, str, tuple, type(None))))
+
+
+def apply_config(config):
+    for name, value in config.items():
+        setattr(sim_config, name, value)
+
+
+# the smoothed corner of a path has to stay within the mark buffer (see sim_config.smooth_dist)
+def valid(parameters):
+    return parameters['smooth_dist'] < parameters['mark_buffer_distance']
+
+
+# race_score:
+#   score of the result of a headless run of steps (lower is better)
+def race_score(result, steps):
+    boats = result['boats']
+    return float(sum(boat['finish_step'] if boat['finish_step'] is not None else 2 * steps - boat['marks_rounded']
+                     for boat in boats)) / len(boats)
+
+
+def init_worker():
+    sim_config.print_boat_data = False
+
+
+# run_one:
+#   run one seeded race with a candidate's parameters and return its cache record; used by the worker processes.
+#   Every race starts with an empty tack solver, so its result doesn't depend on the races the process ran before.
+def run_one(job):
+    key, parameters, settings, seed = job
+    apply_config(settings['config'])
+    sim_config.use_igor = settings['use_igor']
+    apply(parameters)
+    tack_solver.solver = None
+    result = headless.run(settings['steps'], settings['boats'], seed)
+    boats = result['boats']
+    return {'key': key, 'seed': seed, 'parameters': parameters, 'settings': settings,
+            'score': race_score(result, settings['steps']),
+            'finish_rate': float(sum(boat['finish_step'] is not None for boat in boats)) / len(boats),
+            'mean_cross_track_error': float(np.mean([boat['mean_cross_track_error'] for boat in boats]))}
+
+
+class score_cache:
+
+    # --------
+    # init:
+    #   the race scores in the JSON lines file at path (None keeps them in memory only). A line cut short by an
+    #   interrupted search is ignored.
+    #
+    def __init__(self, path=None):
+        self.path = path
+        self.records = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[(record['key'], record['seed'])] = record
+
+    def get(self, key, seed):
+        return self.records.get((key, seed))
+
+    def add(self, record):
+        self.records[(record['key'], record['seed'])] = record
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+# parameter_hash:
+#   the cache key of a candidate's races: a hash of its parameters and the race settings
+def parameter_hash(parameters, settings):
+    return hashlib.sha1(json.dumps({'parameters': parameters, 'settings': settings}, sort_keys=True)).hexdigest()
+
+
+class tuner:
+
+    # --------
+    # init:
+    #   scores candidates over one race per seed, with the other sim_config settings as they are now (see race_config)
+    #       steps, nr_of_boats: of every race (default sim_config.max_nr_of_steps, sim_config.nr_of_boats)
+    #       cache: a score_cache
+    #       processes: number of worker processes (defaults to the number of cores). 1 runs in this process.
+    #
+    def __init__(self, seeds, steps=None, nr_of_boats=None, cache=None, processes=None):
+        self.seeds = list(seeds)
+        self.settings = {'steps': steps if steps is not None else sim_config.max_nr_of_steps,
+                         'boats': nr_of_boats if nr_of_boats is not None else sim_config.nr_of_boats,
+                         'use_igor': sim_config.use_igor, 'config': race_config()}
+        self.cache = cache if cache is not None else score_cache()
+        self.processes = processes
+        self.pool = None  # started on first use
+        self.races = 0  # races run
+        self.cached_races = 0  # races found in the cache
+        self.history = collections.OrderedDict()  # key: (score, parameters) of every candidate evaluated
+
+    # ---------
+    # evaluate:
+    #   return the score of every candidate (a dict of parameters): the mean of its race scores
+    #
+    def evaluate(self, candidates):
+        keys = [parameter_hash(parameters, self.settings) for parameters in candidates]
+        jobs = collections.OrderedDict()
+        for key, parameters in zip(keys, candidates):
+            for seed in self.seeds:
+                if self.cache.get(key, seed) is None:
+                    jobs[(key, seed)] = (key, parameters, self.settings, seed)
+                else:
+                    self.cached_races += 1
+        self.races += len(jobs)
+
+        if self.processes == 1:
+            saved = current(), sim_config.use_igor, race_config()
+            init_worker()
+            try:
+                for job in jobs.values():
+                    self.cache.add(run_one(job))
+            finally:
+                apply(saved[0])
+                sim_config.use_igor = saved[1]
+                apply_config(saved[2])
+        elif jobs:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes, init_worker)
+            # every race is cached as soon as it is done, in whatever order they finish
+            for record in self.pool.imap_unordered(run_one, jobs.values()):
+                self.cache.add(record)
+
+        scores = [float(np.mean([self.cache.get(key, seed)['score'] for seed in self.seeds])) for key in keys]
+        for key, score, parameters in zip(keys, scores, candidates):
+            self.history[key] = (score, parameters)
+        return scores
+
+    # -----
+    # grid:
+    #   evaluate every combination of points values per parameter (evenly spaced over its range) and return the
+    #   best (score, parameters)
+    #
+    def grid(self, names, points):
+        axes = [np.linspace(space[name][0], space[name][1], points) for name in names]
+        candidates = [candidate(dict(zip(names, values))) for values in itertools.product(*axes)]
+        self.evaluate([parameters for parameters in candidates if valid(parameters)])
+        return self.best()
+
+    # ---------
+    # adaptive:
+    #   random search that narrows down on the best candidate: each round evaluates samples candidates drawn
+    #   uniformly from a box around the best one so far, starting with the whole range, then shrinking the box by
+    #   shrink per round. Starts from the current parameters. Return the best (score, parameters).
+    #       seed: of the random number generator that draws the samples
+    #
+    def adaptive(self, names, rounds, samples, seed=0, shrink=0.5):
+        rng = random.Random(seed)
+        self.evaluate([candidate({})])
+        width = 1.0  # of the box, as a fraction of the ranges
+        for i in range(rounds):
+            best = self.best()[1]
+            candidates = []
+            while len(candidates) < samples:
+                values = {}
+                for name in names:
+                    low, high = space[name]
+                    half = 0.5 * width * (high - low)
+                    center = min(max(best[name], low + half), high - half)
+                    values[name] = rng.uniform(center - half, center + half)
+                parameters = candidate(values)
+                if valid(parameters):
+                    candidates.append(parameters)
+            self.evaluate(candidates)
+            width *= shrink
+        return self.best()
+
+    def best(self):
+        return min(self.history.values(), key=lambda entry: entry[0])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def format_parameters(parameters, names):
+    return ', '.join('{0} {1:.4g}'.format(name, parameters[name]) for name in names)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tune the controller parameters over seeded headless races')
+    parser.add_argument('--search', choices=['grid', 'adaptive'], default='adaptive', help='Search strategy')
+    parser.add_argument('--parameters', nargs='+', choices=space.keys(),
+                        help='Parameters to tune (default: all the controller uses)')
+    parser.add_argument('--cte-controller', action='store_true',
+                        help='Tune the cross track error controller (sim_config.use_igor = False)')
+    parser.add_argument('--points', type=int, default=3, help='Grid points per parameter')
+    parser.add_argument('--rounds', type=int, default=5, help='Adaptive search rounds')
+    parser.add_argument('--samples', type=int, default=16, help='Candidates per adaptive search round')
+    parser.add_argument('--search-seed', type=int, default=0, help='Seed of the adaptive samples')
+    parser.add_argument('--seeds', type=int, default=8, help='Races per candidate')
+    parser.add_argument('--first-seed', type=int, default=0, help='Race seeds are first-seed .. first-seed + seeds - 1')
+    parser.add_argument('--steps', type=int, default=1000, help='Maximum number of steps per race')
+    parser.add_argument('--boats', type=int, default=sim_config.nr_of_boats, help='Number of boats per race')
+    parser.add_argument('--processes', type=int, help='Number of worker processes (default: number of cores)')
+    parser.add_argument('--cache', help='JSON lines file of the race scores, extended by every search')
+    parser.add_argument('--top', type=int, default=5, help='Number of best candidates to list')
+    parser.add_argument('--output', help='Write every candidate and its score as JSON to this file')
+    args = parser.parse_args()
+
+    if args.cte_controller:
+        sim_config.use_igor = False
+    names = args.parameters or [name for name in space if sim_config.use_igor is False or name not in cte_parameters]
+
+    start_time = time.time()
+    current_tuner = tuner(range(args.first_seed, args.first_seed + args.seeds), args.steps, args.boats,
+                          score_cache(args.cache), args.processes)
+    try:
+        baseline = current_tuner.evaluate([candidate({})])[0]
+        if args.search == 'grid':
+            current_tuner.grid(names, args.points)
+        else:
+            current_tuner.adaptive(names, args.rounds, args.samples, args.search_seed)
+    finally:
+        current_tuner.close()
+    elapsed = time.time() - start_time
+
+    ranked = sorted(current_tuner.history.values(), key=lambda entry: entry[0])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{'score': score, 'parameters': parameters} for score, parameters in ranked], f, indent=2)
+
+    print 'Evaluated {0} candidates in {1:.2f}s: {2} races run, {3} from the cache'.format(
+        len(current_tuner.history), elapsed, current_tuner.races, current_tuner.cached_races)
+    print '  current: score {0:.2f} ({1})'.format(baseline, format_parameters(candidate({}), names))
+    for score, parameters in ranked[:args.top]:
+        print '  score {0:.2f} ({1})'.format(score, format_parameters(parameters, names))
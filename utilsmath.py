@@ -6,33 +6,52 @@
  
 import random
 from math import *
+import numpy as np
 import matrix
 
 
+# The angle functions wrap once by adding or subtracting 2*pi, which is all angles off by less than a turn need
+# (sums and differences of normalized angles); only angles that are still out of range fall back to modular
+# arithmetic. The *_array versions below do the same on NumPy arrays, so they match the scalar versions bit for bit.
+
 def normalize_angle(angle):
     # maps angle onto [-pi, pi]
-    while (angle < -pi):
+    if angle < -pi:
         angle += 2*pi
-    while (angle > pi):
+        if angle < -pi:
+            angle = fmod(angle + pi, 2*pi) + pi
+    elif angle > pi:
         angle -= 2*pi
+        if angle > pi:
+            angle = fmod(angle - pi, 2*pi) - pi
     return angle
 
 
-def random_angle():
-    return (random.random()-0.5) * 2 * pi
+def random_angle(rng=random):
+    return (rng.random()-0.5) * 2 * pi
 
 def ccw(angle):
-    while (angle < -2*pi):
+    # maps angle onto [-2*pi, 0]
+    if angle < -2*pi:
         angle += 2*pi
-    while angle > 0:
+        if angle < -2*pi:
+            angle = fmod(angle, 2*pi)
+    elif angle > 0:
         angle -= 2*pi
+        if angle > 0:
+            angle = fmod(angle, 2*pi) - 2*pi
     return angle
 
 def cw(angle):
-    while (angle > 2*pi):
+    # maps angle onto [0, 2*pi]
+    if angle > 2*pi:
         angle -= 2*pi
-    while angle < 0:
+        if angle > 2*pi:
+            angle = fmod(angle, 2*pi)
+    elif angle < 0:
         angle += 2*pi
+        if angle < 0:
+            angle = fmod(angle, 2*pi) + 2*pi
     return angle
 
 
@@ -124,12 +143,18 @@ def intersect(l1in, v1in, l2in, v2in):
     if isV2Ray:
         v2[0] = 1
 
-    l1 = polar_to_cartesian(l1)
-    v1 = polar_to_cartesian(v1)
-    l2 = polar_to_cartesian(l2)
-    v2 = polar_to_cartesian(v2)
+    return intersect_cartesian(polar_to_cartesian(l1), polar_to_cartesian(v1), polar_to_cartesian(l2),
+                               polar_to_cartesian(v2), isV1Ray, isV2Ray)
 
 
+# determine intersection of line starting at l1 in direction and length of v1
+#                       with line starting at l2 in direction and length of v2
+# all in cartesian coordinates; isV1Ray/isV2Ray make that line an infinite ray in the direction of v1/v2
+# parallel lines never intersect
+def intersect_cartesian(l1, v1, l2, v2, isV1Ray=False, isV2Ray=False):
+    if abs(v1[0] * v2[1] - v1[1] * v2[0]) < 1e-10:
+        return False
+
     # s1 = l1 + a1 * v1   for 0 <= a1 <= 1
     # s2 = l2 + a2 * v2   for 0 <= a2 <= 1
     #
@@ -150,6 +175,107 @@ def intersect(l1in, v1in, l2in, v2in):
     return True
 
 
+# cross_track_error:
+#   signed distance of location from the line through start and end (all in cartesian coordinates),
+#   positive to the left of the line
+def cross_track_error(location, start, end):
+    segment_vec = [end[0] - start[0], end[1] - start[1]]
+    segment_len = sqrt(segment_vec[0] ** 2 + segment_vec[1] ** 2)
+    if segment_len == 0:
+        return 0.0
+
+    location_vec = [location[0] - start[0], location[1] - start[1]]
+    return (-segment_vec[1] * location_vec[0] + segment_vec[0] * location_vec[1]) / segment_len
+
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Array versions: angles are arrays of any shape, polar vectors and locations are arrays of shape (..., 2)
+# holding (radius, angle) in the last axis. Inputs broadcast against each other.
+
+# wrap angles once by period where they are below low or above high, then fold what is still out of range
+# with fmod (np.fmod keeps the sign of the dividend like math.fmod)
+def __wrap_array(angles, low, high, fold_low, fold_high):
+    angles = np.array(angles, dtype=float)
+    below = angles < low
+    above = angles > high
+    angles[below] += 2*pi
+    angles[above] -= 2*pi
+    below &= angles < low
+    above &= angles > high
+    if below.any():
+        angles[below] = fold_low(angles[below])
+    if above.any():
+        angles[above] = fold_high(angles[above])
+    return angles
+
+
+def normalize_angle_array(angles):
+    return __wrap_array(angles, -pi, pi, lambda a: np.fmod(a + pi, 2*pi) + pi, lambda a: np.fmod(a - pi, 2*pi) - pi)
+
+
+def ccw_array(angles):
+    return __wrap_array(angles, -2*pi, 0.0, lambda a: np.fmod(a, 2*pi), lambda a: np.fmod(a, 2*pi) - 2*pi)
+
+
+def cw_array(angles):
+    return __wrap_array(angles, 0.0, 2*pi, lambda a: np.fmod(a, 2*pi) + 2*pi, lambda a: np.fmod(a, 2*pi))
+
+
+def polar_to_cartesian_array(p):
+    p = np.asarray(p, dtype=float)
+    return np.stack((p[..., 0]*np.cos(p[..., 1]), p[..., 0]*np.sin(p[..., 1])), axis=-1)
+
+
+def cartesian_to_polar_array(c):
+    c = np.asarray(c, dtype=float)
+    return np.stack((np.hypot(c[..., 0], c[..., 1]), np.arctan2(c[..., 1], c[..., 0])), axis=-1)
+
+
+def add_vectors_polar_array(v1, v2):
+    return cartesian_to_polar_array(polar_to_cartesian_array(v1) + polar_to_cartesian_array(v2))
+
+
+def sub_vectors_polar_array(v1, v2):
+    v2 = np.array(v2, dtype=float)
+    v2[..., 0] = -v2[..., 0]
+    return add_vectors_polar_array(v1, v2)
+
+
+def distance_polar_array(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return np.sqrt(a[..., 0]**2 + b[..., 0]**2 - 2*a[..., 0]*b[..., 0]*np.cos(a[..., 1] - b[..., 1]))
+
+
+# intersect_array:
+#   intersect for arrays of lines (polar, a 0 radius is an infinite ray), returning a boolean array
+#   unlike intersect, parallel lines are never reported as intersecting, even when they are coincident
+def intersect_array(l1, v1, l2, v2):
+    l1, v1, l2, v2 = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (l1, v1, l2, v2)])
+    parallel = (np.abs(v1[..., 1] - v2[..., 1]) < 1e-40) | \
+               (np.abs(normalize_angle_array(v1[..., 1] - v2[..., 1] - pi)) < 1e-40)
+
+    isV1Ray = v1[..., 0] == 0
+    isV2Ray = v2[..., 0] == 0
+    v1 = np.stack((np.where(isV1Ray, 1.0, v1[..., 0]), v1[..., 1]), axis=-1)
+    v2 = np.stack((np.where(isV2Ray, 1.0, v2[..., 0]), v2[..., 1]), axis=-1)
+    c1 = polar_to_cartesian_array(l1)
+    d1 = polar_to_cartesian_array(v1)
+    c2 = polar_to_cartesian_array(l2)
+    d2 = polar_to_cartesian_array(v2)
+
+    # as intersect_cartesian and solve2dLinear, for all lines at once
+    a, b, c, d = d1[..., 0], -d2[..., 0], d1[..., 1], -d2[..., 1]
+    e = c2[..., 0] - c1[..., 0]
+    f = c2[..., 1] - c1[..., 1]
+    det = a * d - b * c
+    degenerate = parallel | (np.abs(d1[..., 0] * d2[..., 1] - d1[..., 1] * d2[..., 0]) < 1e-10)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a1 = (d*e-b*f) / det
+        a2 = (-c*e+a*f) / det
+    return ~degenerate & (a1 >= 0) & (a2 >= 0) & (isV1Ray | (a1 <= 1)) & (isV2Ray | (a2 <= 1))
+
 
 # if utilsmath.py is run as a script, run some tests
 if __name__== '__main__':
@@ -201,6 +327,39 @@ if __name__== '__main__':
     tests.append(test)
     print
 
+    test = ["Testing array versions against the scalar versions (bit for bit)", 0, 0]
+    print test[0]
+    rng = random.Random(1)
+    angles = [rad(-270), rad(270), rad(360), pi, -pi, 0.0, 2*pi, -2*pi] + \
+             [rng.uniform(-20*pi, 20*pi) for i in range(1000)]
+    vectors1 = [(rng.uniform(0, 100), random_angle(rng)) for i in range(1000)] + [l1 for l1, l2, r in distance_tests]
+    vectors2 = [(rng.uniform(0, 100), random_angle(rng)) for i in range(1000)] + [l2 for l1, l2, r in distance_tests]
+    samples = [sample[:4] for sample in testSamples] + \
+              [[(rng.uniform(0, 10), random_angle(rng)) for j in range(4)] for i in range(1000)]
+    for name, scalar, array, inputs in [
+            ('normalize_angle', normalize_angle, normalize_angle_array, (angles,)),
+            ('ccw', ccw, ccw_array, (angles,)),
+            ('cw', cw, cw_array, (angles,)),
+            ('add_vectors_polar', add_vectors_polar, add_vectors_polar_array, (vectors1, vectors2)),
+            ('sub_vectors_polar', sub_vectors_polar, sub_vectors_polar_array, (vectors1, vectors2)),
+            ('distance_polar', distance_polar, distance_polar_array, (vectors1, vectors2)),
+            ('intersect', intersect, intersect_array, zip(*samples))]:
+        test[1] += 1
+        expected = np.array([scalar(*args) for args in zip(*inputs)])
+        actual = array(*[np.array(x, dtype=float) for x in inputs])
+        passed = np.array_equal(actual, expected)
+        if passed:
+            test[2] += 1
+        print "  {0}: {1}".format(name, passed)
+    test[1] += 1
+    passed = all(-pi <= a <= pi for a in normalize_angle_array(angles)) and \
+             all(-2*pi <= a <= 0 for a in ccw_array(angles)) and all(0 <= a <= 2*pi for a in cw_array(angles))
+    if passed:
+        test[2] += 1
+    print "  results in range: {0}".format(passed)
+    tests.append(test)
+    print
+
     testSuccesses = 0
     for test in tests:
         if test[1] == test[2]:
@@ -0,0 +1,252 @@
+#
+# Wind Field
+#
+# Provides a wind_field: wind vectors (u, v) on a regular grid over the course area, sampled with bilinear
+# interpolation at any number of points in one vectorized lookup. A field is either
+#   - relative: a pattern of puffs and shifts added to the environment's current wind. The pattern drifts
+#     downwind with the current wind and repeats beyond the grid, so evolving it costs nothing per step.
+#   - absolute: the wind itself, in one or more frames (e.g. precomputed or measured), advanced every
+#     steps_per_frame steps. Outside the grid the wind of the nearest edge applies.
+# Fields are saved as a directory with the grid (wind.npy) and its geometry (field.json); load memory-maps the
+# grid, so large fields with many frames are only read where they are sampled.
+#
+# Authors: Jonathan Hudgins <jhudgins8@gatech.edu>, Igor Negovetic <igorilla@gmail.com>
+#
+
+from math import *
+import os
+import json
+import numpy as np
+import sim_config
+
+
+class wind_field:
+
+    # --------
+    # init:
+    #   creates the field
+    #       grid: wind vectors with shape (frames, 2, ny, nx) or (2, ny, nx); grid[f, 0] is the x (east) component
+    #             and grid[f, 1] the y (north) component at origin + (j, i) * cell_size for i < ny, j < nx
+    #       origin: cartesian coordinates of grid point (0, 0)
+    #       cell_size: distance between grid points
+    #       relative: add the field to the current wind and let it drift with it (see above)
+    #       steps_per_frame: steps each frame of an absolute field lasts
+    #
+    def __init__(self, grid, origin, cell_size, relative=False, steps_per_frame=1):
+        if grid.ndim == 3:
+            grid = grid[np.newaxis]
+        self.grid = grid
+        self.origin = np.asarray(origin, dtype=float)
+        self.cell_size = float(cell_size)
+        self.relative = relative
+        self.steps_per_frame = steps_per_frame
+        self.frame = 0
+        self.base = np.zeros(2)  # current wind vector, added to a relative field
+        self.offset = np.zeros(2)  # distance a relative field has drifted
+
+    # -------
+    # puffs:
+    #   a relative field of nr_of_puffs gaussian puffs (and lulls) with random strength and direction
+    #       rng: random number generator (e.g. environment.rng)
+    #       extent: the field covers [-extent, extent] in x and y and repeats beyond
+    #       sigma: standard deviation of the puffs' wind vectors
+    #       radius: puff radius (standard deviation of the gaussian)
+    #
+    @classmethod
+    def puffs(cls, rng, extent=2 * sim_config.course_range, cell_size=sim_config.wind_field_cell_size,
+              nr_of_puffs=sim_config.wind_puffs, sigma=sim_config.wind_puff_sigma,
+              radius=sim_config.wind_puff_radius):
+        n = int(ceil(2 * extent / cell_size))
+        size = n * cell_size
+        coords = -extent + np.arange(n) * cell_size
+        x, y = np.meshgrid(coords, coords)
+        grid = np.zeros((2, n, n))
+        for k in range(nr_of_puffs):
+            center = (rng.uniform(-extent, extent), rng.uniform(-extent, extent))
+            wind = (rng.gauss(0, sigma), rng.gauss(0, sigma))
+            # distance to the nearest copy of the center, so the pattern repeats without seams
+            dx = np.mod(x - center[0] + size / 2, size) - size / 2
+            dy = np.mod(y - center[1] + size / 2, size) - size / 2
+            weight = np.exp(-(dx**2 + dy**2) / (2 * radius**2))
+            grid[0] += wind[0] * weight
+            grid[1] += wind[1] * weight
+        return cls(grid, (-extent, -extent), cell_size, relative=True)
+
+    # -------
+    # uniform:
+    #   an absolute field with the same wind (speed, direction) everywhere
+    #
+    @classmethod
+    def uniform(cls, wind, extent=2 * sim_config.course_range, cell_size=sim_config.wind_field_cell_size):
+        n = int(ceil(2 * extent / cell_size))
+        grid = np.empty((2, n, n))
+        grid[0] = wind[0] * cos(wind[1])
+        grid[1] = wind[0] * sin(wind[1])
+        return cls(grid, (-extent, -extent), cell_size)
+
+    # -----
+    # load:
+    #   load a field saved with save; the grid is memory-mapped unless mmap is False
+    #
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, 'field.json')) as f:
+            geometry = json.load(f)
+        grid = np.load(os.path.join(path, 'wind.npy'), mmap_mode='r' if mmap else None)
+        return cls(grid, geometry['origin'], geometry['cell_size'], geometry['relative'], geometry['steps_per_frame'])
+
+    # -----
+    # copy:
+    #   a field over the same grid (shared, not copied) in its initial state, i.e. before the first update
+    #
+    def copy(self):
+        return wind_field(self.grid, self.origin, self.cell_size, self.relative, self.steps_per_frame)
+
+    def save(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'wind.npy'), self.grid)
+        with open(os.path.join(path, 'field.json'), 'w') as f:
+            json.dump({'origin': list(self.origin), 'cell_size': self.cell_size, 'relative': self.relative,
+                       'steps_per_frame': self.steps_per_frame}, f, indent=2)
+
+    # -------
+    # update:
+    #   evolve the field to step i with the environment's current wind (speed, direction)
+    #
+    def update(self, i, current_wind):
+        self.base = np.array([current_wind[0] * cos(current_wind[1]), current_wind[0] * sin(current_wind[1])])
+        if self.relative:
+            self.offset += self.base * sim_config.wind_puff_drift
+        else:
+            self.frame = min(i // self.steps_per_frame, len(self.grid) - 1)
+
+    # -------
+    # sample:
+    #   wind at cartesian points c (n,2)
+    #   return (speeds, directions), arrays of n
+    #
+    def sample(self, c):
+        c = np.asarray(c, dtype=float).reshape(-1, 2)
+        grid = self.grid[self.frame]
+        ny, nx = grid.shape[1:]
+        g = (c - self.offset - self.origin) / self.cell_size
+        i0 = np.floor(g).astype(int)
+        t = g - i0
+        if self.relative:
+            x0 = np.mod(i0[:, 0], nx)
+            y0 = np.mod(i0[:, 1], ny)
+            x1 = np.mod(x0 + 1, nx)
+            y1 = np.mod(y0 + 1, ny)
+        else:
+            t = np.where((i0 < 0) | (i0 >= (nx - 1, ny - 1)), 0.0, t)
+            x0 = np.clip(i0[:, 0], 0, nx - 1)
+            y0 = np.clip(i0[:, 1], 0, ny - 1)
+            x1 = np.minimum(x0 + 1, nx - 1)
+            y1 = np.minimum(y0 + 1, ny - 1)
+
+        tx = t[:, 0, np.newaxis]
+        ty = t[:, 1, np.newaxis]
+        low = grid[:, y0, x0].T + tx * (grid[:, y0, x1].T - grid[:, y0, x0].T)
+        high = grid[:, y1, x0].T + tx * (grid[:, y1, x1].T - grid[:, y1, x0].T)
+        wind = low + ty * (high - low)
+        if self.relative:
+            wind += self.base
+        return np.hypot(wind[:, 0], wind[:, 1]), np.arctan2(wind[:, 1], wind[:, 0])
+
+    # ---------
+    # sample_one:
+    #   wind (speed, direction) at one cartesian point; the same interpolation as sample without the array overhead
+    #
+    def sample_one(self, c):
+        grid = self.grid[self.frame]
+        ny, nx = grid.shape[1:]
+        gx = (c[0] - self.offset[0] - self.origin[0]) / self.cell_size
+        gy = (c[1] - self.offset[1] - self.origin[1]) / self.cell_size
+        x0 = int(floor(gx))
+        y0 = int(floor(gy))
+        tx = gx - x0
+        ty = gy - y0
+        if self.relative:
+            x0 %= nx
+            y0 %= ny
+            x1 = (x0 + 1) % nx
+            y1 = (y0 + 1) % ny
+        else:
+            if x0 < 0 or x0 >= nx - 1:
+                tx = 0.0
+            if y0 < 0 or y0 >= ny - 1:
+                ty = 0.0
+            x0 = min(max(x0, 0), nx - 1)
+            y0 = min(max(y0, 0), ny - 1)
+            x1 = min(x0 + 1, nx - 1)
+            y1 = min(y0 + 1, ny - 1)
+
+        wind = []
+        for component in (grid[0], grid[1]):
+            low = component[y0, x0] + tx * (component[y0, x1] - component[y0, x0])
+            high = component[y1, x0] + tx * (component[y1, x1] - component[y1, x0])
+            wind.append(float(low + ty * (high - low)))
+        if self.relative:
+            wind[0] += self.base[0]
+            wind[1] += self.base[1]
+        return hypot(wind[0], wind[1]), atan2(wind[1], wind[0])
+
+
+# if windfield.py is run as a script, test the interpolation and a save/load round trip and time the sampling
+if __name__ == '__main__':
+    import random
+    import shutil
+    import tempfile
+    import timeit
+    import utilsmath
+
+    print "Testing uniform field"
+    wind = (12.0, utilsmath.rad(30))
+    field = wind_field.uniform(wind)
+    rng = random.Random(1)
+    points = np.array([(rng.uniform(-300, 300), rng.uniform(-300, 300)) for i in range(1000)])
+    speeds, directions = field.sample(points)
+    uniform_passed = np.allclose(speeds, wind[0]) and np.allclose(directions, wind[1])
+    print "  same wind everywhere (also outside the grid): {0}".format(uniform_passed)
+
+    print "Testing bilinear interpolation"
+    grid = np.zeros((2, 2, 2))
+    grid[0] = [[1.0, 3.0], [5.0, 7.0]]  # x component grows with x (by 2) and y (by 4)
+    field = wind_field(grid, (0.0, 0.0), 10.0)
+    speeds, directions = field.sample([(5.0, 5.0), (2.5, 7.5), (0.0, 0.0), (10.0, 10.0)])
+    interpolation_passed = np.allclose(speeds, [4.0, 4.5, 1.0, 7.0])
+    print "  {0}: {1}".format(list(speeds), interpolation_passed)
+
+    print "Testing relative field drift and save/load"
+    field = wind_field.puffs(random.Random(2))
+    field.update(0, wind)
+    before = field.sample(points)
+    path = tempfile.mkdtemp()
+    field.save(path)
+    loaded = wind_field.load(path)
+    loaded.update(0, wind)
+    loaded_passed = np.allclose(loaded.sample(points), before)
+    shutil.rmtree(path)
+    # the puffs drift downwind: after k steps the wind at p + drift is the wind that was at p
+    steps = 7
+    for i in range(steps):
+        field.update(i + 1, wind)
+    drift = steps * sim_config.wind_puff_drift * np.array([wind[0] * cos(wind[1]), wind[0] * sin(wind[1])])
+    drift_passed = np.allclose(field.sample(points + drift), before)
+    print "  loaded field samples the same: {0}, pattern drifts downwind: {1}".format(loaded_passed, drift_passed)
+    speeds, directions = field.sample(points)
+    one_passed = np.allclose([field.sample_one(point) for point in points], np.column_stack((speeds, directions)))
+    print "  sample_one samples the same: {0}".format(one_passed)
+    passed = uniform_passed and interpolation_passed and loaded_passed and drift_passed and one_passed
+    print
+
+    print "Benchmark (sampling)"
+    for n in [1, 100, 10000]:
+        sample_points = points[np.arange(n) % len(points)]
+        seconds = min(timeit.repeat(lambda: field.sample(sample_points), number=100, repeat=3)) / 100
+        print "  {0:6} points: {1:.3f} ms".format(n, seconds * 1000)
+    seconds = min(timeit.repeat(lambda: field.sample_one(points[0]), number=1000, repeat=3)) / 1000
+    print "  sample_one:    {0:.3f} ms".format(seconds * 1000)
+    print
+    print "PASSED!" if passed else "FAILED!"